@@ -1,12 +1,25 @@
 import asyncio
+import re
+import types
+import typing
 from pprint import pprint
 
-from aio_pyorient.message import db, server, command
-from aio_pyorient.message.base import int_packer
+from aio_pyorient.message import db, server, command, record
+from aio_pyorient.message.base import ODBRequestError, int_packer
+from aio_pyorient.message.constants import (
+    BINARY_SERIALIZER, LIVE_OPERATIONS, PUSH_DISTRIB_CONFIG, PUSH_LIVE_QUERY,
+    PUSH_SCHEMA, PUSH_STORAGE_CONFIG, QUERY_ASYNC, QUERY_CMD, QUERY_LIVE,
+    QUERY_SYNC, RECORD_CREATED, RECORD_DELETED, RECORD_UPDATED
+)
+from aio_pyorient.message.decoder import ODBDecoder
 from aio_pyorient.schema.prop_types import TYPE_MAP, var_int
-from aio_pyorient.odb_types import ODBClusters
+from aio_pyorient.odb_types import (
+    ODBClusters, ODBLiveEvent, ODBQueryPage, ODBRecord, ODBRecordCache,
+    ODBRecordVersion, ODBSchema, ODBTxResult
+)
+from aio_pyorient.router import ODBNode, ODBRouter
 from aio_pyorient.sock import ODBSocket
-from aio_pyorient.utils import AsyncCtx
+from aio_pyorient.utils import AsyncCtx, ODBStream
 
 
 try:
@@ -16,11 +29,381 @@ except ImportError:
     pass
 
 
+class ODBLiveQuery:
+    """
+    ODBLiveQuery
+    One live query subscription, an async iterator
+    of the ODBLiveEvents pushed for it.
+
+    Usage:
+        live = await client.live_query('LIVE SELECT FROM V')
+        async for event in live:
+            # event.operation is 'create', 'update' or 'delete'
+            print(event.operation, event.record)
+
+        await live.unsubscribe()  # ends the iteration
+
+    Events are queued until they are consumed.
+    """
+    def __init__(self, client, query: str, token: int):
+        self.client = client
+        self.query = query
+        self.token = token
+        self._events = ODBStream(loop=client._loop)
+
+    @property
+    def closed(self):
+        return self._events.closed
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._events.__anext__()
+
+    async def unsubscribe(self):
+        if self.closed:
+            return
+        self._close()
+        await self.client.execute(f'LIVE UNSUBSCRIBE {self.token}')
+
+    def _close(self, exception: BaseException=None):
+        if self.client._live.get(self.token) is self:
+            del self.client._live[self.token]
+        self._events.close(exception)
+
+    def __repr__(self):
+        return f'<ODBLiveQuery {self.token} {self.query!r}>'
+
+
+class ODBTransaction:
+    """
+    ODBTransaction
+    Buffers record creates, updates and deletes and commits them
+    all in one TX_COMMIT round trip.
+
+    Usage:
+        async with client.transaction() as tx:
+            rid = tx.create(cluster_id, b'V@name:"a"')  # temporary, e.g. #9:-2
+            tx.update('#9:1', b'V@name:"b"', version=3)
+            tx.delete('#9:2', version=1)
+        tx.result.created[rid], tx.result.versions
+
+    The block commits on exit, unless it is left by an exception:
+    then the buffered operations are dropped, nothing was sent.
+    Updating or deleting a record created in the same transaction
+    changes or drops its create.
+    A commit the server rejects raises ODBRequestError.
+    """
+    def __init__(self, client, tx_id: int):
+        self.client = client
+        self.tx_id = tx_id
+        self.result = None
+        # rid -> (operation, cluster id, position, record type, content, version)
+        self._entries = {}
+        self._next_position = -2
+
+    def __len__(self):
+        return len(self._entries)
+
+    def create(self, cluster_id: int, content: bytes, *, record_type: str='d')->str:
+        """buffer a create, returns the record's temporary rid"""
+        position, self._next_position = self._next_position, self._next_position - 1
+        rid = f'#{cluster_id}:{position}'
+        self._entries[rid] = (
+            RECORD_CREATED, cluster_id, position, record_type, content, 0
+        )
+        return rid
+
+    def update(self, rid: str, content: bytes, version: int, *, record_type: str='d'):
+        entry = self._entries.get(rid)
+        if entry is not None and entry[0] == RECORD_CREATED:
+            self._entries[rid] = entry[:4] + (content, 0)
+            return
+        cluster_id, position = _split_rid(rid)
+        self._entries[rid] = (
+            RECORD_UPDATED, cluster_id, position, record_type, content, version
+        )
+
+    def delete(self, rid: str, version: int, *, record_type: str='d'):
+        entry = self._entries.get(rid)
+        if entry is not None and entry[0] == RECORD_CREATED:
+            del self._entries[rid]
+            return
+        cluster_id, position = _split_rid(rid)
+        self._entries[rid] = (
+            RECORD_DELETED, cluster_id, position, record_type, b'', version
+        )
+
+    def rollback(self):
+        self._entries.clear()
+
+    def _update_cache(self, cache: ODBRecordCache, result: ODBTxResult):
+        # cached records get the committed content with its new version
+        client = self.client
+        for rid, (operation, _, _, record_type, content, _) in self._entries.items():
+            if operation == RECORD_CREATED:
+                continue
+            version = result.versions.get(rid)
+            if operation == RECORD_DELETED or version is None:
+                cache.invalidate(rid)
+                continue
+            cache.refresh(ODBRecord(
+                record_type, rid, version, bytes(content),
+                binary=client._serialization_type == BINARY_SERIALIZER,
+                global_properties=client.schema.global_properties
+            ))
+
+    async def commit(self)->ODBTxResult:
+        if not self._entries:
+            self.result = ODBTxResult({}, {})
+            return self.result
+        handler = await record.TxCommit(
+            self.client, self.tx_id, self._entries.values()
+        ).send()
+        result = await handler.read()
+        if not isinstance(result, ODBTxResult):
+            raise ODBRequestError(result)
+        cache = self.client.cache
+        if cache is not None:
+            self._update_cache(cache, result)
+        self._entries.clear()
+        self.result = result
+        return result
+
+    async def __aenter__(self):
+        self.client._sock._in_transaction = True
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                await self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.client._sock._in_transaction = False
+
+
+class ODBCursor:
+    """
+    ODBCursor
+    The pages of a query run with a server side cursor
+    (QUERY / QUERY_NEXT_PAGE), as an async iterator of lists of results.
+
+    Usage:
+        async with client.cursor('select from V', page_size=1000) as cursor:
+            async for page in cursor:
+                for record in page:
+                    ...
+
+    The next page is requested as soon as a page is handed out, so it
+    is on its way while the current one is processed.
+    close() (or aclose(), or leaving the block) before the last page
+    releases the cursor on the server, a cursor dropped before that is
+    released once it is garbage collected. stats are the query stats
+    of the last page. A page the server rejects raises ODBRequestError.
+    """
+    def __init__(self, client, query: str, page_size: int, kwargs: dict):
+        self.client = client
+        self.query = query
+        self.page_size = page_size
+        self.query_id = None
+        self.stats = {}
+        self._kwargs = kwargs
+        self._next = None
+        self._has_next = True
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    async def _fetch(self, handler):
+        await handler.send()
+        return await handler.read()
+
+    def _prefetch(self):
+        if self.query_id is None:
+            handler = command.ServerQuery(
+                self.client, self.query, page_size=self.page_size, **self._kwargs
+            )
+        else:
+            handler = command.NextPage(self.client, self.query_id, self.page_size)
+        self._next = asyncio.ensure_future(self._fetch(handler))
+
+    def _take(self, page)->list:
+        if not isinstance(page, ODBQueryPage):
+            self._has_next = False
+            self._closed = True
+            raise ODBRequestError(page)
+        self.query_id = page.query_id
+        self.stats = page.stats
+        self._has_next = page.has_next
+        return page.results
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self)->list:
+        while not self._closed:
+            if self._next is None:
+                if not self._has_next:
+                    break
+                self._prefetch()
+            next_page, self._next = self._next, None
+            results = self._take(await next_page)
+            if self._has_next:
+                self._prefetch()
+            if results or self._has_next:
+                return results
+        self._closed = True
+        raise StopAsyncIteration
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        next_page, self._next = self._next, None
+        await _release_cursor(self.client, next_page, self.query_id, self._has_next)
+
+    aclose = close
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def __del__(self):
+        if self._closed or self._next is None and \
+                (not self._has_next or self.query_id is None):
+            return
+        self._closed = True
+        try:
+            self.client._loop.create_task(_release_cursor(
+                self.client, self._next, self.query_id, self._has_next
+            ))
+        except RuntimeError:
+            # the loop is closed, and the connection with it
+            pass
+
+    def __repr__(self):
+        return f'<ODBCursor {self.query_id} {self.query!r}>'
+
+
+async def _release_cursor(client, next_page, query_id: str, has_next: bool):
+    """
+    Close the server side cursor query_id if it has more pages,
+    once next_page (the page on its way, if any) tells if it still has.
+    """
+    if next_page is not None:
+        try:
+            page = await next_page
+        except Exception:
+            return
+        if not isinstance(page, ODBQueryPage):
+            return
+        query_id, has_next = page.query_id, page.has_next
+    if has_next and query_id is not None:
+        handler = command.CloseQuery(client, query_id)
+        await handler.send()
+        await handler.read()
+
+
+def _split_rid(rid: str)->tuple:
+    cluster_id, position = rid.lstrip('#').split(':')
+    return int(cluster_id), int(position)
+
+
+# statements changing no record that exists already
+READ_STATEMENTS = frozenset((
+    'select', 'traverse', 'match', 'explain', 'profile', 'live'
+))
+write_target_match = re.compile(
+    r'\s*(?:update|delete\s+from)\s+(?!edge\b)'
+    r'(\[[^\]]*\]|#-?\d+:-?\d+|cluster:[\w-]+|[\w-]+)', re.I
+).match
+rid_findall = re.compile(r'#-?\d+:-?\d+').findall
+
+
+def invalidate_writes(client, query: str):
+    """
+    Drop the cached records the command query may change: the target
+    of UPDATE or DELETE FROM (rids, a cluster or a class with its
+    subclasses). Everything else writing (edges, scripts, ...) may
+    change any record and clears the cache. Reads, live subscriptions,
+    inserts and creates of vertices or schema elements change none.
+    """
+    cache = client.cache
+    keyword, second = (query.lower().split(None, 2) + ['', ''])[:2]
+    if keyword in READ_STATEMENTS or keyword == 'insert' \
+            or (keyword == 'create' and second != 'edge'):
+        return
+    match = write_target_match(query)
+    if match is None:
+        cache.clear()
+        return
+    target = match.group(1)
+    try:
+        if target[0] in '[#':
+            for rid in rid_findall(target):
+                cache.invalidate(rid)
+            return
+        if target.lower().startswith('cluster:'):
+            name = target[8:]
+            cluster_ids = [int(name)] if name.isdigit() else client.clusters.get(name)
+        else:
+            cluster_ids = client.schema.clusters_of(target)
+    except (KeyError, ValueError):
+        cache.clear()
+        return
+    cache.invalidate_clusters(cluster_ids)
+
+
+def parse_live_event(content: bytes, *, binary: bool=False,
+                     global_properties: dict=None)->ODBLiveEvent:
+    """
+    The content of a live query push: 'r', operation, token, then the
+    record as record type, version, rid and content, or 'u' and the
+    token of a subscription the server ended.
+    """
+    decoder = ODBDecoder()
+    decoder.feed(content)
+    if decoder.read_char() == 'u':
+        return ODBLiveEvent('unsubscribe', decoder.read_int(), None)
+    operation = LIVE_OPERATIONS.get(decoder.read_byte())
+    token = decoder.read_int()
+    record_type = decoder.read_char()
+    version = decoder.read_int()
+    record = ODBRecord(
+        record_type, decoder.read_rid(), version, decoder.read_view(),
+        binary=binary, global_properties=global_properties
+    )
+    return ODBLiveEvent(operation, token, record)
+
+
 class ODBClient(AsyncCtx):
     """
     ODBClient
     Use this to talk to your OrientDB server.
 
+    Pass multiplex=True to pipeline the requests of concurrent
+    coroutines over the client's single connection.
+    Clients of the same database may share one ODBSchema cache
+    (see ODBPool), by default every client has its own.
+    With an ODBRecordCache, load() answers from it and execute()
+    returns the cached instances of records it already holds
+    (refreshing them on newer versions).
+    Server pushes keep cluster_conf, clusters and the schema cache up to
+    date, subscribe to on_push to receive them as well.
+    live_query() subscriptions share the client's connection,
+    their events are routed by token.
+    Given a list of servers (or an ODBRouter shared with other clients)
+    instead of host and port, the client connects to the node the
+    router picks (or to node), the members of the cluster_conf it
+    receives become the router's nodes.
+
     """
     def __init__(self,
                  client_id: str='',
@@ -33,22 +416,46 @@ class ODBClient(AsyncCtx):
                  protocol: int=None,
                  serialization_type="ORecordDocument2csv",
                  host: str = 'localhost',
-                 port: int = 2424, **kwargs):
+                 port: int = 2424,
+                 multiplex: bool = False,
+                 schema: ODBSchema = None,
+                 cache: ODBRecordCache = None,
+                 servers: typing.Iterable = None,
+                 router: ODBRouter = None,
+                 node: ODBNode = None, **kwargs):
         super().__init__(**kwargs)
-        self._sock = ODBSocket(host=host, port=port)
+        if router is None and servers:
+            router = ODBRouter(servers)
+        self._router = router
+        self._sock = ODBSocket(
+            host=host, port=port, multiplex=multiplex,
+            node=node if node is not None or router is None else router.pick()
+        )
         self._id = client_id
         self._session_id = session_id
         self._auth_token = auth_token
         self._db_name = db_name
+        if schema is None:
+            schema = ODBSchema(self, loop=self._loop)
+        self._schema = schema
         if clusters is None or not isinstance(clusters, ODBClusters):
-            clusters = ODBClusters()
+            clusters = ODBClusters(clusters or ())
+        # classes map to the cluster ids of the schema
+        clusters.class_clusters = schema.class_clusters
         self._clusters = clusters
         self._cluster_conf = cluster_conf
         self._server_version = server_version
         self._protocol = protocol
+        self._cache = cache
 
         # "ORecordSerializerBinary" or "ORecordDocument2csv"
         self._serialization_type = serialization_type
+        self._live = {}
+        # events pushed before their subscription was registered
+        self._live_early = {}
+        self._subscribing = 0
+        self._tx_id = 0
+        self._sock.on_push(self._handle_push)
         self._is_ready.set()
 
     @property
@@ -79,13 +486,61 @@ class ODBClient(AsyncCtx):
     def cluster_conf(self):
         return self._cluster_conf
 
+    @property
+    def router(self):
+        return self._router
+
+    @property
+    def node(self):
+        return self._sock.node
+
+    @property
+    def schema(self):
+        return self._schema
+
     @property
     def server_version(self):
         return self._server_version
 
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def on_push(self):
+        return self._sock.on_push
+
     async def _shutdown(self):
+        for live in list(self._live.values()):
+            live._close()
         await self._sock.shutdown()
 
+    async def _handle_push(self, payload):
+        push = payload.extra
+        if push.type == PUSH_DISTRIB_CONFIG:
+            await self._update_cluster_conf(push.content)
+        elif push.type == PUSH_STORAGE_CONFIG and self._db_name:
+            await self.reload_db()
+        elif push.type == PUSH_SCHEMA and self._db_name:
+            # reloads only if schemaVersion moved
+            await self._schema.get(self)
+        elif push.type == PUSH_LIVE_QUERY:
+            await self._route_live_event(parse_live_event(
+                push.content,
+                binary=self._serialization_type == BINARY_SERIALIZER,
+                global_properties=self._schema.global_properties
+            ))
+
+    async def _route_live_event(self, event: ODBLiveEvent):
+        live = self._live.get(event.token)
+        if live is None:
+            if self._subscribing and event.operation != 'unsubscribe':
+                self._live_early.setdefault(event.token, []).append(event)
+        elif event.operation == 'unsubscribe':
+            live._close()
+        else:
+            await live._events.put(event)
+
     async def connect(self, user: str, password: str, **kwargs):
         handler = server.ServerConnect(self, user, password, **kwargs)
         print('connect handler')
@@ -101,7 +556,16 @@ class ODBClient(AsyncCtx):
 
     async def open_db(self, db_name: str, user: str, password: str, **kwargs):
         handler = await db.OpenDb(self, db_name, user, password, **kwargs).send()
-        return await handler.read()
+        response = await handler.read()
+        if response is self:
+            await self._update_cluster_conf(self._cluster_conf)
+        return response
+
+    async def _update_cluster_conf(self, cluster_conf: bytes):
+        self._cluster_conf = cluster_conf
+        if self._router is not None and cluster_conf:
+            await self._router.resolve(loop=self._loop)
+            self._router.update(cluster_conf)
 
     async def reload_db(self, **kwargs):
         handler = await db.ReloadDb(self, **kwargs).send()
@@ -124,9 +588,194 @@ class ODBClient(AsyncCtx):
         return await handler.read()
 
     async def db_schema(self):
-        response = await self.execute("select from #0:1")
-        return response
+        return await self._schema.get(self)
 
-    async def execute(self, query: str, **kwargs):
-        handler = await command.Query(self, query, **kwargs).send()
-        return await handler.read()
+    async def execute(self, query: str, *, stream: bool=False, **kwargs):
+        """
+        Run query and return its records.
+        With stream=True (or mode='a' without a callback) an async
+        iterator is returned right away, yielding every record as soon
+        as it is decoded off the wire.
+        Values are passed with params instead of formatting them into
+        query, e.g. execute('select from V where id = :id', params={'id': 1}).
+        Commands drop the records they may change from the record
+        cache (see invalidate_writes).
+        A request the server rejects returns the list of its error
+        messages, it is not raised (see ODBRequestError).
+        """
+        handler = await command.Query(self, query, stream=stream, **kwargs).send()
+        writes = self._cache is not None and kwargs.get(
+            'command_type', QUERY_CMD
+        ) not in (QUERY_SYNC, QUERY_ASYNC, QUERY_LIVE)
+        if stream or (handler.results is not None and kwargs.get('callback') is None):
+            if writes:
+                invalidate_writes(self, query)
+            # the stream ends with the query's errors, read() is never called
+            handler.discard()
+            # mode='a' hands out its bounded stream like stream=True
+            return handler.stream if stream else handler.results
+        result = await handler.read()
+        if writes:
+            invalidate_writes(self, query)
+        # async mode hands out its stream, errors come as a list of messages
+        if self._cache is not None and isinstance(result, types.GeneratorType):
+            refresh = self._cache.refresh
+            return (
+                refresh(item) if isinstance(item, ODBRecord) else item
+                for item in result
+            )
+        return result
+
+    async def stream(self, query: str, **kwargs):
+        return await self.execute(query, stream=True, **kwargs)
+
+    def cursor(self, query: str, *, page_size: int=1000, **kwargs)->ODBCursor:
+        """
+        Walk the results of query page by page, see ODBCursor.
+        Takes params like execute().
+        """
+        return ODBCursor(self, query, page_size, kwargs)
+
+    async def load(self, rid: str, **kwargs)->ODBRecord:
+        """
+        Load the record rid (RECORD_LOAD), None if there is none.
+        Takes fetch_plan, ignore_cache, load_tombstones and detach.
+        Loads with the default fetch plan go through the record cache,
+        unless ignore_cache is set.
+        """
+        return await self._load(rid, kwargs)
+
+    async def _load(self, rid: str, kwargs: dict, pipelined: bool=False):
+        cache = self._cache
+        if cache is not None and (
+                kwargs.get('ignore_cache') or kwargs.get('fetch_plan', '*:0') != '*:0'):
+            cache = None
+        if cache is not None:
+            cached = cache.get(rid if rid[:1] == '#' else f'#{rid}')
+            if cached is not None:
+                return cached
+        handler = await record.LoadRecord(
+            self, rid, pipelined=pipelined, **kwargs
+        ).send()
+        result = await handler.read()
+        if cache is not None and isinstance(result, ODBRecord):
+            result = cache.put(result)
+        return result
+
+    async def load_many(self, rids: typing.Iterable, *, window: int=64,
+                        **kwargs)->list:
+        """
+        Load the records rids, up to window loads are written
+        back-to-back before their responses are read.
+        Returns the records in the order of rids.
+        """
+        slots = asyncio.Semaphore(window, loop=self._loop)
+
+        async def load_one(rid):
+            async with slots:
+                return await self._load(rid, kwargs, pipelined=True)
+
+        return await asyncio.gather(*(load_one(rid) for rid in rids))
+
+    async def create_records(self, cluster_id: int, contents: typing.Iterable, *,
+                             record_type: str='d', window: int=64,
+                             queue_size: int=256)->ODBStream:
+        """
+        Create a record in cluster_id for each of contents, record
+        payloads already serialized in the client's serialization format.
+        Up to window create requests are written back-to-back before
+        their responses are read.
+        Returns an ODBStream of the ODBRecordVersion (rid, version)
+        of every record, in the order of contents. A create the server
+        rejects ends the stream with ODBRequestError, its index is the
+        position of the failed content.
+        """
+        created = ODBStream(queue_size, loop=self._loop)
+        if self.cancelled:
+            created.close(ConnectionAbortedError('ODBClient is shut down.'))
+            return created
+        task = self.spawn(self._create_records(
+            created, cluster_id, contents, record_type, window
+        ))
+        # a shutdown may cancel the task before it ran
+        task.add_done_callback(lambda _: created.close(
+            ConnectionAbortedError('ODBClient is shut down.')
+        ))
+        return created
+
+    async def _create_records(self, created: ODBStream, cluster_id: int,
+                              contents: typing.Iterable, record_type: str,
+                              window: int):
+        slots = asyncio.Semaphore(window, loop=self._loop)
+        sent = asyncio.Queue(loop=self._loop)
+
+        async def send_all():
+            try:
+                for content in contents:
+                    await slots.acquire()
+                    if created.cancelled:
+                        break
+                    handler = record.CreateRecord(
+                        self, cluster_id, content,
+                        record_type=record_type, pipelined=True
+                    )
+                    await sent.put(await handler.send())
+            finally:
+                await sent.put(None)
+
+        if self.cancelled:
+            created.close(ConnectionAbortedError('ODBClient is shut down.'))
+            return
+        sender = self.spawn(send_all())
+        handler = None
+        try:
+            index = 0
+            while True:
+                handler = await sent.get()
+                if handler is None:
+                    break
+                result = await handler.read()
+                slots.release()
+                if not isinstance(result, ODBRecordVersion):
+                    raise ODBRequestError(result, index)
+                await created.put(result)
+                index += 1
+            await sender
+        except BaseException as ex:
+            sender.cancel()
+            if isinstance(ex, asyncio.CancelledError):
+                ex = ConnectionAbortedError('ODBClient is shut down.')
+            created.close(ex)
+            # retrieves the sender's own error, if any
+            await asyncio.gather(sender, return_exceptions=True)
+            while handler is not None:
+                handler.discard()
+                handler = None if sent.empty() else sent.get_nowait()
+        else:
+            created.close()
+
+    def transaction(self)->ODBTransaction:
+        """async context manager buffering a transaction, see ODBTransaction"""
+        self._tx_id += 1
+        return ODBTransaction(self, self._tx_id)
+
+    async def live_query(self, query: str, **kwargs)->ODBLiveQuery:
+        """
+        Subscribe to query (LIVE SELECT ...),
+        returns the subscription as an async iterator of its events.
+        Raises ODBRequestError if the server rejects the subscription.
+        """
+        self._subscribing += 1
+        try:
+            handler = await command.LiveQuery(self, query, **kwargs).send()
+            token = await handler.read()
+            if not isinstance(token, int):
+                raise ODBRequestError(token)
+            live = self._live[token] = ODBLiveQuery(self, query, token)
+            for event in self._live_early.pop(token, ()):
+                await live._events.put(event)
+            return live
+        finally:
+            self._subscribing -= 1
+            if not self._subscribing:
+                self._live_early.clear()
@@ -4,15 +4,11 @@
 """
 from pprint import pprint
 
-from aio_pyorient.message.command import Query
 from aio_pyorient.odb_types import ODBSchema
 from aio_pyorient.pool import ODBPool
 from aio_pyorient.utils import AsyncCtx
 
 
-SCHEMA_QUERY = "select expand(classes) from metadata:schema"
-
-
 class ODBGraph(AsyncCtx):
     def __init__(self, user: str, password: str, db_name: str, **kwargs):
         super().__init__(**kwargs)
@@ -37,7 +33,21 @@ class ODBGraph(AsyncCtx):
         await self._pool.setup()
         self._schema = await self.get_schema()
 
-    async def get_schema(self):
-        handler = await Query(await self._pool.acquire(), SCHEMA_QUERY).send()
-        result = await handler.read()
-        return ODBSchema(result)
+    async def _shutdown(self):
+        await self._pool.shutdown()
+
+    async def get_schema(self)->ODBSchema:
+        return await self._pool.get_schema()
+
+    async def live_query(self, query: str, **kwargs):
+        return await self._pool.live_query(query, **kwargs)
+
+    def scan(self, class_name: str, *, polymorphic: bool=True, **kwargs):
+        """
+        Stream the records of class_name, its clusters scanned in
+        parallel on the pool's clients (see ODBPool.scan).
+        Takes concurrency, ordered and queue_size.
+        """
+        return self._pool.scan(
+            self._schema.clusters_of(class_name, polymorphic), **kwargs
+        )
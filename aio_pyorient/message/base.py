@@ -1,7 +1,9 @@
 import asyncio
-import struct
 
-from aio_pyorient.message.constants import REQUEST_ERROR, REQUEST_PUSH
+from aio_pyorient.message.constants import REQUEST_ERROR
+from aio_pyorient.message.decoder import (
+    ODBDecoder, int_packer, long_packer, short_packer
+)
 from aio_pyorient.odb_types import (
     ODBRequestErrorMessage
 )
@@ -12,132 +14,172 @@ class ODBHandlerError(BaseException):
     pass
 
 
+class ODBRequestError(Exception):
+    """
+    ODBRequestError
+    The server answered a request with an error, messages are its
+    ODBRequestErrorMessage (class_name, message) tuples.
+    Raised where a call has no result to return the messages in:
+    transaction commits, cursors, streams, create_records and live
+    queries. Handlers' read() and client.execute return the messages
+    (a list) instead.
+    index is the position of the failed request in a batch, if any.
+    """
+    def __init__(self, messages: list, index: int=None):
+        super().__init__(messages, index)
+        self.messages = messages
+        self.index = index
+
+    def __str__(self):
+        text = '; '.join(f'{m.class_name}: {m.message}' for m in self.messages)
+        if self.index is None:
+            return text
+        return f'request {self.index}: {text}'
+
+
 class BaseHandler(AsyncBase):
     """
     # BaseHandler
     Parent class for all client server communication handlers.
 
-    Child classes should overwrite _read method.
+    Child classes should overwrite _parse or _read method.
 
+    Responses are decoded from the socket's receive buffer
+    (see ODBDecoder). _parse gets the decoder and reads the response
+    synchronously, field after field. The handler only yields to the
+    event loop when the buffer runs dry.
     It provides common properties and methods
-    like reading and decoding different fields,
-    reading response header (status, session_id, auth_token), etc.
+    like parsing the response header (status, session_id, auth_token), etc.
+
+    The request is encoded by the compiled Request (see encoder)
+    set as class attribute. Its header gets the client's session_id
+    and auth_token, the handler passes the values of the other fields.
+    Handlers created with pipelined=True are sent without waiting for
+    the responses of earlier requests (see ODBSocket.send).
 
     Usage:
         class MyHandler(BaseHandler):
+            request = Request(Operation: int, Type_Field_1, Type_Field_2, ...)
+
             def __init__(self, client, *args, **kwargs):
                 super().__init__(
                     client,
-                    (RequestHeader, (
-                            Operation: int,
-                            client._session_id,
-                            client._auth_token)),
-                    (Type_Field_1, Value_Field_1),
-                    (Type_Field_2, Value_Field_2),
+                    Value_Field_1,
+                    Value_Field_2,
                     ...
                     **kwargs
                 )
                 ...
 
-            async def _read(self):
-                # read field after field from socket
-                return response
+            def _parse(self, decoder):
+                self.parse_header(decoder)
+                # read field after field from the buffer
+                return decoder.read_long()
     """
 
-    def __init__(self, client, *fields, **kwargs):
+    request = None
+
+    def __init__(self, client, *values, pipelined: bool=False, **kwargs):
         super().__init__(loop=client._loop)
         self._sent = asyncio.Event(loop=self._loop)
         self._client = client
         self._sock = client._sock
-        self._request = b''.join(
-            field_type(value)
-            for field_type, value in fields
+        self._pipelined = pipelined
+        self._response = None
+        self._request = self.request.encode(
+            client._session_id, client._auth_token, *values
         )
 
     async def read_bool(self):
-        return ord(await self._sock.recv(1)) is 1
+        return await self._sock.decode(ODBDecoder.read_bool)
 
     async def read_byte(self):
-        return ord(await self._sock.recv(1))
+        return await self._sock.decode(ODBDecoder.read_byte)
 
     async def read_bytes(self):
-        value = b''
-        _len = await self.read_int()
-        if _len > 0:
-            value = await self._sock.recv(_len)
-        return value
+        return await self._sock.decode(ODBDecoder.read_bytes)
 
     async def read_char(self):
-        value = await self._sock.recv(1)
-        return value.decode()
+        return await self._sock.decode(ODBDecoder.read_char)
 
     async def read_short(self):
-        decoded = short_packer.unpack(await self._sock.recv(2))[0]
-        return decoded
+        return await self._sock.decode(ODBDecoder.read_short)
 
     async def read_int(self):
-        decoded = int_packer.unpack(await self._sock.recv(4))[0]
-        return decoded
+        return await self._sock.decode(ODBDecoder.read_int)
 
     async def read_long(self):
-        decoded = long_packer.unpack(await self._sock.recv(8))[0]
-        return decoded
+        return await self._sock.decode(ODBDecoder.read_long)
 
     async def read_string(self):
-        decoded = (await self.read_bytes()).decode("utf-8")
-        return decoded
+        return await self._sock.decode(ODBDecoder.read_string)
 
-    async def read_header(self, with_token: bool = True):
-        await self._sent.wait()
-        status = await self.read_byte()
-        if status is REQUEST_ERROR:
-            raise ODBHandlerError()
-        if status is REQUEST_PUSH:
-            print("receiving push message")
-            return "PUSH MESSAGE"
-        self._client._session_id = await self.read_int()
+    def parse_header(self, decoder: ODBDecoder, with_token: bool = True):
+        status = decoder.read_byte()
+        if status == REQUEST_ERROR:
+            raise ODBHandlerError(self.parse_error(decoder, with_token))
+        self._client._session_id = decoder.read_int()
         if with_token:
-            self._client._auth_token = await self.read_bytes()
+            self._client._auth_token = decoder.read_bytes()
         return self._client
 
-    async def read_error(self):
+    def parse_error(self, decoder: ODBDecoder, with_token: bool = True):
+        decoder.read_int()  # session_id
+        if with_token:
+            decoder.read_bytes()
         messages = []
-        while True:
-            more = await self.read_byte()
-            print("error more: ", more)
-            if more is 0:
-                break
+        while decoder.read_byte():
             messages.append(ODBRequestErrorMessage(
-                await self.read_string(),
-                await self.read_string()
+                decoder.read_string(),
+                decoder.read_string()
             ))
-        self._done.set()
+        decoder.read_bytes()  # serialized java exception
         return messages
 
+    async def read_header(self, with_token: bool = True):
+        await self._sent.wait()
+        return await self._sock.decode(self.parse_header, with_token)
+
     async def read(self):
         try:
-            return await self._read()
-        except ODBHandlerError:
-            return await  self.read_error()
+            return await self._response
+        except ODBHandlerError as err:
+            return err.args[0]
         finally:
             self._done.set()
 
+    def discard(self):
+        """drop the response of a sent request, errors included"""
+        if self._response is not None:
+            self._response.add_done_callback(_retrieve)
+
     async def send(self):
         try:
-            await self._sock.send(self._request)
+            self._response = await self._sock.send(
+                *self._request, reader=self._read, pipelined=self._pipelined
+            )
             return self
         finally:
             self._sent.set()
 
-
     async def _read(self):
         """
-        Overwrite this method if you want on_before_read
-        and on_did_read signals to be send.
+        Decodes the whole response with _parse.
+        Overwrite this method if the response should be
+        read in several steps (e.g. record by record).
+        """
+        await self._sent.wait()
+        return await self._sock.decode(self._parse)
+
+    def _parse(self, decoder: ODBDecoder):
+        """
+        Overwrite this method to parse the response straight
+        out of the receive buffer. It must not block, so it may be
+        called again from the start when the buffer ran dry.
         """
-        pass
+        return self.parse_header(decoder)
 
 
-int_packer = struct.Struct(">i")
-short_packer = struct.Struct(">h")
-long_packer = struct.Struct(">q")
+def _retrieve(response: asyncio.Future):
+    if not response.cancelled():
+        response.exception()
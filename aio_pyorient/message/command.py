@@ -1,18 +1,108 @@
 import asyncio
+import functools
 import inspect
 from typing import Callable
 
 from aio_pyorient.message.base import (
-    BaseHandler
+    BaseHandler, ODBHandlerError, ODBRequestError, _retrieve, int_packer
 )
-from aio_pyorient.message.constants import QUERY_ASYNC, QUERY_CMD
-from aio_pyorient.odb_types import ODBRecord
-from aio_pyorient.message.encoder import Bytes, Char, String, Integer, RequestHeader
+from aio_pyorient.message.constants import (
+    BINARY_SERIALIZER, CLOSE_QUERY, CSV_SERIALIZER, DB_COMMAND, QUERY, QUERY_ASYNC,
+    QUERY_CMD, QUERY_LIVE, QUERY_NEXT_PAGE, QUERY_OPERATION, QUERY_SYNC,
+    RESULT_PROJECTION
+)
+from aio_pyorient.message.decoder import ODBDecoder
+from aio_pyorient.odb_types import ODBQueryPage, ODBRecord
+from aio_pyorient.schema.prop_types import ODBRecordStream, read_result
+from aio_pyorient.message.encoder import (
+    Boolean, Byte, Bytes, Char, String, Integer, Nested, Request
+)
+from aio_pyorient.serializer import dump_network, dump_string, dump_value
+from aio_pyorient.utils import ODBStream
+
+
+# header and mode of a command, followed by the payload's length
+COMMAND_HEAD = Request(DB_COMMAND, Char, Integer)
+
+
+@functools.lru_cache(maxsize=1024)
+def command_payload(command_type: str, query: str, limit: int, fetch_plan: str)->tuple:
+    """
+    The encoded parts of a command payload around its serialized
+    parameters: OCommandSQL has a flag for (simple) parameters before
+    them and one for composite key parameters after them, queries
+    send their limit and fetch plan first.
+    """
+    if command_type == QUERY_CMD:
+        return String(command_type) + String(query) + Boolean(True), Boolean(False)
+    return String(command_type) + String(query) + Integer(limit) + String(fetch_plan), b''
+
+
+def serialize_params(params: dict or list or tuple, command_type: str=QUERY_CMD)->bytes:
+    """
+    params as a document mapping names, or the indexes of positional
+    parameters, to values: in a params field for queries (OSQLQuery),
+    in a parameters field for commands and scripts. Commands pass
+    string values through getTypeValue, which would read "123" as a
+    number and "#1:2" as a link, so they are sent quoted once more.
+    """
+    if not isinstance(params, dict):
+        params = dict(enumerate(params))
+    if command_type in (QUERY_SYNC, QUERY_ASYNC, QUERY_LIVE):
+        return f'params:{dump_value(params)}'.encode('utf-8')
+    params = {
+        key: dump_string(value) if isinstance(value, str) else value
+        for key, value in params.items()
+    }
+    return f'parameters:{dump_value(params)}'.encode('utf-8')
+
+
+def serialize_query_params(params: dict or list or tuple=None)->bytes:
+    """
+    params of a query with a server side cursor, a document with a
+    params field in the network format, whatever the session's
+    serialization: positional parameters are mapped by their index
+    """
+    if params is None:
+        params = {}
+    elif not isinstance(params, dict):
+        params = {str(index): value for index, value in enumerate(params)}
+    return dump_network({'params': params})
 
 
 class Query(BaseHandler):
+    """
+    Query
+    Sends a command (op 41) and reads its results.
+
+    mode='s' returns all results at once, or an ODBStream of them
+    with stream=True.
+    mode='a' runs an asynchronous query: results is a stream bounded to
+    queue_size records, a slow consumer holds back reading further records.
+    An optional callback (coroutine function) is called for every record,
+    or for lists of up to batch_size records collected for at most
+    batch_timeout seconds. Callbacks run concurrently as separate tasks,
+    at most max_callbacks at a time, so they never block decoding.
+    read() raises the first error of a callback, a read() cancelled
+    before the end cancels the query and its callbacks.
+    cancel() stops the delivery of results; the remaining records are
+    drained off the socket and dropped. A query the server rejects ends
+    the stream with ODBRequestError. A stream left before its end
+    must be cancelled (async with the stream does that), the socket's
+    reader waits on its full queue otherwise.
+    params (a dict for :name, a list for ? placeholders) are sent
+    serialized in the payload's parameters section, the rest of the
+    payload is encoded once per query text and reused.
+    Records prefetched by the fetch plan are collected in prefetched
+    (rid -> ODBRecord), ODBRecord.linked() resolves links against them.
+    """
+    request = Request(
+        DB_COMMAND, Char, Nested(String, String, Integer, String, Integer)
+    )
     _callback = None
+    _dispatcher = None
     results = None
+    stream = None
     def __init__(self,
                  client,
                  query: str, *,
@@ -21,12 +111,19 @@ class Query(BaseHandler):
                  fetch_plan: str='*:0',
                  mode: str='s',
                  callback: Callable=None,
+                 detach: bool=False,
+                 stream: bool=False,
+                 queue_size: int=256,
+                 batch_size: int=None,
+                 batch_timeout: float=None,
+                 max_callbacks: int=16,
+                 params: dict or list=None,
                  **kwargs):
 
         if mode == 'a':
-            self.results = asyncio.Queue(loop=self._loop)
+            self.results = ODBStream(queue_size, loop=client._loop)
             command_type = QUERY_ASYNC
-            if not inspect.iscoroutinefunction(callback):
+            if callback is not None and not inspect.iscoroutinefunction(callback):
                 raise ValueError(
                     """
                     Query needs a coroutine function as callback 
@@ -34,73 +131,369 @@ class Query(BaseHandler):
                     """
                 )
             self._callback = callback
+            self._batch_size = batch_size
+            self._batch_timeout = batch_timeout
+            self._max_callbacks = max_callbacks
         self._mode = mode
+        self._detach = detach
+        self.prefetched = {}
+        self._binary = client._serialization_type == BINARY_SERIALIZER
+        self._global_properties = client.schema.global_properties
+        if stream:
+            self.stream = ODBStream(queue_size, loop=client._loop)
         if "LIMIT" in query.upper():
             limit = -1
-        payload = b''.join([
-            String(command_type),
-            String(query),
-            Integer(limit),
-            String(fetch_plan),
-            Integer(0)
-        ])
-        super().__init__(
-            client,
-            (RequestHeader, (41, client._session_id, client._auth_token)),
-            (Char, mode),
-            (Bytes, payload),
-            **kwargs
+        if params is None:
+            super().__init__(
+                client,
+                mode,
+                command_type,
+                query,
+                limit,
+                fetch_plan,
+                0,
+                **kwargs
+            )
+        else:
+            if self._binary:
+                raise ValueError(
+                    f'Query parameters need the {CSV_SERIALIZER} serialization.'
+                )
+            head, tail = command_payload(command_type, query, limit, fetch_plan)
+            serialized = serialize_params(params, command_type)
+            self.request = COMMAND_HEAD
+            super().__init__(
+                client,
+                mode,
+                len(head) + 4 + len(serialized) + len(tail),
+                **kwargs
+            )
+            self._request += (
+                head, int_packer.pack(len(serialized)), serialized, tail
+            )
+
+    def parse_record(self, decoder: ODBDecoder):
+        record = ODBRecord(
+            decoder.read_char(), decoder.read_rid(),
+            decoder.read_int(), decoder.read_view(),
+            binary=self._binary, global_properties=self._global_properties,
+            prefetched=self.prefetched
         )
+        if self._detach:
+            record.detach()
+        return record
 
-    async def read_id(self):
-        c_id, pos = [await self.read_short(), await self.read_long()]
-        return f"#{c_id}:{pos}"
+    def parse_next(self, decoder: ODBDecoder):
+        marker = decoder.read_short()
+        if marker == -2:
+            return None
+        if marker == -3:
+            return decoder.read_rid()
+        return self.parse_record(decoder)
 
-    async def read_record(self):
-        r_type = await self.read_char()
-        r_id = await self.read_id()
-        r_version = await self.read_int()
-        r_content = await self.read_bytes()
-        return ODBRecord(r_type, r_id, r_version, r_content)
+    def parse_entry(self, decoder: ODBDecoder):
+        status = decoder.read_byte()
+        if status == 0:
+            return status, None
+        return status, self.parse_next(decoder)
 
-    async def read_next(self):
-        marker = await self.read_short()
-        if marker is -2:
-            return None
-        if marker is -3:
-            return await self.read_id()
-        return await self.read_record()
+    async def read_entries(self):
+        """
+        Reads (status, record) entries up to the closing 0 status and
+        yields the results (status 1). Records prefetched by the fetch
+        plan (status 2) are put into prefetched by rid.
+        """
+        prefetched = self.prefetched
+        while True:
+            entries = await self._sock.decode_many(
+                self.parse_entry, is_last=_is_last_entry
+            )
+            for status, record in entries:
+                if status == 0:
+                    return
+                if status == 1:
+                    yield record
+                elif isinstance(record, ODBRecord):
+                    prefetched[record.id] = record
 
     async def read_records_async(self):
-        while True:
-            status = await self.read_byte()
-            if status is 0:
+        results = self.results
+        try:
+            await self.read_header()
+            async for record in self.read_entries():
+                await results.put(record)
+        except ODBHandlerError as err:
+            results.close(ODBRequestError(err.args[0]))
+            raise
+        except Exception as ex:
+            results.close(ex)
+            raise
+        results.close()
+        return results
+
+    async def _next_batch(self):
+        results = self.results
+        try:
+            batch = [await results.__anext__()]
+        except StopAsyncIteration:
+            return []
+        size, deadline = self._batch_size, None
+        if self._batch_timeout is not None:
+            deadline = self._loop.time() + self._batch_timeout
+        if size is None:
+            size = 1 if deadline is None else float('inf')
+        while len(batch) < size:
+            try:
+                if deadline is None:
+                    batch.append(await results.__anext__())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                batch.append(await asyncio.wait_for(results.__anext__(), timeout))
+            except (StopAsyncIteration, asyncio.TimeoutError):
                 break
-            record = await self.read_next()
-            if status is 1:
-                await self.results.put(record)
-                await self._callback(record)
-        return self.results
+        return batch
 
-    async def _read(self):
-        await self.read_header()
-        if self._mode == 'a':
-            return await self.read_records_async()
-        records = ()
-        result_type = await self.read_char()
-        if result_type == 'n':
-            await self.read_char()
-        elif result_type in 'rw':
-            records = (await self.read_next(),)
-            await self.read_char()
+    async def _dispatch(self):
+        running = set()
+        failed = []
+        slots = asyncio.Semaphore(self._max_callbacks, loop=self._loop)
+
+        def finished(task):
+            running.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                failed.append(task.exception())
+
+        async def run(arg):
+            try:
+                await self._callback(arg)
+            finally:
+                slots.release()
+
+        batched = self._batch_size is not None or self._batch_timeout is not None
+        try:
+            while True:
+                batch = await self._next_batch()
+                if not batch:
+                    break
+                await slots.acquire()
+                # surface callback errors early
+                if failed:
+                    raise failed[0]
+                task = asyncio.ensure_future(run(batch if batched else batch[0]))
+                running.add(task)
+                task.add_done_callback(finished)
+            if running:
+                await asyncio.gather(*running)
+            if failed:
+                raise failed[0]
+        except BaseException:
+            for task in running:
+                task.cancel()
+            self.results.cancel()
+            # wait for the cancelled callbacks, finished() collects their errors
+            await asyncio.gather(*running, return_exceptions=True)
+            raise
+
+    async def send(self):
+        await super().send()
+        if self._callback is not None and self._dispatcher is None:
+            self._dispatcher = self.spawn(self._dispatch())
+            if self._dispatcher is not None:
+                # read() raises its error, a query never read drops it
+                self._dispatcher.add_done_callback(_retrieve)
+        return self
+
+    async def read(self):
+        try:
+            result = await super().read()
+            if self._dispatcher is not None:
+                await self._dispatcher
+        except asyncio.CancelledError:
+            # the reader stopped early, so do the callbacks
+            await self.cancel()
+            raise
+        return result
+
+    async def cancel(self):
+        if self.results is not None:
+            self.results.cancel()
+        if self.stream is not None:
+            self.stream.cancel()
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        await super().cancel()
+
+    async def read_results(self):
+        """
+        Yields the results in batches, as they are decoded off the wire.
+        """
+        result_type = await self._sock.decode(ODBDecoder.read_char)
+        if result_type in 'rw':
+            record = await self._sock.decode(self.parse_next)
             if result_type == 'w':
-                records = (
-                    records[0].data.decode().replace('result:', ''),
-                )
+                record = record.data.decode().replace('result:', '')
+            yield [record]
         elif result_type == 'l':
-            _len = await self.read_int()
-            for _ in range(_len):
-                records += (await self.read_next(),)
+            _len = await self._sock.decode(ODBDecoder.read_int)
+            while _len:
+                batch = await self._sock.decode_many(self.parse_next, _len)
+                _len -= len(batch)
+                yield batch
         elif result_type == 'i':
-            records = await self.read_records_async()
+            async for record in self.read_entries():
+                yield [record]
+
+    async def _read(self):
+        if self.stream is not None:
+            return await self._read_stream()
+        if self._mode == 'a':
+            return await self.read_records_async()
+        await self.read_header()
+        records = []
+        async for batch in self.read_results():
+            records += batch
+        # records prefetched by the fetch plan, closed by a 0 status
+        async for _ in self.read_entries():
+            pass
         return (record for record in records)
+
+    async def _read_stream(self):
+        stream = self.stream
+        try:
+            await self.read_header()
+            async for batch in self.read_results():
+                for record in batch:
+                    await stream.put(record)
+            stream.close()
+            async for _ in self.read_entries():
+                pass
+        except ODBHandlerError as err:
+            stream.close(ODBRequestError(err.args[0]))
+        except Exception as ex:
+            stream.close(ex)
+            raise
+        return stream
+
+
+class LiveQuery(Query):
+    """
+    LiveQuery
+    Subscribes to a LIVE SELECT, its response is the token
+    of the subscription. The events of the subscription arrive
+    as push frames (see ODBClient.live_query).
+    """
+    def __init__(self, client, query: str, **kwargs):
+        super().__init__(
+            client, query, command_type=QUERY_LIVE, mode='l', limit=-1, **kwargs
+        )
+
+    async def _read(self):
+        for record in await super()._read():
+            return record['token']
+
+
+class PageReader(BaseHandler):
+    """
+    Reads a page of a server side query (QUERY, QUERY_NEXT_PAGE):
+    query id, the results and whether there are more.
+    Results are ODBRecords, projections are decoded to dicts.
+    """
+    def __init__(self, client, *values, **kwargs):
+        super().__init__(client, *values, **kwargs)
+        self._binary = client._serialization_type == BINARY_SERIALIZER
+        self._global_properties = client.schema.global_properties
+
+    def parse_result(self, decoder: ODBDecoder):
+        if decoder.read_byte() == RESULT_PROJECTION:
+            return read_result(ODBRecordStream(decoder.read_view()))
+        marker = decoder.read_short()
+        if marker == -2:
+            return None
+        if marker == -3:
+            return decoder.read_rid()
+        return ODBRecord(
+            decoder.read_char(), decoder.read_rid(),
+            decoder.read_int(), decoder.read_view(),
+            binary=self._binary, global_properties=self._global_properties
+        )
+
+    def parse_head(self, decoder: ODBDecoder)->tuple:
+        """query id and number of results of the page"""
+        self.parse_header(decoder)
+        query_id = decoder.read_string()
+        decoder.read_bool()  # changes of the transaction
+        if decoder.read_bool():
+            self.parse_result(decoder)  # execution plan
+        return query_id, decoder.read_int()
+
+    @staticmethod
+    def parse_tail(decoder: ODBDecoder)->tuple:
+        """whether there are more pages and the query stats"""
+        has_next = decoder.read_bool()
+        stats = {}
+        for _ in range(decoder.read_int()):
+            key = decoder.read_string()
+            stats[key] = decoder.read_long()
+        decoder.read_bool()  # metadata to reload
+        return has_next, stats
+
+    async def _read(self):
+        # result by result, a big page is not parsed again per chunk
+        await self._sent.wait()
+        sock = self._sock
+        query_id, count = await sock.decode(self.parse_head)
+        results = []
+        while len(results) < count:
+            results += await sock.decode_many(self.parse_result, count - len(results))
+        has_next, stats = await sock.decode(self.parse_tail)
+        return ODBQueryPage(query_id, results, has_next, stats)
+
+
+class ServerQuery(PageReader):
+    """
+    ServerQuery
+    Runs a query with a server side cursor (op 45), the response is
+    its first ODBQueryPage of at most page_size results.
+    NextPage gets the following pages, CloseQuery releases the cursor
+    of a query that was not read to its end.
+    params are sent in the network format, with either serialization.
+    """
+    request = Request(QUERY, String, String, Byte, Integer, String, Bytes, Boolean)
+
+    def __init__(self, client, query: str, *,
+                 page_size: int=1000,
+                 params: dict or list=None,
+                 language: str='sql',
+                 operation: int=QUERY_OPERATION,
+                 **kwargs):
+        super().__init__(
+            client,
+            language,
+            query,
+            operation,
+            page_size,
+            '',  # fetch plan, not used by the server yet
+            serialize_query_params(params),
+            not isinstance(params, (list, tuple)),
+            **kwargs
+        )
+
+
+class NextPage(PageReader):
+    request = Request(QUERY_NEXT_PAGE, String, Integer)
+
+    def __init__(self, client, query_id: str, page_size: int=1000, **kwargs):
+        super().__init__(client, query_id, page_size, **kwargs)
+
+
+class CloseQuery(BaseHandler):
+    request = Request(CLOSE_QUERY, String)
+
+    def __init__(self, client, query_id: str, **kwargs):
+        super().__init__(client, query_id, **kwargs)
+
+
+def _is_last_entry(entry):
+    return entry[0] == 0
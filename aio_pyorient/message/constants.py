@@ -7,7 +7,13 @@ DB_EXIST = 6
 DROP_DB = 7
 DB_SIZE = 8
 DB_RECORD_COUNT = 9
+RECORD_LOAD = 30
+RECORD_CREATE = 31
 DB_COMMAND = 41
+QUERY = 45
+QUERY_NEXT_PAGE = 46
+CLOSE_QUERY = 47
+TX_COMMIT = 60
 RELOAD_DB = 73
 
 QUERY_SYNC    = "com.orientechnologies.orient.core.sql.query.OSQLSynchQuery"
@@ -15,9 +21,31 @@ QUERY_ASYNC   = "com.orientechnologies.orient.core.sql.query.OSQLAsynchQuery"
 QUERY_CMD     = "com.orientechnologies.orient.core.sql.OCommandSQL"
 QUERY_GREMLIN = "com.orientechnologies.orient.graph.gremlin.OCommandGremlin"
 QUERY_SCRIPT  = "com.orientechnologies.orient.core.command.script.OCommandScript"
+QUERY_LIVE    = "com.orientechnologies.orient.core.sql.query.OLiveQuery"
+CSV_SERIALIZER    = "ORecordDocument2csv"
+BINARY_SERIALIZER = "ORecordSerializerBinary"
 NAME = "ODB binary client (aio_pyorient)"
 VERSION = "0.0.1"
 SUPPORTED_PROTOCOL = 37
 REQUEST_SUCCESS = 0
 REQUEST_ERROR = 1
 REQUEST_PUSH = 3
+PUSH_DISTRIB_CONFIG = 80
+PUSH_LIVE_QUERY = 81
+PUSH_STORAGE_CONFIG = 82
+PUSH_SCHEMA = 83
+# ORecordOperation codes
+RECORD_LOADED = 0
+RECORD_UPDATED = 1
+RECORD_DELETED = 2
+RECORD_CREATED = 3
+# operation of a live query event, by its ORecordOperation code
+LIVE_OPERATIONS = {
+    RECORD_LOADED: 'load', RECORD_UPDATED: 'update',
+    RECORD_DELETED: 'delete', RECORD_CREATED: 'create'
+}
+# operation of a QUERY request
+QUERY_OPERATION = 1
+COMMAND_OPERATION = 2
+# result types of QUERY pages, all but projections are records
+RESULT_PROJECTION = 4
@@ -5,18 +5,27 @@ from aio_pyorient.odb_types import ODBCluster
 from aio_pyorient.message.base import (
     BaseHandler
 )
-from aio_pyorient.message.encoder import Boolean, String, Introduction, RequestHeader
+from aio_pyorient.message.constants import (
+    CLOSE_DB, CREATE_DB, DB_EXIST, DB_RECORD_COUNT, DB_SIZE, DROP_DB, OPEN_DB, RELOAD_DB
+)
+from aio_pyorient.message.encoder import Boolean, String, Introduction, Request
 
 
 class DbBaseHandler(BaseHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    async def read_clusters(self):
-        for _ in range(await self.read_short()):
-            yield ODBCluster(await self.read_string(), await self.read_short())
+    def parse_clusters(self, decoder):
+        return [
+            ODBCluster(decoder.read_string(), decoder.read_short())
+            for _ in range(decoder.read_short())
+        ]
 
 class OpenDb(DbBaseHandler):
+    request = Request(
+        OPEN_DB, Introduction, String, String, Boolean, Boolean, Boolean,
+        String, String, String, token=False
+    )
 
     def __init__(
             self, client,
@@ -28,49 +37,42 @@ class OpenDb(DbBaseHandler):
             **kwargs):
         super().__init__(
             client,
-            (RequestHeader, (3, -1)),
-            (Introduction, None),
-            (String, client_id),
-            (String, client._serialization_type),
-            (Boolean, use_token_auth),
-            (Boolean, support_push),
-            (Boolean, collect_stats),
-            (String, db_name),
-            (String, user),
-            (String, password),
+            client_id,
+            client._serialization_type,
+            use_token_auth,
+            support_push,
+            collect_stats,
+            db_name,
+            user,
+            password,
             **kwargs
         )
         self._db_name = db_name
 
-    async def _read(self):
-        await self.read_header(with_token=False)  # returns status, old session_id, empty byte
-        self._client._session_id = await self.read_int()
-        self._client._auth_token = await self.read_bytes()
-        async for cluster in self.read_clusters():
-            self._client._clusters.append(cluster)
-        self._client._cluster_conf = await self.read_bytes()
-        self._client._server_version = await self.read_string()
+    def _parse(self, decoder):
+        self.parse_header(decoder, with_token=False)  # returns status, old session_id, empty byte
+        self._client._session_id = decoder.read_int()
+        self._client._auth_token = decoder.read_bytes()
+        clusters = self.parse_clusters(decoder)
+        cluster_conf = decoder.read_bytes()
+        server_version = decoder.read_string()
+        self._client._clusters.update(clusters, replace=True)
+        self._client._cluster_conf = cluster_conf
+        self._client._server_version = server_version
         self._client._db_name = self._db_name
         return self._client
 
 class ReloadDb(DbBaseHandler):
+    request = Request(RELOAD_DB)
 
-    def __init__(self, client, **kwargs):
-        super().__init__(
-            client,
-            (RequestHeader, (73, client._session_id, client._auth_token)),
-            **kwargs
-        )
-
-    async def _read(self):
-        self._client._clusters.clear()
-        self._client._session_id = await self.read_int()
-        self._client._auth_token = await self.read_bytes()
-        async for cluster in self.read_clusters():
-            self._client._clusters.append(cluster)
+    def _parse(self, decoder):
+        self.parse_header(decoder)
+        clusters = self.parse_clusters(decoder)
+        self._client._clusters.update(clusters, replace=True)
         return self._client
 
 class CreateDb(BaseHandler):
+    request = Request(CREATE_DB, String, String, String, String)
 
     def __init__(self,
                  client,
@@ -81,21 +83,20 @@ class CreateDb(BaseHandler):
                  **kwargs):
         super().__init__(
             client,
-            (RequestHeader, (4, client._session_id, client._auth_token)),
-            (String, db_name),
-            (String, db_type),
-            (String, storage_type),
-            (String, restore_from),
+            db_name,
+            db_type,
+            storage_type,
+            restore_from,
             **kwargs
         )
         print('CreateDb init')
         pprint(vars(self))
 
-    async def _read(self):
-        await self.read_header()
-        return self._client
+    def _parse(self, decoder):
+        return self.parse_header(decoder)
 
 class DropDb(BaseHandler):
+    request = Request(DROP_DB, String, String)
 
     def __init__(self,
                  client,
@@ -104,17 +105,16 @@ class DropDb(BaseHandler):
                  **kwargs):
         super().__init__(
             client,
-            (RequestHeader, (7, client._session_id, client._auth_token)),
-            (String, db_name),
-            (String, storage_type),
+            db_name,
+            storage_type,
             **kwargs
         )
 
-    async def _read(self):
-        await self.read_header()
-        return self._client
+    def _parse(self, decoder):
+        return self.parse_header(decoder)
 
 class DbExist(BaseHandler):
+    request = Request(DB_EXIST, String, String)
 
     def __init__(self,
                  client,
@@ -123,51 +123,31 @@ class DbExist(BaseHandler):
                  **kwargs):
         super().__init__(
             client,
-            (RequestHeader, (6, client._session_id, client._auth_token)),
-            (String, db_name),
-            (String, storage_type),
+            db_name,
+            storage_type,
             **kwargs
         )
 
-    async def _read(self):
-        await self.read_header()
-        exist = await self.read_bool()
-        return exist
+    def _parse(self, decoder):
+        self.parse_header(decoder)
+        return decoder.read_bool()
 
 class DbSize(BaseHandler):
+    request = Request(DB_SIZE)
 
-    def __init__(self, client, **kwargs):
-        super().__init__(
-            client,
-            (RequestHeader, (8, client._session_id, client._auth_token)),
-            **kwargs
-        )
-
-    async def _read(self):
-        await self.read_header()
-        return await self.read_long()
+    def _parse(self, decoder):
+        self.parse_header(decoder)
+        return decoder.read_long()
 
 class DbRecordCount(BaseHandler):
+    request = Request(DB_RECORD_COUNT)
 
-    def __init__(self, client, **kwargs):
-        super().__init__(
-            client,
-            (RequestHeader, (9, client._session_id, client._auth_token)),
-            **kwargs
-        )
-
-    async def _read(self):
-        await self.read_header()
-        return await self.read_long()
+    def _parse(self, decoder):
+        self.parse_header(decoder)
+        return decoder.read_long()
 
 class CloseDb(BaseHandler):
-
-    def __init__(self, client, **kwargs):
-        super().__init__(
-            client,
-            (RequestHeader, (5, client._session_id, client._auth_token)),
-            **kwargs
-        )
+    request = Request(CLOSE_DB)
 
     async def read(self):
         self._client._db_name = ''
@@ -0,0 +1,165 @@
+"""
+
+ decoder
+"""
+import struct
+
+
+int_packer = struct.Struct(">i")
+short_packer = struct.Struct(">h")
+long_packer = struct.Struct(">q")
+
+# consumed bytes are dropped from the receive buffer once the
+# cursor has moved past this many of them
+COMPACT_AT = 1 << 16
+
+
+class ODBIncompleteFrame(Exception):
+    """
+    Raised by ODBDecoder when the receive buffer runs dry
+    in the middle of a field.
+    """
+    pass
+
+
+class ODBDecoder:
+    """
+    # ODBDecoder
+    Sans-IO reader for the binary protocol.
+
+    Bytes received from the socket are appended with feed()
+    and parsed in place with an offset cursor.
+    The read_* methods never block. If the buffer does not hold
+    the whole field they raise ODBIncompleteFrame and leave
+    the cursor untouched.
+
+    Usage:
+        decoder = ODBDecoder()
+        decoder.feed(data)
+        pos = decoder.tell()
+        try:
+            status, session_id = decoder.read_byte(), decoder.read_int()
+        except ODBIncompleteFrame:
+            decoder.seek(pos)  # wait for more data, then retry
+    """
+    __slots__ = ('_buf', '_pos')
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    @property
+    def available(self):
+        return len(self._buf) - self._pos
+
+    def feed(self, data: bytes):
+        try:
+            if self._pos >= COMPACT_AT:
+                del self._buf[:self._pos]
+                self._pos = 0
+            self._buf += data
+        except BufferError:
+            # views handed out by read_view pin the current buffer,
+            # continue with a fresh one and leave the old one to them
+            buf = self._buf[self._pos:]
+            buf += data
+            self._buf, self._pos = buf, 0
+
+    def tell(self)->int:
+        return self._pos
+
+    def seek(self, pos: int):
+        self._pos = pos
+
+    def _advance(self, length: int)->int:
+        pos = self._pos
+        end = pos + length
+        if end > len(self._buf):
+            raise ODBIncompleteFrame()
+        self._pos = end
+        return pos
+
+    def read_raw(self, length: int)->bytes:
+        pos = self._advance(length)
+        return bytes(self._buf[pos:pos + length])
+
+    def peek_byte(self)->int:
+        if self._pos >= len(self._buf):
+            raise ODBIncompleteFrame()
+        return self._buf[self._pos]
+
+    def read_bool(self)->bool:
+        return self._buf[self._advance(1)] == 1
+
+    def read_byte(self)->int:
+        return self._buf[self._advance(1)]
+
+    def read_char(self)->str:
+        return chr(self._buf[self._advance(1)])
+
+    def read_short(self)->int:
+        return short_packer.unpack_from(self._buf, self._advance(2))[0]
+
+    def read_int(self)->int:
+        return int_packer.unpack_from(self._buf, self._advance(4))[0]
+
+    def read_long(self)->int:
+        return long_packer.unpack_from(self._buf, self._advance(8))[0]
+
+    def read_bytes(self)->bytes:
+        pos = self._pos
+        _len = self.read_int()
+        if _len <= 0:
+            return b''
+        try:
+            return self.read_raw(_len)
+        except ODBIncompleteFrame:
+            self._pos = pos
+            raise
+
+    def read_view(self)->memoryview:
+        """
+        Like read_bytes, but returns a memoryview over the receive
+        buffer instead of a copy.
+        """
+        pos = self._pos
+        _len = self.read_int()
+        if _len <= 0:
+            return memoryview(b'')
+        try:
+            start = self._advance(_len)
+        except ODBIncompleteFrame:
+            self._pos = pos
+            raise
+        return memoryview(self._buf)[start:start + _len]
+
+    def read_string(self)->str:
+        return self.read_bytes().decode("utf-8")
+
+    def read_rid(self)->str:
+        pos = self._advance(10)
+        c_id = short_packer.unpack_from(self._buf, pos)[0]
+        c_pos = long_packer.unpack_from(self._buf, pos + 2)[0]
+        return f"#{c_id}:{c_pos}"
+
+    def read_many(self, parse, count: int=-1, is_last=None)->list:
+        """
+        Run parse(decoder) for up to count items, or until is_last(item)
+        is true, stopping early as soon as the buffer runs dry.
+        Every item is atomic: a partially received item is rewound
+        and left for the next call.
+        """
+        items = []
+        append = items.append
+        while count:
+            pos = self._pos
+            try:
+                item = parse(self)
+            except ODBIncompleteFrame:
+                self._pos = pos
+                break
+            append(item)
+            count -= 1
+            if is_last is not None and is_last(item):
+                break
+        return items
@@ -2,6 +2,9 @@
 
  encoder
 """
+import operator
+import struct
+
 from aio_pyorient.message.base import int_packer, short_packer, long_packer
 from aio_pyorient.message.constants import NAME, VERSION, SUPPORTED_PROTOCOL
 
@@ -33,6 +36,192 @@ Introduction = lambda v: String(NAME) + String(VERSION) + Short(SUPPORTED_PROTOC
 
 RequestHeader = lambda v: b''.join(
     [Byte(chr(v[0])), Integer(v[1])]
-) if len(v) is 2 else b''.join(
+) if len(v) == 2 else b''.join(
     [Byte(chr(v[0])), Integer(v[1]), Bytes(v[2])]
 )
+
+
+# compiled requests
+
+# variable sized values bigger than this are not copied into the
+# request buffer but written as a buffer of their own
+SCATTER_AT = 1 << 14
+
+_FIXED = {
+    Boolean: '?',
+    Byte: 'B',
+    Char: 'c',
+    Short: 'h',
+    Integer: 'i',
+    Long: 'q'
+}
+
+_INTRODUCTION = Introduction(None)
+
+
+class Nested:
+    """
+    A run of fields sent as one length prefixed byte array,
+    e.g. the payload of a command.
+    """
+    def __init__(self, *fields):
+        self.fields = fields
+
+
+class Request:
+    """
+    # Request
+    Precompiled layout of one operation.
+
+    The layout is compiled once into packing steps:
+    consecutive fixed size fields (including the length prefixes of
+    strings and byte arrays) share one struct.Struct, each followed
+    by the string or byte array after them, and the parts are joined
+    into one bytearray.
+    Values bigger than SCATTER_AT are not copied but passed on as
+    separate buffers for the socket's scatter write (writelines).
+
+    Usage:
+        DB_EXIST_REQUEST = Request(DB_EXIST, String, String)
+        buffers = DB_EXIST_REQUEST.encode(session_id, auth_token, db_name, 'plocal')
+        await sock.send(*buffers)
+
+    Requests with token=False are sent before a session exists
+    (connect, open db): their header is the operation and session -1.
+    """
+    def __init__(self, op: int, *fields, token: bool = True):
+        self.op = op
+        self.token = token
+        self.fields = fields
+        self._compile()
+
+    def _compile(self):
+        # the fixed size values of a request are picked out of one list:
+        # session_id, the auth token, the values, the data lengths, the
+        # group sizes and the constants. Sources are ('s', 0), ('v', i),
+        # ('n', i), ('g', i) or ('c', value) until they are turned into
+        # indexes of that list.
+        runs = []  # [[(fmt, source), ...], index of the data after it]
+        texts, data = [], []
+        groups, open_groups = [], []
+
+        def fixed(fmt, source):
+            if not runs or runs[-1][1] is not None:
+                runs.append([[], None])
+            runs[-1][0].append((fmt, source))
+            for group in open_groups:
+                groups[group][0] += struct.calcsize('>' + fmt)
+
+        def add_data(arg):
+            # the data follows the run ending with its length prefix
+            fixed('i', ('n', len(data)))
+            runs[-1][1] = len(data)
+            for group in open_groups:
+                groups[group][1].append(len(data))
+            texts.append(arg)
+            data.append(arg)
+
+        def add(fields, args):
+            for field in fields:
+                if field in _FIXED:
+                    if field is Char:
+                        texts.append(2 + len(args))
+                    fixed(_FIXED[field], ('v', len(args)))
+                    args.append(field)
+                elif field is String or field is Bytes:
+                    add_data(2 + len(args))
+                    args.append(field)
+                elif field is Introduction:
+                    fixed(f'{len(_INTRODUCTION)}s', ('c', _INTRODUCTION))
+                elif isinstance(field, Nested):
+                    fixed('i', ('g', len(groups)))
+                    open_groups.append(len(groups))
+                    groups.append([0, []])
+                    add(field.fields, args)
+                    open_groups.pop()
+                else:
+                    raise ValueError(f'{field} can not be compiled')
+
+        args = []
+        if self.token:
+            fixed('B', ('c', self.op))
+            fixed('i', ('s', 0))
+            add_data(1)
+        else:
+            fixed('5s', ('c', Byte(chr(self.op)) + Integer(-1)))
+        add(self.fields, args)
+
+        offsets = {
+            's': 0, 'v': 2, 'n': 2 + len(args),
+            'g': 2 + len(args) + len(data)
+        }
+        consts = []
+        steps = []
+        for run, after in runs:
+            indexes = []
+            for _, (kind, value) in run:
+                if kind == 'c':
+                    indexes.append(offsets['g'] + len(groups) + len(consts))
+                    consts.append(value)
+                else:
+                    indexes.append(offsets[kind] + value)
+            packer = struct.Struct('>' + ''.join(fmt for fmt, _ in run))
+            # itemgetter returns a tuple for two indexes or more
+            pick = operator.itemgetter(*indexes) if len(indexes) > 1 \
+                else _pick_one(indexes[0])
+            if after is not None:
+                after = data[after]
+            steps.append((packer.pack, pick, packer.size, after))
+        self._steps = steps
+        # indexes of the values to encode if they are str
+        self._texts = texts
+        self._data = data
+        self._groups = [
+            (size, [offsets['n'] + member for member in members])
+            for size, members in groups
+        ]
+        self._consts = consts
+        self._fixed_size = sum(size for _, _, size, _ in steps)
+
+    def encode(self, session_id, auth_token, *values)->list:
+        """the request's buffers, a single bytearray unless scattered"""
+        picked = [session_id, auth_token or b'', *values]
+        for index in self._texts:
+            value = picked[index]
+            if value.__class__ is str:
+                picked[index] = value.encode('utf-8')
+        lengths = [len(picked[index]) for index in self._data]
+        picked += lengths
+        for size, members in self._groups:
+            for member in members:
+                size += picked[member]
+            picked.append(size)
+        picked += self._consts
+        parts = []
+        append = parts.append
+        if self._fixed_size + sum(lengths) < SCATTER_AT:
+            # small requests (the usual case) are joined in one go
+            for pack, pick, _, after in self._steps:
+                append(pack(*pick(picked)))
+                if after is not None:
+                    append(picked[after])
+            return [bytearray().join(parts)]
+        # big ones scatter their big values
+        out = []
+        for pack, pick, _, after in self._steps:
+            append(pack(*pick(picked)))
+            if after is None:
+                continue
+            value = picked[after]
+            if len(value) < SCATTER_AT:
+                append(value)
+            else:
+                out.append(bytearray().join(parts))
+                out.append(value)
+                parts.clear()
+        out.append(bytearray().join(parts))
+        return out
+
+
+def _pick_one(index: int):
+    return lambda picked: (picked[index],)
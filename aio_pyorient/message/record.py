@@ -0,0 +1,186 @@
+import struct
+import typing
+
+from aio_pyorient.message.base import BaseHandler, int_packer
+from aio_pyorient.message.constants import (
+    BINARY_SERIALIZER, RECORD_CREATE, RECORD_CREATED, RECORD_DELETED,
+    RECORD_LOAD, RECORD_UPDATED, TX_COMMIT
+)
+from aio_pyorient.message.decoder import ODBDecoder
+from aio_pyorient.message.encoder import (
+    Boolean, Byte, Bytes, Char, Integer, Long, Request, Short, String
+)
+from aio_pyorient.odb_types import ODBRecord, ODBRecordVersion, ODBTxResult
+
+# record create/update/delete modes
+SYNC_MODE = 0
+
+
+class RecordBaseHandler(BaseHandler):
+
+    def skip_collection_changes(self, decoder: ODBDecoder):
+        """
+        count, then per changed ridbag: uuid (2 longs), file id (long),
+        page index (long), page offset (int)
+        """
+        decoder.read_raw(decoder.read_int() * 36)
+
+
+class LoadRecord(RecordBaseHandler):
+    """
+    LoadRecord
+    Loads one record by its rid (op 30), without going through
+    the SQL parser. Returns the ODBRecord, or None if there is none.
+    Records prefetched by the fetch plan are kept with it,
+    see ODBRecord.linked().
+    """
+    request = Request(RECORD_LOAD, Short, Long, String, Boolean, Boolean)
+
+    def __init__(self, client, rid: str, *,
+                 fetch_plan: str='*:0',
+                 ignore_cache: bool=False,
+                 load_tombstones: bool=False,
+                 detach: bool=False,
+                 **kwargs):
+        cluster_id, position = rid.lstrip('#').split(':')
+        super().__init__(
+            client, int(cluster_id), int(position),
+            fetch_plan, ignore_cache, load_tombstones, **kwargs
+        )
+        self._rid = f'#{cluster_id}:{position}'
+        self._detach = detach
+        self._binary = client._serialization_type == BINARY_SERIALIZER
+        self._global_properties = client.schema.global_properties
+
+    def parse_record(self, decoder: ODBDecoder, rid: str, prefetched: dict)->ODBRecord:
+        record = ODBRecord(
+            decoder.read_char(), rid or decoder.read_rid(),
+            decoder.read_int(), decoder.read_view(),
+            binary=self._binary,
+            global_properties=self._global_properties,
+            prefetched=prefetched
+        )
+        if self._detach:
+            record.detach()
+        return record
+
+    def parse_entry(self, decoder: ODBDecoder, prefetched: dict)->tuple:
+        """
+        (status, record): the loaded record (status 1), a record
+        prefetched by the fetch plan or None, status 0 ends the response
+        """
+        status = decoder.read_byte()
+        if status == 0:
+            return status, None
+        if status == 1:
+            return status, self.parse_record(decoder, self._rid, prefetched)
+        marker = decoder.read_short()
+        if marker == -3:
+            decoder.read_rid()
+        elif marker != -2:
+            return status, self.parse_record(decoder, None, prefetched)
+        return status, None
+
+    async def _read(self):
+        # record by record, a big fetch plan is not parsed again per chunk
+        await self.read_header()
+        record = None
+        prefetched = {}
+        while True:
+            entries = await self._sock.decode_many(
+                lambda decoder: self.parse_entry(decoder, prefetched),
+                is_last=_is_last_entry
+            )
+            for status, entry in entries:
+                if status == 0:
+                    return record
+                if status == 1:
+                    record = entry
+                elif entry is not None:
+                    prefetched[entry.id] = entry
+
+
+class CreateRecord(RecordBaseHandler):
+    """
+    CreateRecord
+    Creates one record from its serialized content (op 31),
+    without going through the SQL parser.
+    Returns the record's ODBRecordVersion (rid, version).
+    """
+    request = Request(RECORD_CREATE, Short, Bytes, Char, Byte)
+
+    def __init__(self, client, cluster_id: int, content: bytes, *,
+                 record_type: str='d', **kwargs):
+        super().__init__(
+            client, cluster_id, content, record_type, SYNC_MODE, **kwargs
+        )
+
+    def _parse(self, decoder: ODBDecoder):
+        self.parse_header(decoder)
+        rid = decoder.read_rid()
+        version = decoder.read_int()
+        self.skip_collection_changes(decoder)
+        return ODBRecordVersion(rid, version)
+
+
+# entry marker, operation, cluster id, cluster position, record type
+tx_entry_packer = struct.Struct('>BBhqc')
+# version, content length
+version_length_packer = struct.Struct('>ii')
+
+
+def encode_tx_entries(entries: typing.Iterable)->bytearray:
+    """
+    entries are (operation, cluster id, cluster position, record type,
+    content, version), the list is closed by a 0 byte followed by the
+    (empty) index changes
+    """
+    buf = bytearray()
+    for operation, cluster_id, position, record_type, content, version in entries:
+        buf += tx_entry_packer.pack(
+            1, operation, cluster_id, position, record_type.encode()
+        )
+        if operation == RECORD_CREATED:
+            buf += int_packer.pack(len(content))
+            buf += content
+        elif operation == RECORD_UPDATED:
+            buf += version_length_packer.pack(version, len(content))
+            buf += content
+            buf.append(1)  # content changed
+        elif operation == RECORD_DELETED:
+            buf += int_packer.pack(version)
+    buf.append(0)
+    buf += int_packer.pack(0)
+    return buf
+
+
+class TxCommit(RecordBaseHandler):
+    """
+    TxCommit
+    Commits the operations of a transaction in one request (op 60).
+    Returns an ODBTxResult: created maps the temporary rids of created
+    records to their real ones, versions maps rids to their new version.
+    """
+    request = Request(TX_COMMIT, Integer, Boolean)
+
+    def __init__(self, client, tx_id: int, entries: typing.Iterable, *,
+                 using_log: bool=True, **kwargs):
+        super().__init__(client, tx_id, using_log, **kwargs)
+        self._request.append(encode_tx_entries(entries))
+
+    def _parse(self, decoder: ODBDecoder):
+        self.parse_header(decoder)
+        created = {}
+        for _ in range(decoder.read_int()):
+            temporary = decoder.read_rid()
+            created[temporary] = decoder.read_rid()
+        versions = {}
+        for _ in range(decoder.read_int()):
+            rid = decoder.read_rid()
+            versions[rid] = decoder.read_int()
+        self.skip_collection_changes(decoder)
+        return ODBTxResult(created, versions)
+
+
+def _is_last_entry(entry):
+    return entry[0] == 0
@@ -1,8 +1,13 @@
 from aio_pyorient.message.base import BaseHandler
-from aio_pyorient.message.encoder import Boolean, String, Introduction, RequestHeader
+from aio_pyorient.message.constants import SERVER_CONNECT
+from aio_pyorient.message.encoder import Boolean, String, Introduction, Request
 
 
 class ServerConnect(BaseHandler):
+    request = Request(
+        SERVER_CONNECT, Introduction, String, String, Boolean, Boolean, Boolean,
+        String, String, token=False
+    )
 
     def __init__(
             self, client, user: str, password: str, *,
@@ -12,21 +17,18 @@ class ServerConnect(BaseHandler):
             **kwargs):
         super().__init__(
             client,
-            (RequestHeader, (2, -1)),
-            (Introduction, None),
-            (String, client._id),
-            (String, client._serialization_type),
-            (Boolean, use_token_auth),
-            (Boolean, support_push),
-            (Boolean, collect_stats),
-            (String, user),
-            (String, password),
+            client._id,
+            client._serialization_type,
+            use_token_auth,
+            support_push,
+            collect_stats,
+            user,
+            password,
             **kwargs
         )
 
-    async def _read(self):
-        print('ServerConnect starts reading.')
-        await self.read_header(with_token=False)  # returns status, old session_id, empty byte
-        self._client._session_id = await self.read_int()
-        self._client._auth_token = await self.read_bytes()
+    def _parse(self, decoder):
+        self.parse_header(decoder, with_token=False)  # returns status, old session_id, empty byte
+        self._client._session_id = decoder.read_int()
+        self._client._auth_token = decoder.read_bytes()
         return self._client
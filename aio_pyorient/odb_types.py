@@ -1,119 +1,521 @@
-import io
-import re
-from collections import namedtuple
-from pprint import pprint
+import asyncio
+import time
+import typing
+from collections import OrderedDict, namedtuple
 
-from aio_pyorient.serializer import Boolean, Float, Integer, IntegerList, List, String, StringList, Type
+from aio_pyorient.schema.prop_types import (
+    TYPE_BY_NAME, ODBRecordStream, read_header, read_value
+)
+from aio_pyorient.serializer import Type, index_document, parse_field
 
 ODBCluster = namedtuple('ODBCluster', 'name, id')
 ODBRequestErrorMessage = namedtuple("ODBException", "class_name, message")
+ODBPush = namedtuple('ODBPush', 'type, content')
+ODBRecordVersion = namedtuple('ODBRecordVersion', 'rid, version')
+ODBTxResult = namedtuple('ODBTxResult', 'created, versions')
+ODBQueryPage = namedtuple('ODBQueryPage', 'query_id, results, has_next, stats')
+ODBLiveEvent = namedtuple('ODBLiveEvent', 'operation, token, record')
 
-class ODBRecordData(io.BytesIO):
+class ODBRecordData:
+    """
+    Record payload without copying:
+    a memoryview over the buffer the record was received in.
+    Call detach() to keep a record around after the buffer is gone.
+    """
+    __slots__ = ('_view',)
 
-    def __init__(self, initial: bytes=None):
-        super().__init__(initial)
+    def __init__(self, initial: bytes or memoryview=b''):
+        self._view = memoryview(initial)
 
     @property
     def size(self):
-        return self.__sizeof__()
+        return self._view.nbytes
+
+    @property
+    def view(self):
+        return self._view
+
+    @property
+    def detached(self):
+        return isinstance(self._view.obj, bytes)
+
+    def detach(self):
+        if not self.detached:
+            self._view = memoryview(self._view.tobytes())
+        return self
+
+    def getvalue(self):
+        return self._view.tobytes()
 
     def decode(self):
-        return self.getvalue().decode()
+        return str(self._view, 'utf-8')
+
+    def __bytes__(self):
+        return self._view.tobytes()
+
+    def __len__(self):
+        return self._view.nbytes
 
     def __repr__(self):
-        return f"<ODBRecordData size {self.size} {self.decode()[:8]}...>"
+        return f"<ODBRecordData size {self.size} {str(self._view[:8], 'utf-8', 'replace')}...>"
 
 class ODBRecord:
-    def __init__(self, type, id, version, data):
+    """
+    ODBRecord
+    A record as received: type, id, version and the raw payload.
+
+    Fields are decoded on first access and memoized, the payload is
+    only scanned for the positions of its fields (the header of binary
+    records) to begin with.
+
+    Usage:
+        record['name'], record.get('age', 0), '@class' in record
+        record.to_dict()  # decodes every field
+
+    Binary records (binary=True) need the schema's global_properties
+    to resolve fields stored by global property id.
+    prefetched maps rids to the records sent along with this one
+    (see the fetch plan of Query), linked() looks links up in it.
+    """
+    __slots__ = ('type', 'id', 'version', 'data', '_binary', '_global_properties',
+                 '_prefetched', '_class_name', '_index', '_values')
+
+    def __init__(self, type, id, version, data, *,
+                 binary: bool=False, global_properties: dict=None,
+                 prefetched: dict=None):
         self.type = type
         self.id = id
         self.version = version
         self.data = ODBRecordData(data)
+        self._binary = binary
+        self._global_properties = global_properties
+        self._prefetched = prefetched
+        self._class_name = None
+        self._index = None
+        self._values = None
+
+    def _build_index(self):
+        if self.type != 'd':
+            self._index = {}
+        elif self._binary:
+            stream = ODBRecordStream(self.data.view, self._global_properties)
+            stream.pos = 1  # serializer version
+            self._class_name, fields = read_header(stream)
+            self._index = {name: (pos, prop_type) for name, pos, prop_type in fields}
+        else:
+            self._class_name, self._index = index_document(self.data.getvalue())
+        self._values = {}
+        return self._index
+
+    def _decode(self, span: tuple):
+        if self._binary:
+            pos, prop_type = span
+            if pos == 0 or prop_type is None:
+                return None
+            stream = ODBRecordStream(self.data.view, self._global_properties)
+            return read_value(stream, prop_type, pos)[0]
+        return parse_field(self.data.view, *span)
+
+    @property
+    def class_name(self):
+        if self._index is None:
+            self._build_index()
+        return self._class_name or None
+
+    def keys(self):
+        index = self._index if self._index is not None else self._build_index()
+        return index.keys()
+
+    def __contains__(self, name: str):
+        if name == '@class':
+            return self.class_name is not None
+        return name in self.keys()
+
+    def __getitem__(self, name: str):
+        if name == '@class':
+            return self.class_name
+        values = self._values
+        if values is None:
+            self._build_index()
+            values = self._values
+        try:
+            return values[name]
+        except KeyError:
+            value = values[name] = self._decode(self._index[name])
+            return value
+
+    def get(self, name: str, default=None):
+        if name not in self:
+            return default
+        return self[name]
+
+    def linked(self, name: str, default=None):
+        """
+        The value of field name with its links replaced by the records
+        prefetched with this one, links that were not prefetched
+        stay rids.
+        """
+        value = self.get(name, default)
+        if not self._prefetched:
+            return value
+        return resolve_links(value, self._prefetched)
+
+    def to_dict(self)->dict:
+        result = {'@class': self.class_name} if self.class_name else {}
+        for name in self.keys():
+            result[name] = self[name]
+        return result
+
+    def detach(self):
+        """
+        Copy the payload out of the receive buffer. Records kept past
+        the response they came with should be detached, otherwise they
+        pin the whole buffer in memory.
+        """
+        self.data.detach()
+        return self
 
     def __repr__(self):
         return f'<ODBRecord id={self.id} version={self.version} {self.data.size}>'
 
 
-class ODBClusters(list):
+def resolve_links(value, records: dict):
+    """value with the rids in it replaced by the records they map to"""
+    if isinstance(value, str):
+        return records.get(value, value) if value[:1] == '#' else value
+    if isinstance(value, (list, tuple, set, frozenset)):
+        # records are not hashable, sets become lists
+        return [resolve_links(item, records) for item in value]
+    if isinstance(value, dict):
+        return {key: resolve_links(item, records) for key, item in value.items()}
+    return value
+
+
+class ODBRecordCache:
+    """
+    ODBRecordCache
+    LRU cache of records by rid, meant to be shared by every client
+    of a database (see ODBPool).
+
+    It holds at most max_records records and max_bytes of their
+    payloads, the least recently used are evicted first. Records older
+    than ttl seconds (if given) are treated as missing.
+    put() keeps the newer version of a record, records are detached
+    from their receive buffer on the way in. Cached records are handed
+    out to every caller, treat them as read only.
+
+    Usage:
+        cache = ODBRecordCache(max_records=10000, ttl=60)
+        async with ODBPool(user, password, db_name='db', cache=cache) as pool:
+            ...
+        cache.stats()  # hits, misses, evictions, records, bytes
+    """
+    def __init__(self, *, max_records: int=10000, max_bytes: int=1 << 26,
+                 ttl: float=None, clock=time.monotonic):
+        self._max_records = max_records
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._clock = clock
+        # rid -> (record, stored at), least recently used first
+        self._records = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, rid: str):
+        return rid in self._records
+
+    def get(self, rid: str)->ODBRecord:
+        entry = self._records.get(rid)
+        if entry is not None and self._ttl is not None \
+                and self._clock() - entry[1] > self._ttl:
+            self.invalidate(rid)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._records.move_to_end(rid)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, record: ODBRecord)->ODBRecord:
+        """
+        Cache record, unless a newer version is cached already.
+        Returns the cached record of that version.
+        """
+        entry = self._records.get(record.id)
+        if entry is not None:
+            cached = entry[0]
+            if cached.version > record.version:
+                return cached
+            if cached.version == record.version:
+                self._records.move_to_end(record.id)
+                return cached
+            self.invalidate(record.id)
+        size = record.detach().data.size
+        if size > self._max_bytes:
+            return record
+        self._records[record.id] = (record, self._clock())
+        self._bytes += size
+        while len(self._records) > self._max_records or self._bytes > self._max_bytes:
+            _, (evicted, _) = self._records.popitem(last=False)
+            self._bytes -= evicted.data.size
+            self.evictions += 1
+        return record
+
+    def refresh(self, record: ODBRecord)->ODBRecord:
+        """put record if its rid is cached, returns the record to use"""
+        if record.id in self._records:
+            return self.put(record)
+        return record
+
+    def invalidate(self, rid: str):
+        entry = self._records.pop(rid, None)
+        if entry is not None:
+            self._bytes -= entry[0].data.size
+
+    def invalidate_clusters(self, cluster_ids: typing.Iterable):
+        """drop the cached records of the clusters cluster_ids"""
+        prefixes = tuple(f'#{cluster_id}:' for cluster_id in cluster_ids)
+        for rid in [rid for rid in self._records if rid.startswith(prefixes)]:
+            self.invalidate(rid)
+
+    def clear(self):
+        self._records.clear()
+        self._bytes = 0
+
+    def stats(self)->dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'records': len(self._records),
+            'bytes': self._bytes,
+        }
+
+
+class ODBClusters:
+    """
+    ODBClusters
+    The clusters of a database, indexed by id and by (case insensitive)
+    name. The clusters of a class come from class_clusters, class names
+    mapped to cluster ids (ODBSchema.class_clusters, updated in place).
+    update() applies the cluster list of an open or reload response,
+    only touching the clusters that changed.
+    """
+    def __init__(self, clusters: typing.Iterable=(), class_clusters: dict=None):
+        self._by_id = {}
+        self._by_name = {}
+        self.class_clusters = {} if class_clusters is None else class_clusters
+        self.update(clusters)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, val: int or str):
+        if isinstance(val, str):
+            return val.lower() in self._by_name
+        return val in self._by_id
+
+    def __repr__(self):
+        return f'<ODBClusters {list(self._by_id.values())}>'
+
+    def add(self, cluster: ODBCluster):
+        old = self._by_id.get(cluster.id)
+        if old == cluster:
+            return
+        if old is not None:
+            self.remove(old.id)
+        self._by_id[cluster.id] = cluster
+        self._by_name[cluster.name.lower()] = cluster
+
+    def remove(self, cluster_id: int):
+        cluster = self._by_id.pop(cluster_id)
+        if self._by_name.get(cluster.name.lower()) is cluster:
+            del self._by_name[cluster.name.lower()]
+
+    def update(self, clusters: typing.Iterable, *, replace: bool=False):
+        """
+        Add new and changed clusters.
+        With replace=True clusters missing from clusters are dropped.
+        """
+        clusters = list(clusters)
+        if replace:
+            keep = {cluster.id for cluster in clusters}
+            for cluster_id in [c_id for c_id in self._by_id if c_id not in keep]:
+                self.remove(cluster_id)
+        for cluster in clusters:
+            self.add(cluster)
+        return self
+
+    def clear(self):
+        self._by_id.clear()
+        self._by_name.clear()
+
+    def by_id(self, cluster_id: int)->ODBCluster:
+        return self._by_id[cluster_id]
+
+    def by_name(self, name: str)->ODBCluster:
+        return self._by_name[name.lower()]
+
+    def of_class(self, class_name: str)->list:
+        """ids of the clusters of the class class_name (case insensitive)"""
+        ids = self.class_clusters.get(class_name)
+        if ids is None:
+            lower = class_name.lower()
+            for name, class_ids in self.class_clusters.items():
+                if name.lower() == lower:
+                    ids = class_ids
+                    break
+        return sorted(ids or ())
 
     def get(self, val: int or str)->list:
-        is_id = isinstance(val, int)
-        try:
-            if is_id:
-                return sorted([cl.name for cl in self if cl.id == val])
-            return sorted([cl.id for cl in self if val.lower() in cl.name])
-        except IndexError:
-            raise ValueError(
-                f"no cluster with {'id' if is_id else 'name'} {val}"
-            )
+        """
+        get(id) returns [name], get(name) the ids of the cluster of that
+        name or else of the class of that name
+        """
+        if isinstance(val, int):
+            try:
+                return [self._by_id[val].name]
+            except KeyError:
+                raise ValueError(f"no cluster with id {val}")
+        cluster = self._by_name.get(val.lower())
+        if cluster is not None:
+            return [cluster.id]
+        ids = self.of_class(val)
+        if not ids:
+            raise ValueError(f"no cluster with name {val}")
+        return ids
 
-CLASSES_SPECS = {
-    'abstract': Boolean,
-    'clusterIds': IntegerList,
-    'clusterSelection': String,
-    'customFields': String,
-    'defaultClusterId': Integer,
-    'description': String,
-    'name': String,
-    'overSize': Float,
-    'properties': String,
-    'shortName': String,
-    'strictMode': Boolean,
-    'superClass': String,
-    'superClasses': StringList
-}
+# fields the CSV parser can not type on its own
 PROPS_SPECS = {
-    'collate': String,
-    'customFields': List,
-    'defaultValue': String,
-    'description': String,
-    'globalId': Integer,
-    'mandatory': Boolean,
-    'max': Integer,
-    'min': Integer,
-    'name': String,
-    'notNull': Boolean,
-    'readonly': Boolean,
     'type': Type
 }
-strike_reg = re.compile(r'[_|-]')
-def camel_case(word: str)->str:
-    parts = strike_reg.split(word)
-    return parts[0].lower() + ''.join([p.title() for p in parts[1:]])
-
-class CSVSerializer:
-    _re = {}
-    @classmethod
-    def __init_subclass__(cls, **kwargs):
-        cls._keys = cls.__annotations__.keys()
-        for k in cls._keys:
-            cls._re[k] = re.compile(f",?{camel_case(k)}:").search
-
-glob_props_re = re.compile(r'\(name:"(?P<name>\w+)",type:"(?P<type>\w+)",id:(?P<id>\d+)\)')
-class ODBSchema(CSVSerializer):
-    schema_version: int = 0
-    classes: dict = {}
-    global_properties: dict = {}
-    blob_clusters: dict = {}
-
-    def __init__(self, client):
+
+SCHEMA_RID = '#0:1'
+
+
+class ODBSchema:
+    """
+    ODBSchema
+    Cache of one database's schema (record #0:1), meant to be shared
+    by every client of that database.
+
+    classes maps class names to their definitions, with properties
+    mapped by name, global_properties maps global property ids to
+    (name, PropType) and class_clusters class names to their cluster ids.
+    The dicts are updated in place on refresh, references handed out
+    (e.g. to binary records) stay valid.
+
+    get(client) only reloads the schema when schemaVersion changed,
+    which costs a single field query. A version that can't be fetched
+    counts as unchanged, the last loaded schema is kept.
+    """
+    def __init__(self, client=None, *, loop=None):
         self.client = client
+        self.schema_version = -1
+        self._loaded = False
+        self.classes = {}
+        self.global_properties = {}
+        self.class_clusters = {}
+        self.blob_clusters = []
+        self._lock = asyncio.Lock(loop=loop)
 
-    async def get(self):
-        raw = list(await self.client.execute('select from #0:1'))[0].data.decode()
-        print('ODBSchema result')
-        print(raw)
-        matches = sorted([(*self._re[key](raw).span(), key) for key in self._keys])
-        k_v = {}
-        for i in range(len(matches)-1):
-            k_v[matches[i][2]] = raw[matches[i][1]:matches[i+1][0]]
-        k_v[matches[-1][2]] = raw[matches[-1][1]:]
-        for m in glob_props_re.finditer(k_v['global_properties']):
-            self.global_properties[int(m.group('id'))] = (m.group('name'), m.group('type'))
-        pprint(self.global_properties)
-        pprint(k_v['classes'][2:-2].split('),('))
-        return {}
+    @property
+    def loaded(self):
+        return self._loaded
+
+    async def get(self, client=None):
+        client = client or self.client
+        async with self._lock:
+            if not self.loaded:
+                await self.reload(client)
+            else:
+                version = await self.fetch_version(client)
+                if version is not None and version != self.schema_version:
+                    await self.reload(client)
+        return self
+
+    async def fetch_version(self, client)->int:
+        """the server's schemaVersion, None if it could not be read"""
+        response = await client.execute(f'select schemaVersion from {SCHEMA_RID}')
+        for record in response:
+            # a rejected query returns its error messages
+            if isinstance(record, ODBRecord):
+                return record.get('schemaVersion')
+
+    async def reload(self, client=None):
+        client = client or self.client
+        record = await client.load(SCHEMA_RID)
+        if isinstance(record, ODBRecord):
+            self.load(record)
+        return self
+
+    def load(self, record: ODBRecord or dict):
+        """update the cache from the schema record"""
+        get = record.get
+        classes, global_properties = {}, {}
+        for cls in get('classes') or ():
+            properties = {}
+            for prop in cls.get('properties') or ():
+                properties[prop['name']] = dict(prop, type=Type(prop['type']))
+            classes[cls['name']] = dict(cls, properties=properties)
+        for prop in get('globalProperties') or ():
+            global_properties[prop['id']] = (
+                prop['name'], TYPE_BY_NAME[prop['type'].upper()]
+            )
+        self.classes.clear()
+        self.classes.update(classes)
+        self.global_properties.clear()
+        self.global_properties.update(global_properties)
+        self.class_clusters.clear()
+        self.class_clusters.update(
+            (name, list(cls.get('clusterIds') or ())) for name, cls in classes.items()
+        )
+        self.blob_clusters[:] = get('blobClusters') or ()
+        version = get('schemaVersion')
+        if version is not None:
+            self.schema_version = version
+        self._loaded = True
+        return self
+
+    def subclasses(self, class_name: str)->list:
+        """names of the classes extending class_name, directly or not"""
+        children = {}
+        for name, cls in self.classes.items():
+            for parent in cls.get('superClasses') or (cls.get('superClass'),):
+                children.setdefault(parent, []).append(name)
+        found, todo = [], list(children.get(class_name, ()))
+        while todo:
+            name = todo.pop(0)
+            if name not in found:
+                found.append(name)
+                todo += children.get(name, ())
+        return found
+
+    def clusters_of(self, class_name: str, polymorphic: bool=True)->list:
+        """
+        cluster ids of class_name, with polymorphic those of its
+        subclasses too (like select from class_name)
+        """
+        if class_name not in self.class_clusters:
+            raise KeyError(f'Unknown class {class_name!r}.')
+        names = [class_name]
+        if polymorphic:
+            names += self.subclasses(class_name)
+        clusters = []
+        for name in names:
+            for cluster_id in self.class_clusters.get(name, ()):
+                if cluster_id not in clusters:
+                    clusters.append(cluster_id)
+        return clusters
 
     def __str__(self):
         return f'<ODBSchema {sorted(list(self.classes.keys()))}>'
-
@@ -1,23 +1,165 @@
 import asyncio
+import typing
+from collections import deque
 
 from aio_pyorient.client import ODBClient
-from aio_pyorient.utils import AsyncCtx
+from aio_pyorient.odb_types import ODBRecordCache, ODBSchema
+from aio_pyorient.router import BALANCE_LEAST_OUTSTANDING, ODBNode, ODBRouter
+from aio_pyorient.utils import AsyncCtx, ODBHistogram, ODBSignal, ODBStream
+
+
+class ODBPoolTimeout(asyncio.TimeoutError):
+    pass
+
+
+async def probe_client(client: ODBClient)->bool:
+    """
+    Default validation probe: one cheap round trip
+    for clients with an open database.
+    """
+    if not client.is_ready:
+        return False
+    if client.db_opened:
+        return isinstance(await client.db_size(), int)
+    return True
+
+
+class ODBPoolStats:
+    """
+    ODBPoolStats
+    Counters and timings of one ODBPool, see ODBPool.stats().
+    """
+    def __init__(self):
+        self.acquire_wait = ODBHistogram()
+        self.lease_time = ODBHistogram()
+        self.checkouts = 0
+        self.checkouts_per_sec = 0.0
+        self.created = 0
+        self.evicted = 0
+        self.failed_connects = 0
+        self.timeouts = 0
+        self.high_water = 0
+
+    def snapshot(self)->dict:
+        return {
+            'acquire_wait': self.acquire_wait.snapshot(),
+            'lease_time': self.lease_time.snapshot(),
+            'checkouts': self.checkouts,
+            'checkouts_per_sec': self.checkouts_per_sec,
+            'created': self.created,
+            'evicted': self.evicted,
+            'failed_connects': self.failed_connects,
+            'timeouts': self.timeouts,
+            'high_water': self.high_water,
+        }
+
+
+class _Lease:
+
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._client = None
+
+    async def __aenter__(self):
+        self._client = await self._pool.acquire(timeout=self._timeout)
+        return self._client
+
+    async def __aexit__(self, *exc_args):
+        await self._pool.release(self._client)
 
 
 class ODBPool(AsyncCtx):
+    """
+    ODBPool
+    Keeps between min and max connected clients.
+
+    Usage:
+        async with ODBPool(user, password, db_name='db') as pool:
+            async with pool.lease() as client:
+                await client.execute('select from V')
+
+    setup() connects min clients in parallel. Released clients are
+    reused last in, first out, so the warmest sockets are handed out
+    first and the surplus idles until it is evicted.
+    acquire() waits at most acquire_timeout seconds for a client when
+    max clients are leased, then raises ODBPoolTimeout.
+    Clients idle for more than max_idle seconds (above min) or alive
+    for more than max_lifetime seconds are closed by a reaper task
+    every reap_interval seconds. Clients idle for more than validate_after
+    seconds are checked with probe (a coroutine function getting the
+    client) before they are handed out.
+
+    stats() returns a snapshot of the pool's metrics: histograms of the
+    acquire wait and the lease hold time, checkouts (in total and per
+    second over the last reap interval), created, evicted and failed
+    clients, acquire timeouts and the high-water mark of leased clients.
+    All clients share the pool's schema cache, it is loaded
+    on setup when db_name is given. Pass an ODBRecordCache as cache
+    to share it between the clients as well.
+    Receivers of the on_acquire and on_release signals get the wait and
+    the hold time of every lease as extra payload, on_stats receivers get
+    a snapshot every reap_interval seconds.
+    live_query() subscriptions all share one dedicated client, opened on
+    the first subscription on top of max. It is never leased, size,
+    in_use and available_clients do not count it.
+    With a list of servers (or an ODBRouter) the clients are spread over
+    the nodes the router picks (see ODBRouter for balance), acquire()
+    hands out an idle client of the node the router picks among them.
+    Clients of ejected nodes, or of nodes no longer in the cluster_conf,
+    are closed when they are released or come up idle. The reaper opens
+    a single connection to every ejected node due for its probe, as
+    long as the pool is below max.
+    """
     def __init__(self,
                  user: str, password:str, *,
-                 min: int=5, max: int=-1, db_name:str=None, **kwargs):
+                 min: int=5, max: int=20, db_name:str=None,
+                 acquire_timeout: float=None,
+                 connect_timeout: float=10,
+                 max_idle: float=300,
+                 max_lifetime: float=3600,
+                 validate_after: float=30,
+                 reap_interval: float=10,
+                 probe=probe_client,
+                 cache: ODBRecordCache=None,
+                 servers: typing.Iterable=None,
+                 balance: str=BALANCE_LEAST_OUTSTANDING,
+                 router: ODBRouter=None,
+                 **kwargs):
         super().__init__(**kwargs)
+        if max < min:
+            raise ValueError(f'max ({max}) must not be smaller than min ({min})')
         self.__user, self.__password = user, password
         self._db_name = db_name
         self._min = min
-        if max <= min:
-            max = 30000
         self._max = max
-        self._clients = asyncio.Queue()
-        self._client_count = 0
+        self._acquire_timeout = acquire_timeout
+        self._connect_timeout = connect_timeout
+        self._max_idle = max_idle
+        self._max_lifetime = max_lifetime
+        self._validate_after = validate_after
+        self._reap_interval = reap_interval
+        self._probe = probe
+        # idle clients as (released at, client), the last released on top
+        self._idle = []
+        # leased clients with the time they were handed out
+        self._leased = {}
+        self._created = {}
+        self._waiters = deque()
+        self._connecting = 0
         self._kwargs = kwargs
+        self._stats = ODBPoolStats()
+        self._schema = ODBSchema(loop=self._loop)
+        self._cache = cache
+        if router is None and servers:
+            router = ODBRouter(servers, balance=balance)
+        self._router = router
+        self._rate_mark = (self._loop.time(), 0)
+        self._live_client = None
+        self._live_lock = asyncio.Lock(loop=self._loop)
+        self.on_acquire = ODBSignal(self)
+        self.on_release = ODBSignal(self)
+        self.on_stats = ODBSignal(self)
 
     @property
     def min(self):
@@ -29,61 +171,476 @@ class ODBPool(AsyncCtx):
 
     @property
     def available_clients(self):
-        if self._clients is None:
-            return 0
-        return self._clients.qsize()
+        return len(self._idle)
+
+    @property
+    def in_use(self):
+        return len(self._leased)
 
     @property
     def size(self):
-        return self._client_count
+        return len(self._created)
+
+    @property
+    def schema(self):
+        return self._schema
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def router(self):
+        return self._router
+
+    async def get_schema(self)->ODBSchema:
+        """the shared schema, reloaded if its version changed"""
+        async with self.lease() as client:
+            return await self._schema.get(client)
+
+    async def load_many(self, rids: typing.Iterable, *, connections: int=4,
+                        **kwargs)->list:
+        """
+        Load the records rids split in runs over up to connections
+        leased clients (see ODBClient.load_many), in the order of rids.
+        """
+        rids = list(rids)
+        size = -(-len(rids) // max(1, connections)) or 1
+
+        async def load_run(run):
+            async with self.lease() as client:
+                return await client.load_many(run, **kwargs)
+
+        runs = await asyncio.gather(
+            *(load_run(rids[i:i + size]) for i in range(0, len(rids), size))
+        )
+        return [record for run in runs for record in run]
+
+    def scan(self, clusters: typing.Iterable, *, concurrency: int=4,
+             ordered: bool=False, queue_size: int=1000, **kwargs)->ODBStream:
+        """
+        Stream the records of clusters, one 'select from cluster:<id>'
+        per cluster, run on up to concurrency leased clients at once.
+        Records are yielded as they arrive, with ordered=True cluster
+        by cluster in the order of clusters (later clusters are read
+        ahead, up to queue_size records each).
+        Takes the kwargs of ODBClient.execute.
+        Use it with async with (or aclose() it) when the records may
+        not be consumed to the end, the clients stay leased until then:
+        closing the stream early stops the scan and releases them.
+        """
+        if self.cancelled:
+            raise RuntimeError('ODBPool is shut down.')
+        def stop():
+            scanner.cancel()
+            return scanner
+
+        merged = ODBStream(queue_size, loop=self._loop, on_cancel=stop)
+        scanner = self.spawn(self._scan(
+            merged, list(clusters), concurrency, ordered, queue_size, kwargs
+        ))
+        return merged
 
-    async def acquire(self):
+    async def _scan(self, merged: ODBStream, clusters: list, concurrency: int,
+                    ordered: bool, queue_size: int, kwargs: dict):
+        slots = asyncio.Semaphore(max(1, concurrency), loop=self._loop)
+        outputs = [
+            ODBStream(queue_size, loop=self._loop) if ordered else merged
+            for _ in clusters
+        ]
+        tasks = {}
+
+        def abort(exception, skip=None):
+            merged.close(exception)
+            for index, task in tasks.items():
+                if index != skip:
+                    task.cancel()
+
+        async def scan_cluster(index):
+            output, records = outputs[index], None
+            try:
+                async with self.lease() as client:
+                    records = await client.execute(
+                        f'select from cluster:{clusters[index]}',
+                        stream=True, **kwargs
+                    )
+                    async for record in records:
+                        if not await output.put(record):
+                            break
+                if ordered:
+                    output.close()
+            except asyncio.CancelledError:
+                if ordered:
+                    output.close()
+            except BaseException as err:
+                output.close(err)
+                if not ordered:
+                    abort(err, index)
+            finally:
+                if records is not None and not records.closed:
+                    # let the socket read the rest of the response into the void
+                    records.cancel()
+                slots.release()
+
+        async def launch():
+            for index in range(len(clusters)):
+                await slots.acquire()
+                if merged.closed or merged.cancelled or self.cancelled:
+                    slots.release()
+                    return
+                tasks[index] = self.spawn(scan_cluster(index))
+
+        launcher = self.spawn(launch())
         try:
-            await self._is_ready.wait()
-            client = await self._clients.get()
-            client._is_ready.clear()
-            self.spawn(self._watch_client(client))
-            return client
+            if ordered:
+                for output in outputs:
+                    async for record in output:
+                        if not await merged.put(record):
+                            break
+                    if merged.cancelled:
+                        return
+            await launcher
+            await asyncio.gather(*tasks.values())
+        except BaseException as err:
+            abort(err)
         finally:
-            if self.available_clients is 0:
-                self._is_ready.clear()
-                self.spawn(self._add_client())
+            launcher.cancel()
+            for task in tasks.values():
+                task.cancel()
+            # the workers release their clients as they unwind
+            await asyncio.gather(launcher, *tasks.values(), return_exceptions=True)
+            merged.close()
+
+    async def live_query(self, query: str, **kwargs):
+        """subscribe to query on the pool's live client, see ODBClient.live_query"""
+        if self.cancelled:
+            raise RuntimeError('ODBPool is shut down.')
+        async with self._live_lock:
+            client = self._live_client
+            if client is None or not client.is_ready:
+                self._live_client = None
+                if client is not None:
+                    await self._close_live(client)
+                client = self._live_client = await asyncio.wait_for(
+                    self._connect_client(), self._connect_timeout
+                )
+        return await client.live_query(query, **kwargs)
+
+    async def _close_live(self, client: ODBClient):
+        try:
+            await client.shutdown()
+        except Exception:
+            pass
+
+    def stats(self)->dict:
+        snapshot = self._stats.snapshot()
+        snapshot.update(
+            size=self.size, in_use=self.in_use,
+            available_clients=self.available_clients,
+            waiting=len(self._waiters),
+        )
+        if self._cache is not None:
+            snapshot['cache'] = self._cache.stats()
+        if self._router is not None:
+            snapshot['nodes'] = self._router.stats()
+        return snapshot
+
+    def _emit(self, signal: ODBSignal, extra):
+        if signal._receiver and not self.cancelled:
+            asyncio.ensure_future(signal.send(extra=extra))
+
+    def lease(self, *, timeout: float=None):
+        """
+        async context manager acquiring a client and
+        releasing it on exit
+        """
+        return _Lease(self, timeout)
+
+    async def acquire(self, *, timeout: float=None):
+        if self.cancelled:
+            raise RuntimeError('ODBPool is shut down.')
+        if timeout is None:
+            timeout = self._acquire_timeout
+        started = self._loop.time()
+        deadline = None if timeout is None else started + timeout
+        while True:
+            client = await self._pop_idle()
+            if client is None and len(self._created) + self._connecting < self._max:
+                client = await self._add_client()
+            if client is None:
+                client = await self._wait_for_release(deadline)
+            if client is not None:
+                now = self._loop.time()
+                self._leased[client] = now
+                stats = self._stats
+                stats.checkouts += 1
+                stats.acquire_wait.observe(now - started)
+                if len(self._leased) > stats.high_water:
+                    stats.high_water = len(self._leased)
+                self._emit(self.on_acquire, now - started)
+                return client
+
+    async def release(self, client: ODBClient):
+        """
+        Give a leased client back. Releasing a client twice, or one
+        that was not leased, raises ValueError (after a shutdown it
+        is ignored, the shutdown closed the leased clients).
+        """
+        leased_at = self._leased.pop(client, None)
+        if leased_at is None:
+            if self.cancelled:
+                return
+            raise ValueError(f'{client!r} is not leased from this pool.')
+        held = self._loop.time() - leased_at
+        self._stats.lease_time.observe(held)
+        self._emit(self.on_release, held)
+        await self._put_back(client)
 
-    async def _add_client(self):
-        if self.cancelled or self.size >= self._max:
+    async def _put_back(self, client: ODBClient):
+        if self.cancelled or not client.is_ready or self._expired(client) \
+                or not self._routable(client):
+            await self._remove_client(client)
+            await self._replace_for_waiter()
             return
-        client = ODBClient(**self._kwargs)
-        if self._db_name is None:
-            await client.connect(
-                self.__user, self.__password, **self._kwargs
-            )
+        self._hand_over(client)
+
+    def _hand_over(self, client: ODBClient):
+        """give client to the first live waiter, else put it on the idle stack"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(client)
+                return
+        self._idle.append((self._loop.time(), client))
+
+    async def _replace_for_waiter(self):
+        # a removed client freed its slot, connect a new one for the first waiter
+        waiter = None
+        while self._waiters and waiter is None:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                waiter = None
+        if waiter is None or self.cancelled:
+            return
+        if len(self._created) + self._connecting >= self._max:
+            self._waiters.appendleft(waiter)
+            return
+        try:
+            client = await self._add_client()
+        except Exception as err:
+            if not waiter.done():
+                waiter.set_exception(err)
+            return
+        if waiter.done():
+            self._hand_over(client)
         else:
-            await client.open_db(
-                self._db_name, self.__user, self.__password, **self._kwargs
+            waiter.set_result(client)
+
+    async def _wait_for_release(self, deadline):
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            timeout = None if deadline is None else deadline - self._loop.time()
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # handed over just as the timeout expired
+                return waiter.result()
+            self._stats.timeouts += 1
+            raise ODBPoolTimeout(
+                f'No client available within the acquire timeout '
+                f'({self.in_use} of {self._max} leased).'
             )
-        await client._is_ready.wait()
-        self._clients.put_nowait(client)
-        self._client_count += 1
-        self._is_ready.set()
-        return self
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.spawn(self._put_back(waiter.result()))
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            if waiter.cancelled() and waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    async def _pop_idle(self):
+        now = self._loop.time()
+        while self._idle:
+            released_at, client = self._idle.pop(self._pick_idle())
+            if not client.is_ready or self._expired(client, now) \
+                    or not self._routable(client):
+                await self._remove_client(client)
+                continue
+            if now - released_at > self._validate_after and not await self._validate(client):
+                await self._remove_client(client)
+                continue
+            return client
+
+    def _pick_idle(self)->int:
+        """
+        index of the idle client to hand out next, the last released
+        one of the node the router picks
+        """
+        if self._router is None:
+            return -1
+        nodes = {
+            client.node for _, client in self._idle if self._routable(client)
+        }
+        if not nodes:
+            return -1
+        node = self._router.pick(nodes)
+        for index in range(len(self._idle) - 1, -1, -1):
+            if self._idle[index][1].node is node:
+                return index
+        return -1
+
+    def _routable(self, client)->bool:
+        node = client.node
+        return node is None or (node.healthy and node.member)
+
+    async def _validate(self, client):
+        try:
+            return await asyncio.wait_for(self._probe(client), self._connect_timeout)
+        except Exception:
+            return False
+
+    def _expired(self, client, now: float=None):
+        if now is None:
+            now = self._loop.time()
+        return now - self._created.get(client, now) > self._max_lifetime
 
-    async def _watch_client(self, client):
+    async def _connect_client(self, node: ODBNode=None):
+        client = ODBClient(
+            schema=self._schema, cache=self._cache, router=self._router,
+            node=node, **self._kwargs
+        )
         try:
-            await client._is_ready.wait()
-            if not self.cancelled and self._client_count<=self._max:
-                self._clients.put_nowait(client)
-                self._is_ready.set()
+            if self._db_name is None:
+                response = await client.connect(
+                    self.__user, self.__password, **self._kwargs
+                )
             else:
-                await client.shutdown()
-                self._client_count -= 1
-        except Exception as e:
+                response = await client.open_db(
+                    self._db_name, self.__user, self.__password, **self._kwargs
+                )
+        except BaseException as err:
+            if client.node is not None and not isinstance(err, ConnectionError):
+                # no answer in time, failed connections count on the socket
+                client.node.fail()
+            await client.shutdown()
+            raise
+        if response is not client:
+            await client.shutdown()
+            raise ConnectionError(f'Could not connect client: {response}')
+        return client
+
+    async def _add_client(self, node: ODBNode=None):
+        self._connecting += 1
+        # with a router, failed connections are retried on the other nodes
+        attempts = 1 if self._router is None or node else len(self._router.nodes)
+        try:
+            while True:
+                attempts -= 1
+                try:
+                    client = await asyncio.wait_for(
+                        self._connect_client(node), self._connect_timeout
+                    )
+                    break
+                except Exception as err:
+                    self._stats.failed_connects += 1
+                    if attempts <= 0 or not isinstance(
+                            err, (ConnectionError, asyncio.TimeoutError)):
+                        raise
+        finally:
+            self._connecting -= 1
+        self._created[client] = self._loop.time()
+        self._stats.created += 1
+        return client
+
+    async def _remove_client(self, client):
+        if self._created.pop(client, None) is not None and not self.cancelled:
+            self._stats.evicted += 1
+        try:
+            await client.shutdown()
+        except Exception:
             pass
 
-    async def setup(self):
-        await self.wait_for(
-            *(self._add_client() for _ in range(self._min))
-        )
-        return self
+    async def _probe_node(self, node: ODBNode):
+        if len(self._created) + self._connecting >= self._max \
+                or node not in self._router.due():
+            return
+        self._router.probe(node)
+        try:
+            client = await self._add_client(node)
+        except Exception:
+            # the failed connection ejected the node again
+            return
+        self._hand_over(client)
+
+    async def _fill(self):
+        missing = self._min - len(self._created) - self._connecting
+        if missing <= 0 or self.cancelled:
+            return
+        for result in await asyncio.gather(
+                *(self._add_client() for _ in range(missing)),
+                return_exceptions=True):
+            if isinstance(result, ODBClient):
+                await self._put_back(result)
+
+    async def _reap(self):
+        while not self.cancelled:
+            await asyncio.sleep(self._reap_interval)
+            now = self._loop.time()
+            keep, remove = [], []
+            surplus = len(self._created) - self._min
+            # detached from the pool, releases and leases go on meanwhile
+            idle, self._idle = self._idle, []
+            # oldest releases are at the bottom of the stack
+            for released_at, client in idle:
+                idle_too_long = now - released_at > self._max_idle and surplus > 0
+                if idle_too_long or self._expired(client, now) or not client.is_ready:
+                    surplus -= 1
+                    remove.append(client)
+                else:
+                    keep.append((released_at, client))
+            self._idle[:0] = keep
+            for client in remove:
+                await self._remove_client(client)
+            await self._fill()
+            if self._router is not None:
+                for node in self._router.due():
+                    self.spawn(self._probe_node(node))
+            self._update_rate()
+            self._emit(self.on_stats, self.stats())
+
+    def _update_rate(self):
+        now = self._loop.time()
+        marked_at, checkouts = self._rate_mark
+        if now > marked_at:
+            self._stats.checkouts_per_sec = (
+                (self._stats.checkouts - checkouts) / (now - marked_at)
+            )
+        self._rate_mark = (now, self._stats.checkouts)
+
+    async def _setup(self):
+        await self._fill()
+        if len(self._created) < self._min:
+            raise ConnectionError(
+                f'Could only connect {len(self._created)} of {self._min} clients.'
+            )
+        if self._db_name is not None:
+            await self.get_schema()
+        self.spawn(self._reap())
 
     async def _shutdown(self, *args, **kwargs):
-        self._clients = None
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.cancel()
+        idle, self._idle = self._idle, []
+        await asyncio.gather(
+            *(self._remove_client(client) for _, client in idle),
+            *(self._remove_client(client) for client in list(self._leased))
+        )
+        self._leased.clear()
+        client, self._live_client = self._live_client, None
+        if client is not None:
+            await self._close_live(client)
@@ -0,0 +1,295 @@
+import asyncio
+import random
+import socket
+import time
+import typing
+
+from aio_pyorient.serializer import serialize
+
+
+BALANCE_LEAST_OUTSTANDING = 'least_outstanding'
+BALANCE_LATENCY = 'latency'
+BINARY_LISTENER = 'ONetworkProtocolBinary'
+
+
+def parse_server(server: str or tuple, default_port: int=2424)->tuple:
+    """'host', 'host:port' or (host, port) as (host, port)"""
+    if isinstance(server, str):
+        host, _, port = server.rpartition(':')
+        if not host or not port.isdigit():
+            return server, default_port
+        return host, int(port)
+    host, port = server
+    return host, int(port)
+
+
+def parse_members(cluster_conf: bytes)->list:
+    """
+    (host, port) of the binary listeners of the online members of a
+    distributed configuration (members:[(name:..,status:..,listeners:[
+    (protocol:"ONetworkProtocolBinary",listen:"host:port"),..]),..])
+    """
+    try:
+        if isinstance(cluster_conf, (bytes, bytearray, memoryview)):
+            cluster_conf = bytes(cluster_conf).decode()
+        members = serialize(cluster_conf).get('members') or ()
+    except (ValueError, IndexError):
+        return []
+    servers = []
+    for member in members:
+        if not isinstance(member, dict) or member.get('status', 'ONLINE') != 'ONLINE':
+            continue
+        for listener in member.get('listeners') or ():
+            if not isinstance(listener, dict) or \
+                    listener.get('protocol') != BINARY_LISTENER:
+                continue
+            server = parse_server(listener.get('listen', ''))
+            if server[0] and server[0] != '0.0.0.0' and server not in servers:
+                servers.append(server)
+    return servers
+
+
+async def resolve_host(host: str, loop)->set:
+    """the addresses of host, empty if it does not resolve"""
+    try:
+        infos = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except OSError:
+        return set()
+    return {info[4][0] for info in infos}
+
+
+class ODBNode:
+    """
+    ODBNode
+    One server of the router, with the load and health the router
+    sees: the connections to it, the requests in flight on them, the
+    moving average of their response times and the failures in a row.
+    """
+    __slots__ = (
+        'host', 'port', 'connections', 'outstanding', 'latency',
+        'failures', 'ejected_at', '_router'
+    )
+
+    def __init__(self, router, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self.outstanding = 0
+        self.latency = None
+        self.failures = 0
+        self.ejected_at = None
+        self._router = router
+
+    @property
+    def address(self)->tuple:
+        return self.host, self.port
+
+    @property
+    def healthy(self)->bool:
+        return self.ejected_at is None
+
+    @property
+    def member(self)->bool:
+        return self._router.get(self.address) is self
+
+    def attach(self):
+        """a connection to the node is opened"""
+        self.connections += 1
+
+    def detach(self):
+        """a connection to the node failed or was closed"""
+        self.connections = max(0, self.connections - 1)
+
+    def connected(self, elapsed: float):
+        """a connection was opened within elapsed seconds"""
+        self._router.observe(self, elapsed)
+
+    def begin(self):
+        """a request was sent"""
+        self.outstanding += 1
+
+    def end(self, elapsed: float=None):
+        """a request is done, answered after elapsed seconds or dropped"""
+        self.outstanding = max(0, self.outstanding - 1)
+        if elapsed is not None:
+            self._router.observe(self, elapsed)
+
+    def fail(self):
+        """the connection to the node failed or broke"""
+        self._router.fail(self)
+
+    def __repr__(self):
+        state = 'healthy' if self.healthy else 'ejected'
+        return f'<ODBNode {self.host}:{self.port} {state}>'
+
+
+class ODBRouter:
+    """
+    ODBRouter
+    Picks the server of every new connection among the healthy nodes
+    of a cluster.
+
+    servers are 'host', 'host:port' or (host, port).
+    With balance='least_outstanding' (the default) the node with the
+    fewest requests in flight is picked, ties go to the node with the
+    fewest connections. With balance='latency' nodes are picked at
+    random, weighted by the inverse of their average response time
+    (times their requests in flight plus one). Either way nodes that
+    failed since their last answer come last.
+    A node is ejected after max_failures failures in a row. Once
+    eject_time seconds passed, pick() lets a single connection through
+    to probe it, any answer on that connection takes it back in.
+    update() replaces the nodes with the members of the distributed
+    configuration the server sends (cluster_conf), keeping the state
+    of the nodes still in there. Members are matched to the nodes by
+    port and the addresses the nodes' hosts resolve to, a matched node
+    keeps its host name. update() does no lookups, await resolve()
+    first to look up the hosts (with resolve, once per host).
+    A configuration matching none of the nodes is ignored, its
+    addresses are not the ones the servers are reached by.
+    """
+    def __init__(self, servers: typing.Iterable, *,
+                 balance: str=BALANCE_LEAST_OUTSTANDING,
+                 max_failures: int=3,
+                 eject_time: float=30,
+                 smoothing: float=0.2,
+                 default_port: int=2424,
+                 clock=time.monotonic,
+                 resolve=resolve_host):
+        if balance not in (BALANCE_LEAST_OUTSTANDING, BALANCE_LATENCY):
+            raise ValueError(f'Unknown balance {balance!r}.')
+        self._balance = balance
+        self._max_failures = max_failures
+        self._eject_time = eject_time
+        self._smoothing = smoothing
+        self._default_port = default_port
+        self._clock = clock
+        self._resolve = resolve
+        self._resolved = {}
+        self._nodes = {}
+        for server in servers:
+            address = parse_server(server, default_port)
+            self._nodes.setdefault(address, ODBNode(self, *address))
+        if not self._nodes:
+            raise ValueError('No servers given.')
+
+    @property
+    def nodes(self)->list:
+        return list(self._nodes.values())
+
+    @property
+    def healthy(self)->list:
+        return [node for node in self._nodes.values() if node.healthy]
+
+    def get(self, address: tuple)->ODBNode:
+        return self._nodes.get(address)
+
+    def due(self)->list:
+        """ejected nodes waiting for their probe"""
+        now = self._clock()
+        return [
+            node for node in self._nodes.values()
+            if not node.healthy and now - node.ejected_at >= self._eject_time
+        ]
+
+    def pick(self, nodes: typing.Iterable=None)->ODBNode:
+        """
+        The node for the next connection, among nodes (by default all).
+        Falls back to the node ejected longest ago if none is healthy.
+        """
+        nodes = self.nodes if nodes is None else list(nodes)
+        for node in self.due():
+            if node in nodes:
+                return self.probe(node)
+        healthy = [node for node in nodes if node.healthy]
+        if not healthy:
+            if not nodes:
+                raise ConnectionError('No server to connect to.')
+            return min(nodes, key=lambda node: node.ejected_at)
+        if self._balance == BALANCE_LATENCY and len(healthy) > 1:
+            known = [node.latency for node in healthy if node.latency]
+            # unmeasured nodes get the best weight, so they get measured
+            best = min(known) if known else 1.0
+            return random.choices(healthy, [
+                1 / (
+                    (node.latency or best)
+                    * (node.outstanding + 1) * (node.failures + 1)
+                )
+                for node in healthy
+            ])[0]
+        return min(healthy, key=lambda node: (
+            node.failures, node.outstanding, node.connections
+        ))
+
+    def probe(self, node: ODBNode)->ODBNode:
+        """mark the connection about to probe node, one per eject_time"""
+        node.ejected_at = self._clock()
+        return node
+
+    def observe(self, node: ODBNode, elapsed: float):
+        node.failures = 0
+        node.ejected_at = None
+        if node.latency is None:
+            node.latency = elapsed
+        else:
+            node.latency += self._smoothing * (elapsed - node.latency)
+
+    def fail(self, node: ODBNode):
+        node.failures += 1
+        if node.failures >= self._max_failures or not node.healthy:
+            node.ejected_at = self._clock()
+
+    async def resolve(self, *, loop=None):
+        """look up the addresses of the hosts update() has not seen yet"""
+        loop = loop or asyncio.get_event_loop()
+        hosts = [
+            host for host in {node.host for node in self._nodes.values()}
+            if host not in self._resolved
+        ]
+        found = await asyncio.gather(
+            *(self._resolve(host, loop) for host in hosts), loop=loop
+        )
+        for host, addresses in zip(hosts, found):
+            self._resolved[host] = {host, *addresses}
+
+    def update(self, cluster_conf: bytes or str)->bool:
+        """
+        Take the members of cluster_conf as nodes,
+        False if it names none (the nodes are kept then).
+        """
+        servers = parse_members(cluster_conf)
+        if not servers:
+            return False
+        matched = [self._match(address) for address in servers]
+        if not any(matched):
+            return False
+        nodes = {}
+        for address, node in zip(servers, matched):
+            node = node or ODBNode(self, *address)
+            nodes.setdefault(node.address, node)
+        self._nodes = nodes
+        return True
+
+    def _match(self, address: tuple)->ODBNode:
+        node = self._nodes.get(address)
+        if node is not None:
+            return node
+        host, port = address
+        for node in self._nodes.values():
+            if node.port == port and host in self._addresses(node.host):
+                return node
+
+    def _addresses(self, host: str)->set:
+        return self._resolved.get(host) or {host}
+
+    def stats(self)->dict:
+        return {
+            f'{node.host}:{node.port}': {
+                'healthy': node.healthy,
+                'connections': node.connections,
+                'outstanding': node.outstanding,
+                'latency': node.latency,
+                'failures': node.failures,
+            }
+            for node in self._nodes.values()
+        }
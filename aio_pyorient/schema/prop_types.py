@@ -1,21 +1,216 @@
 """
 prop_types
 """
+import datetime
+import decimal
+import struct
 import typing
-from io import BytesIO
 
-def var_int(stream: BytesIO)->int:
-    result = 0
-    shift = 0
+
+float_packer = struct.Struct(">f")
+double_packer = struct.Struct(">d")
+int_packer = struct.Struct(">i")
+short_packer = struct.Struct(">h")
+long_packer = struct.Struct(">q")
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+EPOCH_DATE = datetime.date(1970, 1, 1)
+
+
+class ODBRecordStream:
+    """
+    Cursor over a record in ORecordSerializerBinary format.
+    buf is a memoryview over the record, pos the offset of the next
+    byte to read. Field pointers in the record are offsets from its
+    first byte, embedded documents share the stream of their record.
+    global_properties maps the ids of the schema's global properties
+    to (name, type) tuples, type being a PropType or its name.
+    """
+    __slots__ = ('buf', 'pos', 'global_properties')
+
+    def __init__(self, initial: bytes or memoryview=b'', global_properties: dict=None):
+        self.buf = memoryview(initial)
+        self.pos = 0
+        self.global_properties = global_properties or {}
+
+    def tell(self)->int:
+        return self.pos
+
+    def seek(self, pos: int):
+        self.pos = pos
+
+    def read(self, length: int)->memoryview:
+        pos = self.pos
+        end = pos + length
+        if end > len(self.buf):
+            raise ValueError('record ends in the middle of a value')
+        self.pos = end
+        return self.buf[pos:end]
+
+
+def read_varint(buf: memoryview, pos: int)->tuple:
+    """
+    Decode the zigzag varint at pos of buf,
+    returns the value and the position after it.
+    Values are 64 bit signed like java longs, at most 10 bytes.
+    """
+    raw = buf[pos]
+    if raw < 0x80:
+        return (raw >> 1) ^ -(raw & 1), pos + 1
+    result = raw & 0x7f
+    shift = 7
     while True:
-        raw = ord(stream.read(1))
-        result |= raw << shift
-        if (raw & 0x80) is 0:
+        pos += 1
+        raw = buf[pos]
+        result |= (raw & 0x7f) << shift
+        if raw < 0x80:
             break
         shift += 7
-    if result % 2 is 1:
-        result = -(result+1)
-    return int(result/2)
+        if shift > 63:
+            raise ValueError('varint longer than 10 bytes')
+    result &= 0xFFFFFFFFFFFFFFFF
+    return (result >> 1) ^ -(result & 1), pos + 1
+
+def read_varints(buf: memoryview, pos: int, count: int)->tuple:
+    """
+    Decode count varints in a row, like read_varint
+    returns them with the position after the last one.
+    """
+    values = []
+    append = values.append
+    for _ in range(count):
+        raw = buf[pos]
+        pos += 1
+        if raw < 0x80:
+            append((raw >> 1) ^ -(raw & 1))
+            continue
+        result = raw & 0x7f
+        shift = 7
+        while True:
+            raw = buf[pos]
+            pos += 1
+            result |= (raw & 0x7f) << shift
+            if raw < 0x80:
+                break
+            shift += 7
+            if shift > 63:
+                raise ValueError('varint longer than 10 bytes')
+        result &= 0xFFFFFFFFFFFFFFFF
+        append((result >> 1) ^ -(result & 1))
+    return values, pos
+
+def var_int(stream: ODBRecordStream)->int:
+    value, stream.pos = read_varint(stream.buf, stream.pos)
+    return value
+
+def read_byte(stream: ODBRecordStream)->int:
+    pos = stream.pos
+    stream.pos = pos + 1
+    return stream.buf[pos]
+
+def read_type(stream: ODBRecordStream):
+    """type byte of a value, -1 stands for null"""
+    type_id = read_byte(stream)
+    if type_id == 0xff:
+        return None
+    return TYPE_MAP[type_id]
+
+def read_int(stream: ODBRecordStream)->int:
+    pos = stream.pos
+    stream.pos = pos + 4
+    return int_packer.unpack_from(stream.buf, pos)[0]
+
+def read_link(stream: ODBRecordStream)->str:
+    (c_id, c_pos), stream.pos = read_varints(stream.buf, stream.pos, 2)
+    return f"#{c_id}:{c_pos}"
+
+def read_value(stream: ODBRecordStream, prop_type, pos: int):
+    """
+    Read the value at pos and return it with the position after it,
+    the stream is left where it was.
+    """
+    cursor = stream.pos
+    stream.pos = pos
+    value = prop_type.serialize(stream)
+    end = stream.pos
+    stream.pos = cursor
+    return value, end
+
+def read_header(stream: ODBRecordStream)->tuple:
+    """
+    Class name and header of a document: (field, pointer, type) entries.
+    A field is either named or the id of a global property.
+    """
+    class_name = String.serialize(stream)
+    fields = []
+    while True:
+        length = var_int(stream)
+        if length == 0:
+            return class_name, fields
+        if length > 0:
+            name = str(stream.read(length), 'utf-8')
+            pos = read_int(stream)
+            prop_type = read_type(stream)
+        else:
+            try:
+                name, prop_type = stream.global_properties[-length - 1]
+            except KeyError:
+                raise ValueError(
+                    f'unknown global property {-length - 1}, the schema is stale'
+                ) from None
+            if isinstance(prop_type, str):
+                prop_type = TYPE_BY_NAME[prop_type.upper()]
+            pos = read_int(stream)
+            if prop_type is Any:
+                prop_type = read_type(stream)
+        fields.append((name, pos, prop_type))
+
+def deserialize(data: bytes or memoryview, global_properties: dict=None)->dict:
+    """
+    Decode a record in ORecordSerializerBinary format to a dict,
+    the class name goes to '@class'.
+    """
+    stream = ODBRecordStream(data, global_properties)
+    version = read_byte(stream)
+    if version != 0:
+        raise ValueError(f'unknown binary serializer version {version}')
+    return Embedded.serialize(stream)
+
+def read_result_value(stream: ODBRecordStream):
+    """a value of a result: its type as varint (-1 for null), then the value"""
+    type_id = var_int(stream)
+    if type_id == -1:
+        return None
+    prop_type = TYPE_MAP[type_id]
+    if prop_type is Embedded:
+        return read_result(stream)
+    if prop_type is EmbeddedList or prop_type is EmbeddedSet:
+        items = [read_result_value(stream) for _ in range(var_int(stream))]
+        if prop_type is EmbeddedSet:
+            try:
+                return set(items)
+            except TypeError:
+                return items
+        return items
+    if prop_type is EmbeddedMap:
+        result = {}
+        for _ in range(var_int(stream)):
+            key = String.serialize(stream)
+            result[key] = read_result_value(stream)
+        return result
+    return prop_type.serialize(stream)
+
+def read_result(stream: ODBRecordStream)->dict:
+    """
+    A projection (query result that is not a record) in the network
+    result format: field count, then name, type and value of each field.
+    Values are stored inline, in the binary record format.
+    """
+    result = {}
+    for _ in range(var_int(stream)):
+        name = String.serialize(stream)
+        result[name] = read_result_value(stream)
+    return result
 
 class PropType:
     attr_def = {
@@ -44,97 +239,225 @@ class PropType:
 
 
 class Any(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream):
+        prop_type = read_type(stream)
+        if prop_type is None:
+            return None
+        return prop_type.serialize(stream)
 
 class Binary(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->bytes:
+        length = var_int(stream)
+        return stream.read(length).tobytes()
 
 class Boolean(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->bool:
+        return read_byte(stream) == 1
 
 class Byte(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->int:
+        value = read_byte(stream)
+        return value - 0x100 if value > 0x7f else value
 
 class Custom(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->bytes:
+        return Binary.serialize(stream)
 
 class Date(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->datetime.date:
+        return EPOCH_DATE + datetime.timedelta(days=var_int(stream))
 
 class DateTime(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->datetime.datetime:
+        return EPOCH + datetime.timedelta(milliseconds=var_int(stream))
 
 class Decimal(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->decimal.Decimal:
+        scale, length = read_int(stream), read_int(stream)
+        unscaled = int.from_bytes(stream.read(length), 'big', signed=True)
+        return decimal.Decimal(unscaled).scaleb(-scale)
 
 class Double(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->float:
+        pos = stream.pos
+        stream.pos = pos + 8
+        return double_packer.unpack_from(stream.buf, pos)[0]
 
 class Embedded(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->dict:
+        """
+        read_header, then the values the header points to
+        """
+        result = {}
+        class_name, fields = read_header(stream)
+        if class_name:
+            result['@class'] = class_name
+        end = 0
+        for name, pos, prop_type in fields:
+            if pos == 0 or prop_type is None:
+                result[name] = None
+                continue
+            result[name], value_end = read_value(stream, prop_type, pos)
+            end = max(end, value_end)
+        if end > stream.pos:
+            stream.pos = end
+        return result
 
 class EmbeddedMap(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->dict:
+        result = {}
+        end = 0
+        for _ in range(var_int(stream)):
+            key = read_type(stream).serialize(stream)
+            pos = read_int(stream)
+            prop_type = read_type(stream)
+            if pos == 0 or prop_type is None:
+                result[key] = None
+                continue
+            result[key], value_end = read_value(stream, prop_type, pos)
+            end = max(end, value_end)
+        if end > stream.tell():
+            stream.seek(end)
+        return result
 
 class EmbeddedList(PropType):
 
     @staticmethod
-    def serialize(stream: BytesIO)->list:
+    def serialize(stream: ODBRecordStream)->list:
         length = var_int(stream)
-        item_type = TYPE_MAP[ord(stream.read(1))]
-        result = [item_type.serialize(stream) for _ in range(length)]
+        item_type = read_type(stream)
+        if item_type in VAR_INT_TYPES:
+            result, stream.pos = read_varints(stream.buf, stream.pos, length)
+            return result
+        if item_type is not Any:
+            return [item_type.serialize(stream) for _ in range(length)]
+        # every item comes with its own type
+        result = []
+        append = result.append
+        buf = stream.buf
+        for _ in range(length):
+            type_id = buf[stream.pos]
+            stream.pos += 1
+            if type_id in VAR_INT_TYPE_IDS:
+                value, stream.pos = read_varint(buf, stream.pos)
+                append(value)
+            elif type_id == 0xff:
+                append(None)
+            else:
+                append(TYPE_MAP[type_id].serialize(stream))
         return result
 
 class EmbeddedSet(PropType):
     @staticmethod
-    def serialize(stream: BytesIO)->set:
-        return set(EmbeddedList.serialize(stream))
+    def serialize(stream: ODBRecordStream)->set or list:
+        items = EmbeddedList.serialize(stream)
+        try:
+            return set(items)
+        except TypeError:
+            # embedded documents and collections are not hashable
+            return items
 
 class Float(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->float:
+        pos = stream.pos
+        stream.pos = pos + 4
+        return float_packer.unpack_from(stream.buf, pos)[0]
 
 class Integer(PropType):
     @staticmethod
-    def serialize(stream: BytesIO)->int:
+    def serialize(stream: ODBRecordStream)->int:
         value = var_int(stream)
         return value
 
 class Link(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->str:
+        return read_link(stream)
 
 class LinkBag(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->list or dict:
+        """
+        Embedded bags decode to a list of links. Tree based bags live
+        on the server, they decode to a dict pointing to the tree.
+        """
+        config = read_byte(stream)
+        if config & 2:
+            # uuid
+            stream.read(16)
+        if config & 1:
+            size = read_int(stream)
+            buf = stream.read(size * 10)
+            return [
+                f"#{short_packer.unpack_from(buf, pos)[0]}:"
+                f"{long_packer.unpack_from(buf, pos + 2)[0]}"
+                for pos in range(0, size * 10, 10)
+            ]
+        file_id, page_index = struct.unpack_from('>qq', stream.read(16))
+        page_offset, size, changes = struct.unpack_from('>iii', stream.read(12))
+        # pending changes: (short, long) rid, byte type, int value
+        stream.read(changes * 15)
+        return {
+            'file_id': file_id, 'page_index': page_index,
+            'page_offset': page_offset, 'size': size
+        }
 
 class LinkMap(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->dict:
+        result = {}
+        for _ in range(var_int(stream)):
+            key = read_type(stream).serialize(stream)
+            result[key] = read_link(stream)
+        return result
 
 class LinkList(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->list:
+        length = var_int(stream)
+        ids, stream.pos = read_varints(stream.buf, stream.pos, length * 2)
+        return [f"#{ids[i]}:{ids[i + 1]}" for i in range(0, length * 2, 2)]
 
 class LinkSet(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream)->set:
+        return set(LinkList.serialize(stream))
 
 class Long(PropType):
     @staticmethod
-    def serialize(stream: BytesIO)->int:
+    def serialize(stream: ODBRecordStream)->int:
         value = var_int(stream)
         return value
 
 class Short(PropType):
     @staticmethod
-    def serialize(stream: BytesIO)->int:
+    def serialize(stream: ODBRecordStream)->int:
         value = var_int(stream)
         return value
 
 class String(PropType):
     @staticmethod
-    def serialize(stream: BytesIO)->str:
+    def serialize(stream: ODBRecordStream)->str:
         length = var_int(stream)
-        string = stream.read(length).decode()
+        string = str(stream.read(length), 'utf-8')
         return string
 
 class Transient(PropType):
-    pass
+    @staticmethod
+    def serialize(stream: ODBRecordStream):
+        return None
 
 
 TYPE_MAP = {
@@ -163,3 +486,11 @@ TYPE_MAP = {
     22: LinkBag,
     23: Any
 }
+
+TYPE_BY_NAME = {
+    prop_type.__name__.upper(): prop_type for prop_type in TYPE_MAP.values()
+}
+VAR_INT_TYPES = (Integer, Short, Long)
+VAR_INT_TYPE_IDS = frozenset(
+    type_id for type_id, prop_type in TYPE_MAP.items() if prop_type in VAR_INT_TYPES
+)
@@ -1,48 +1,417 @@
 """
 
  serializer
+ One pass parser for records in ORecordDocument2csv format,
+ and dump_value writing values in it.
+ dump_network writes documents in the ORecordSerializerNetworkV37
+ format of protocol 37 requests.
 """
+import base64
+import datetime
+import decimal
 import re
+import struct
 
-from .schema.prop_types import TYPE_MAP
+from .schema.prop_types import EPOCH, EPOCH_DATE, TYPE_MAP
 
 
-key_reg = re.compile(r',?[a-zA-Z0-9_\-]+:')
-float_reg = re.compile(r'-?[0-9]+\.?[0-9]*')
-int_reg = re.compile(r'-?[0-9]+')
-str_reg = re.compile(r'[a-zA-Z]+')
+class_reg = re.compile(r'([A-Za-z_$][\w$\-]*)@')
+atom_reg = re.compile(r'[^,)\]}>]*')
+escape_reg = re.compile(r'\\(.)', re.S)
+atom_match = atom_reg.match
+
+# first characters of values parse_value has to look into
+NESTED = frozenset('"([<{_%')
 
-Key = lambda v: key_reg.search(v).group(0)
-String = lambda v: str_reg.search(v).group(0) if len(v) > 0 else v
-Integer = lambda v: int(int_reg.search(v).group(0)) if len(v) else None
-Float = lambda v: float(v[:-1] if 'f' in v else v)
-Boolean = lambda v: True if v.upper() == 'TRUE' else False
-List = lambda v: v[1:-1].split(', ') if len(v) > 1 else []
-FloatList = lambda v: list(float(x) for x in float_reg.findall(v))
-IntegerList = lambda v: list(int(x) for x in int_reg.findall(v))
-StringList = lambda v: list(x for x in str_reg.findall(v))
 Type = lambda v: TYPE_MAP[int(v)]
 
-def get_key_value_pairs(data, matches, index, specs):
-    key = String(matches[index].group(0))
-    if index is -1:
-        value = data[matches[index].end():]
-    else:
-        value = data[matches[index].end():matches[index + 1].start()]
+# typed number suffixes
+NUMBERS = {
+    'b': int,
+    's': int,
+    'l': int,
+    'f': float,
+    'd': float,
+    'c': decimal.Decimal,
+    't': lambda v: EPOCH + datetime.timedelta(milliseconds=int(v)),
+    'a': lambda v: (EPOCH + datetime.timedelta(milliseconds=int(v))).date(),
+}
+
+
+def parse_atom(token: str):
+    """
+    Unquoted value: boolean, link, or a number with an optional type suffix.
+    """
+    if not token:
+        return None
+    if token[0] == '#':
+        return token
+    if token == 'true':
+        return True
+    if token == 'false':
+        return False
+    convert = NUMBERS.get(token[-1])
     try:
-        value = specs[key](value)
-    except KeyError:
-        pass
-    return (key, value)
-
-def serialize(data: str, specs: dict)->dict:
-    matches = list(key_reg.finditer(data))
-    key_count = len(matches)
-    if key_count:
-        pairs = []
-        for i in range(key_count - 1):
-            pairs.append(get_key_value_pairs(data, matches, i, specs))
-        pairs.append(get_key_value_pairs(data, matches, -1, specs))
-        return dict(pairs)
-    return dict()
+        if convert is not None:
+            return convert(token[:-1])
+        if '.' in token or 'E' in token:
+            return float(token)
+        return int(token)
+    except (ValueError, ArithmeticError):
+        return token
+
+
+def parse_string(text: str, pos: int)->tuple:
+    """pos is at the opening quote"""
+    start = end = pos + 1
+    while True:
+        end = text.index('"', end)
+        backslashes = 0
+        while text[end - 1 - backslashes] == '\\':
+            backslashes += 1
+        if backslashes % 2 == 0:
+            break
+        end += 1
+    value = text[start:end]
+    if '\\' in value:
+        value = escape_reg.sub(r'\1', value)
+    return value, end + 1
+
+
+def parse_value(text: str, pos: int)->tuple:
+    """
+    Parse the value starting at pos,
+    returns it with the position after it.
+    """
+    if pos >= len(text):
+        return None, pos
+    char = text[pos]
+    if char == '"':
+        return parse_string(text, pos)
+    if char == '(':
+        value, pos = parse_document(text, pos + 1, ')')
+        return value, pos + 1
+    if char == '[':
+        return parse_items(text, pos + 1, ']')
+    if char == '<':
+        items, pos = parse_items(text, pos + 1, '>')
+        try:
+            return set(items), pos
+        except TypeError:
+            # embedded documents and collections are not hashable
+            return items, pos
+    if char == '{':
+        return parse_map(text, pos + 1)
+    if char == '_':
+        end = text.index('_', pos + 1)
+        return base64.b64decode(text[pos + 1:end]), end + 1
+    if char == '%':
+        # serialized ridbag
+        end = text.index(';', pos + 1)
+        return base64.b64decode(text[pos + 1:end]), end + 1
+    end = atom_match(text, pos).end()
+    return parse_atom(text[pos:end]), end
+
+
+def parse_items(text: str, pos: int, close: str)->tuple:
+    items = []
+    append = items.append
+    if text[pos] == close:
+        return items, pos + 1
+    while True:
+        if text[pos] in NESTED:
+            value, pos = parse_value(text, pos)
+        else:
+            end = atom_match(text, pos).end()
+            value = parse_atom(text[pos:end])
+            pos = end
+        append(value)
+        char = text[pos]
+        pos += 1
+        if char == close:
+            return items, pos
+        if char != ',':
+            raise ValueError(f'unexpected {char!r} at {pos - 1} in list')
+
+
+def parse_map(text: str, pos: int)->tuple:
+    result = {}
+    if text[pos] == '}':
+        return result, pos + 1
+    while True:
+        key, pos = parse_value(text, pos)
+        if text[pos] != ':':
+            raise ValueError(f'expected ":" at {pos} in map')
+        result[key], pos = parse_value(text, pos + 1)
+        char = text[pos]
+        pos += 1
+        if char == '}':
+            return result, pos
+        if char != ',':
+            raise ValueError(f'unexpected {char!r} at {pos - 1} in map')
+
+
+def parse_document(text: str, pos: int=0, close: str=None)->tuple:
+    """
+    Fields of a document up to close (or the end of text),
+    the class name goes to '@class'.
+    """
+    result = {}
+    length = len(text)
+    match = class_reg.match(text, pos)
+    if match is not None:
+        result['@class'] = match.group(1)
+        pos = match.end()
+    while pos < length:
+        char = text[pos]
+        if char == close:
+            break
+        if char == '"':
+            key, pos = parse_string(text, pos)
+        else:
+            colon = text.index(':', pos)
+            key = text[pos:colon]
+            pos = colon
+        pos += 1
+        # strings and plain values are parsed inline, they are most of them
+        if pos < length and text[pos] in NESTED:
+            if text[pos] == '"':
+                result[key], pos = parse_string(text, pos)
+            else:
+                result[key], pos = parse_value(text, pos)
+        else:
+            end = atom_match(text, pos).end()
+            result[key] = parse_atom(text[pos:end])
+            pos = end
+        if pos < length and text[pos] == ',':
+            pos += 1
+    return result, pos
+
+
+def serialize(data: str, specs: dict=None)->dict:
+    """
+    Parse a record to a dict of typed values.
+    specs maps field names to functions applied to their parsed values.
+    """
+    result = parse_document(data)[0]
+    if specs:
+        for key, spec in specs.items():
+            if result.get(key) is not None:
+                result[key] = spec(result[key])
+    return result
+
+
+# field index over the raw bytes of a record, values are only
+# parsed when asked for
+class_bytes_reg = re.compile(rb'([A-Za-z_$][\w$\-]*)@')
+atom_bytes_match = re.compile(rb'[^,)\]}>]*').match
+nested_bytes_search = re.compile(rb'["()\[\]{}<>]').search
+OPENERS = frozenset(b'([<{')
+CLOSERS = frozenset(b')]>}')
+QUOTE, BACKSLASH, UNDERSCORE, PERCENT, COMMA = b'"\\_%,'
+
+
+def skip_string(data: bytes, pos: int)->int:
+    """pos is at the opening quote, returns the position after the closing one"""
+    end = pos + 1
+    while True:
+        end = data.index(b'"', end)
+        backslashes = 0
+        while data[end - 1 - backslashes] == BACKSLASH:
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return end + 1
+        end += 1
+
+
+def skip_value(data: bytes, pos: int)->int:
+    if pos >= len(data):
+        return pos
+    char = data[pos]
+    if char == QUOTE:
+        return skip_string(data, pos)
+    if char in OPENERS:
+        depth = 0
+        while True:
+            match = nested_bytes_search(data, pos)
+            pos = match.start()
+            char = data[pos]
+            if char == QUOTE:
+                pos = skip_string(data, pos)
+                continue
+            pos += 1
+            if char in OPENERS:
+                depth += 1
+            elif char in CLOSERS:
+                depth -= 1
+                if depth == 0:
+                    return pos
+    if char == UNDERSCORE:
+        return data.index(b'_', pos + 1) + 1
+    if char == PERCENT:
+        return data.index(b';', pos + 1) + 1
+    return atom_bytes_match(data, pos).end()
+
+
+def index_document(data: bytes)->tuple:
+    """
+    Class name and {field: (start, end)} spans of the values
+    of a record, without parsing them.
+    """
+    spans = {}
+    class_name = None
+    pos, length = 0, len(data)
+    match = class_bytes_reg.match(data)
+    if match is not None:
+        class_name = match.group(1).decode()
+        pos = match.end()
+    while pos < length:
+        if data[pos] == QUOTE:
+            end = skip_string(data, pos)
+            key = parse_string(data[pos:end].decode(), 0)[0]
+            pos = end
+        else:
+            end = data.index(b':', pos)
+            key = data[pos:end].decode()
+            pos = end
+        start = pos + 1
+        pos = skip_value(data, start)
+        spans[key] = (start, pos)
+        if pos < length and data[pos] == COMMA:
+            pos += 1
+    return class_name, spans
+
+
+def parse_field(data: bytes or memoryview, start: int, end: int):
+    return parse_value(str(data[start:end], 'utf-8'), 0)[0]
+
+
+# writing values
+MILLISECOND = datetime.timedelta(milliseconds=1)
+# ints outside of the int32 range are sent as longs
+INT_RANGE = range(-2 ** 31, 2 ** 31)
+
+
+def dump_string(value: str)->str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def dump_value(value)->str:
+    """
+    value in ORecordDocument2csv format:
+    strings, numbers, booleans, dates, bytes and nested lists, sets
+    and dicts of them. Records are written as links (their rid).
+    """
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return dump_string(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return str(value) if value in INT_RANGE else f'{value}l'
+    if isinstance(value, float):
+        return f'{value!r}d'
+    if isinstance(value, decimal.Decimal):
+        return f'{value}c'
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return f'{(value - EPOCH) // MILLISECOND}t'
+    if isinstance(value, datetime.date):
+        return f'{(value - EPOCH_DATE) // MILLISECOND}a'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '_' + base64.b64encode(value).decode() + '_'
+    if isinstance(value, dict):
+        return '{' + ','.join(
+            f'{dump_string(str(key))}:{dump_value(item)}' for key, item in value.items()
+        ) + '}'
+    if isinstance(value, (set, frozenset)):
+        return '<' + ','.join(dump_value(item) for item in value) + '>'
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(dump_value(item) for item in value) + ']'
+    rid = getattr(value, 'id', None)
+    if isinstance(rid, str) and rid.startswith('#'):
+        return rid
+    raise TypeError(f'{value!r} can not be serialized')
+
+
+# type ids of the network format, -1 (0xff) stands for null
+NETWORK_NULL = b'\xff'
+double_packer = struct.Struct('>d')
+decimal_head_packer = struct.Struct('>ii')
+
+
+def dump_varint(value: int)->bytes:
+    """value as zigzag varint, like a java long"""
+    value = ((value << 1) ^ (value >> 63)) & 0xFFFFFFFFFFFFFFFF
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def dump_network_string(value: str)->bytes:
+    value = value.encode('utf-8')
+    return dump_varint(len(value)) + value
+
+
+def dump_network_value(value)->bytes:
+    """
+    value in the network format: its type byte, then the value.
+    Takes the values dump_value takes, dicts are written as embedded maps.
+    """
+    if value is None:
+        return NETWORK_NULL
+    if isinstance(value, str):
+        return b'\x07' + dump_network_string(value)
+    if isinstance(value, bool):
+        return b'\x00\x01' if value else b'\x00\x00'
+    if isinstance(value, int):
+        return (b'\x01' if value in INT_RANGE else b'\x03') + dump_varint(value)
+    if isinstance(value, float):
+        return b'\x05' + double_packer.pack(value)
+    if isinstance(value, decimal.Decimal):
+        sign, digits, exponent = value.as_tuple()
+        unscaled = int(''.join(map(str, digits)) or '0') * (-1 if sign else 1)
+        raw = unscaled.to_bytes(unscaled.bit_length() // 8 + 1, 'big', signed=True)
+        return b'\x15' + decimal_head_packer.pack(-exponent, len(raw)) + raw
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return b'\x06' + dump_varint((value - EPOCH) // MILLISECOND)
+    if isinstance(value, datetime.date):
+        return b'\x13' + dump_varint((value - EPOCH_DATE).days)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return b'\x08' + dump_varint(len(value)) + bytes(value)
+    if isinstance(value, dict):
+        return b'\x0c' + dump_varint(len(value)) + b''.join(
+            dump_network_string(str(key)) + dump_network_value(item)
+            for key, item in value.items()
+        )
+    if isinstance(value, (set, frozenset)):
+        return b'\x0b' + dump_varint(len(value)) + b''.join(map(dump_network_value, value))
+    if isinstance(value, (list, tuple)):
+        return b'\x0a' + dump_varint(len(value)) + b''.join(map(dump_network_value, value))
+    rid = getattr(value, 'id', None)
+    if isinstance(rid, str) and rid.startswith('#'):
+        cluster, position = rid[1:].split(':')
+        return b'\x0d' + dump_varint(int(cluster)) + dump_varint(int(position))
+    raise TypeError(f'{value!r} can not be serialized')
+
 
+def dump_network(document: dict, class_name: str='')->bytes:
+    """
+    document in ORecordSerializerNetworkV37 format: class name,
+    field count, then name, type and value of each field
+    """
+    return b''.join([
+        dump_network_string(class_name),
+        dump_varint(len(document)),
+        *(
+            dump_network_string(name) + dump_network_value(value)
+            for name, value in document.items()
+        )
+    ])
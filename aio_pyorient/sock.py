@@ -1,23 +1,139 @@
 import asyncio
-import struct
+import functools
+from collections import deque
 
-from aio_pyorient.message.base import short_packer
-from aio_pyorient.utils import AsyncCtx
+from aio_pyorient.message.base import ODBHandlerError
+from aio_pyorient.message.constants import REQUEST_PUSH
+from aio_pyorient.message.decoder import ODBDecoder, ODBIncompleteFrame
+from aio_pyorient.odb_types import ODBPush
+from aio_pyorient.utils import AsyncCtx, ODBSignal
+
+
+# reading from the transport is paused while more than
+# HIGH_WATER bytes wait in the receive buffer
+HIGH_WATER = 1 << 22
+
+
+def parse_push(decoder: ODBDecoder)->ODBPush:
+    """status (REQUEST_PUSH), session id, push type, content"""
+    decoder.read_byte()
+    decoder.read_int()
+    return ODBPush(decoder.read_byte(), decoder.read_bytes())
+
+
+class ODBProtocol(asyncio.Protocol):
+    """
+    Feeds everything received from the transport into one ODBDecoder.
+    Readers only wait on it when the decoder's buffer ran dry.
+    """
+    def __init__(self, decoder: ODBDecoder, *, loop=None):
+        self._decoder = decoder
+        self._loop = loop
+        self._transport = None
+        self._paused = False
+        self._exception = None
+        self._data_waiter = None
+        self._drain_waiter = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def connection_lost(self, exc):
+        if exc is None:
+            exc = ConnectionResetError('Connection lost')
+        self._exception = exc
+        for waiter in (self._data_waiter, self._drain_waiter):
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(exc)
+
+    def data_received(self, data):
+        self._decoder.feed(data)
+        if not self._paused and self._decoder.available > HIGH_WATER:
+            self._transport.pause_reading()
+            self._paused = True
+        self._wakeup()
+
+    def pause_writing(self):
+        self._drain_waiter = self._loop.create_future()
+
+    def resume_writing(self):
+        waiter, self._drain_waiter = self._drain_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _wakeup(self):
+        waiter, self._data_waiter = self._data_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def write(self, *buffers):
+        self._transport.writelines(buffers)
+
+    async def drain(self):
+        if self._exception is not None:
+            raise self._exception
+        if self._drain_waiter is not None:
+            await self._drain_waiter
+
+    async def wait_for_data(self):
+        if self._exception is not None:
+            raise self._exception
+        if self._paused:
+            self._paused = False
+            self._transport.resume_reading()
+        self._data_waiter = self._loop.create_future()
+        await self._data_waiter
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
 
 
 class ODBSocket(AsyncCtx):
+    """
+    ODBSocket
+    One connection to an OrientDB server.
 
+    Requests are written in the order send is called. A single reader
+    task decodes the responses in the same (FIFO) order and hands each
+    one to the future returned by send.
+    By default one request is in flight at a time. With multiplex=True
+    requests are written back-to-back without waiting for the
+    responses, so concurrent coroutines can share one connection.
+    send(pipelined=True) skips the one request window, for callers
+    bounding their own run of back-to-back requests (e.g. bulk creates).
+    Push frames the server sends on its own, between responses or while
+    the socket is idle, are decoded by the reader task too and sent to
+    the receivers of on_push with an ODBPush as extra payload, in a
+    task of the socket (shutdown cancels it). Receiver errors go to
+    the loop's exception handler.
+    With a node (see ODBRouter) the socket reports its requests, their
+    response times and its failures to it.
+    """
     def __init__(self, *,
                  host: str="localhost", port: int=2424,
+                 multiplex: bool=False,
+                 node=None,
                  **kwargs):
         super().__init__(**kwargs)
+        if node is not None:
+            host, port = node.address
         self._host = host
         self._port = port
-        self._sent = asyncio.Event()
-        self._reader, self._writer = None, None
+        self._node = node
+        self._attached = node is not None
+        if node is not None:
+            node.attach()
+        self._multiplex = multiplex
+        self._window = None if multiplex else asyncio.Semaphore(1, loop=self._loop)
+        self._pending = deque()
+        self._has_pending = asyncio.Event(loop=self._loop)
+        self._decoder = ODBDecoder()
+        self._protocol = None
         self._in_transaction = False
         self._props = None
-        self.spawn(
+        self.on_push = ODBSignal(self)
+        self._connecting = self.spawn(
             self.connect()
         )
 
@@ -29,6 +145,10 @@ class ODBSocket(AsyncCtx):
     def port(self):
         return self._port
 
+    @property
+    def node(self):
+        return self._node
+
     @property
     def connected(self):
         return self._is_ready.is_set()
@@ -37,45 +157,196 @@ class ODBSocket(AsyncCtx):
     def in_transaction(self):
         return self._in_transaction
 
+    @property
+    def multiplex(self):
+        return self._multiplex
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
     async def connect(self, retry: int=0):
+        started = self._loop.time()
         try:
-            self._reader, self._writer = await asyncio.open_connection(
-                self._host, self._port, loop=self._loop
+            _, self._protocol = await self._loop.create_connection(
+                lambda: ODBProtocol(self._decoder, loop=self._loop),
+                self._host, self._port
             )
-            self._sent.set()
-            raw = await self.wait_for(self._reader.read(2), timeout=1)
-            if len(raw) is 2:
-                protocol = short_packer.unpack(raw)[0]
-                self._is_ready.set()
-                return protocol
-            if retry >= 3:
-                raise RuntimeError('Could not connect to Oreintdb server.')
-            retry += 1
-            return await self.connect(retry)
+            try:
+                protocol = await self.wait_for(
+                    self.decode(ODBDecoder.read_short), timeout=1
+                )
+            except asyncio.TimeoutError:
+                self._protocol.close()
+                if retry >= 3:
+                    raise RuntimeError('Could not connect to Oreintdb server.')
+                retry += 1
+                return await self.connect(retry)
+            self.spawn(self._read_responses())
+            self._is_ready.set()
+            if self._attached:
+                self._node.connected(self._loop.time() - started)
+            return protocol
         except Exception as ex:
+            if self._detach():
+                self._node.fail()
             print(f"Exception at sock.connect\n"
                   f"ex: {vars(ex)}")
 
     async def shutdown(self):
+        self._detach()
         self._cancelled.set()
         self._is_ready.clear()
-        if self._writer is not None:
-            self._writer.close()
-        self._reader.set_exception(asyncio.CancelledError())
+        if self._protocol is not None:
+            self._protocol.close()
+        self._fail_pending(ConnectionAbortedError('Socket shut down'))
+        self._has_pending.set()
         self._host = ""
         self._port = 0
 
-    async def send(self, buff):
-        print('sock starts sending')
-        print(vars(self))
-        await self._is_ready.wait()
-        self._sent.clear()
-        self._writer.write(buff)
-        await self._writer.drain()
-        self._sent.set()
-        return len(buff)
-
-    async def recv(self, _len_to_read):
-        await self._sent.wait()
-        buf = await self._reader.readexactly(_len_to_read)
-        return buf
+    async def send(self, *buffers, reader=None, pipelined: bool=False):
+        """
+        Write one request.
+        reader is the coroutine function decoding its response.
+        The reader task calls it once all earlier responses are read
+        and sets its result on the future returned by send.
+        Requests without a reader get no response.
+        Raises ConnectionError if the socket could not connect or its
+        connection broke.
+        """
+        if not self._is_ready.is_set():
+            if self._connecting is not None:
+                await asyncio.shield(self._connecting)
+            if not self._is_ready.is_set():
+                raise ConnectionError(
+                    f'Not connected to {self._host}:{self._port}.'
+                )
+        response = self._loop.create_future()
+        if reader is None:
+            response.set_result(None)
+        else:
+            windowed = self._window is not None and not pipelined
+            if windowed:
+                await self._window.acquire()
+                # the connection may have broken while waiting for the window
+                if not self._is_ready.is_set():
+                    self._window.release()
+                    raise ConnectionError(
+                        f'Not connected to {self._host}:{self._port}.'
+                    )
+            self._pending.append((reader, response, windowed, self._loop.time()))
+            self._has_pending.set()
+            if self._attached:
+                self._node.begin()
+        self._protocol.write(*buffers)
+        await self._protocol.drain()
+        return response
+
+    def _detach(self)->bool:
+        if not self._attached:
+            return False
+        self._attached = False
+        self._node.detach()
+        # requests still pending are no longer counted on the node
+        for _ in self._pending:
+            self._node.end()
+        return True
+
+    def _fail_pending(self, exc):
+        while self._pending:
+            _, response, windowed, _ = self._pending.popleft()
+            if self._attached:
+                self._node.end()
+            if not response.done():
+                response.set_exception(exc)
+            if windowed:
+                # wakes the next sender waiting for the window, to fail
+                self._window.release()
+
+    def _abort(self, exc):
+        # the stream is out of sync, nothing after this can be decoded
+        if self._detach() and not self.cancelled:
+            self._node.fail()
+        self._is_ready.clear()
+        self._fail_pending(exc)
+        if self._protocol is not None:
+            self._protocol.close()
+
+    def _dispatch_push(self, push: ODBPush):
+        if self.on_push._receiver and not self.cancelled:
+            # in a task of its own, receivers may send requests
+            task = self.spawn(self.on_push.send(extra=push))
+            task.add_done_callback(functools.partial(self._push_done, push))
+
+    def _push_done(self, push: ODBPush, task: asyncio.Task):
+        if task.cancelled() or task.exception() is None:
+            return
+        self._loop.call_exception_handler({
+            'message': f'on_push receiver failed on {push.type}',
+            'exception': task.exception(),
+            'push': push,
+        })
+
+    async def _read_responses(self):
+        pending = self._pending
+        while not self.cancelled:
+            try:
+                status = await self.decode(ODBDecoder.peek_byte)
+                if status == REQUEST_PUSH:
+                    self._dispatch_push(await self.decode(parse_push))
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                return self._abort(ex)
+            if not pending:
+                self._has_pending.clear()
+                await self._has_pending.wait()
+                continue
+            reader, response, windowed, sent_at = pending[0]
+            try:
+                result = await reader()
+            except asyncio.CancelledError:
+                raise
+            except ODBHandlerError as err:
+                # the error frame was read completely, the socket is still aligned
+                if not response.done():
+                    response.set_exception(err)
+            except Exception as ex:
+                return self._abort(ex)
+            else:
+                if not response.done():
+                    response.set_result(result)
+            if pending and pending[0][1] is response:
+                pending.popleft()
+                if self._attached:
+                    self._node.end(self._loop.time() - sent_at)
+                if windowed:
+                    self._window.release()
+
+    async def decode(self, parse, *args):
+        """
+        Run parse(decoder, *args) against the receive buffer.
+        Yields to the event loop only when the buffer runs dry,
+        in which case parse is retried from the same offset.
+        """
+        decoder = self._decoder
+        while True:
+            pos = decoder.tell()
+            try:
+                return parse(decoder, *args)
+            except ODBIncompleteFrame:
+                decoder.seek(pos)
+            await self._protocol.wait_for_data()
+
+    async def decode_many(self, parse, count: int=-1, is_last=None):
+        """
+        Like decode, but returns every item that can be parsed from
+        the buffer at once (see ODBDecoder.read_many).
+        """
+        decoder = self._decoder
+        while True:
+            items = decoder.read_many(parse, count, is_last)
+            if items:
+                return items
+            await self._protocol.wait_for_data()
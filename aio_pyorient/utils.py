@@ -1,4 +1,5 @@
 import asyncio
+import bisect
 import concurrent.futures
 import functools
 import typing
@@ -36,6 +37,171 @@ class TaskCreationError(BaseException):
     pass
 
 
+class ODBStream:
+    """
+    ODBStream
+    Async iterator over items a producer task puts in as they arrive.
+
+    The queue between producer and consumer holds at most maxsize
+    items (0 means unbounded), a producer putting into a full stream
+    waits for the consumer.
+    The producer calls close() when done, passing an exception if it
+    failed. The consumer may cancel() the stream, from then on put()
+    drops its items.
+    A consumer that may stop before the end must cancel the stream (or
+    aclose() it), else the producer is held up by the full queue for
+    good. async with does that when the block is left. on_cancel is
+    called on the first cancel(), e.g. to stop the producer's tasks,
+    aclose() waits for the awaitable it may return:
+
+    Usage:
+        async with await client.stream('select from V') as records:
+            async for record in records:
+                if done(record):
+                    break
+    """
+    _END = object()
+
+    def __init__(self, maxsize: int=0, *, loop=None, on_cancel=None):
+        self._queue = asyncio.Queue(maxsize, loop=loop)
+        self._closed = False
+        self._cancelled = False
+        self._exception = None
+        self._on_cancel = on_cancel
+        self._stopping = None
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    async def put(self, item):
+        if self._cancelled:
+            return False
+        await self._queue.put(item)
+        if self._cancelled:
+            # woken by cancel() draining the queue
+            self._drain()
+            return False
+        return True
+
+    def close(self, exception: BaseException=None):
+        if self._closed:
+            return
+        self._closed = True
+        self._exception = exception
+        if not self._queue.full():
+            self._queue.put_nowait(self._END)
+
+    def cancel(self):
+        first = not self._cancelled
+        self._cancelled = True
+        self._drain()
+        self.close()
+        if first and self._on_cancel is not None:
+            self._stopping = self._on_cancel()
+
+    async def aclose(self):
+        """stop consuming, the stream is cancelled unless it was consumed"""
+        if not (self._closed and self._queue.empty()):
+            self.cancel()
+        if self._stopping is not None:
+            await asyncio.gather(self._stopping, return_exceptions=True)
+
+    def _drain(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    def _stop(self):
+        if self._exception is not None:
+            raise self._exception
+        raise StopAsyncIteration
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed and self._queue.empty():
+            self._stop()
+        item = await self._queue.get()
+        if item is self._END:
+            self._stop()
+        return item
+
+
+class ODBHistogram:
+    """
+    ODBHistogram
+    Counts observed durations (in seconds) in fixed buckets.
+
+    observe() is a bisect and two additions, cheap enough for every
+    request. Percentiles are estimated as the upper bound of the
+    bucket they fall into.
+    """
+    BOUNDS = (
+        0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+        0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf')
+    )
+
+    def __init__(self, bounds: tuple=BOUNDS):
+        self._bounds = bounds
+        self._counts = [0] * len(bounds)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def max(self):
+        return self._max
+
+    @property
+    def mean(self):
+        return self._sum / self._count if self._count else 0.0
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._count += 1
+        self._sum += value
+        if value > self._max:
+            self._max = value
+
+    def percentile(self, q: float)->float:
+        if not self._count:
+            return 0.0
+        rank = q * self._count
+        seen = 0
+        for bound, count in zip(self._bounds, self._counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self._max)
+        return self._max
+
+    def snapshot(self)->dict:
+        return {
+            'count': self._count,
+            'sum': self._sum,
+            'mean': self.mean,
+            'max': self._max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': dict(zip(self._bounds, self._counts)),
+        }
+
+
 class AsyncBase:
     WHEN_ALL = asyncio.ALL_COMPLETED
     WHEN_FIRST = asyncio.FIRST_COMPLETED
@@ -118,7 +284,11 @@ class AsyncBase:
         for n,t in self._tasks.items():
             for _task in t:
                 _task.cancel()
-            await self.wait_for(*[task for task in t if not task.done()], timeout=0)
+            try:
+                await self.wait_for(*[task for task in t if not task.done()], timeout=0)
+            except asyncio.TimeoutError:
+                # a single task is still unwinding from its cancellation
+                pass
 
     async def wait_for(self, *futs, rw=asyncio.ALL_COMPLETED, timeout=None):
         self._waiting.set()
@@ -153,6 +323,8 @@ class AsyncBase:
         if not func.__name__ in self._tasks.keys():
             self._tasks[func.__name__] = []
         self._tasks[func.__name__].append(_task)
+        # finished tasks are dropped, short lived ones are spawned often
+        _task.add_done_callback(self._tasks[func.__name__].remove)
         return _task
 
 class AsyncCtx(AsyncBase):
@@ -0,0 +1,117 @@
+"""
+
+ bench_csv
+ Compares the one pass CSV parser with the regex key scanner it replaced,
+ on schema records (#0:1) of growing size.
+
+    python -m benchmarks.bench_csv
+"""
+import re
+import timeit
+
+from aio_pyorient.schema.prop_types import TYPE_MAP
+from aio_pyorient.serializer import serialize
+
+
+key_reg = re.compile(r',?[a-zA-Z0-9_\-]+:')
+float_reg = re.compile(r'-?[0-9]+\.?[0-9]*')
+int_reg = re.compile(r'-?[0-9]+')
+str_reg = re.compile(r'[a-zA-Z]+')
+
+String = lambda v: str_reg.search(v).group(0) if len(v) > 0 else v
+Integer = lambda v: int(int_reg.search(v).group(0)) if len(v) else None
+Float = lambda v: float(v[:-1] if 'f' in v else v)
+Boolean = lambda v: True if v.upper() == 'TRUE' else False
+List = lambda v: v[1:-1].split(', ') if len(v) > 1 else []
+IntegerList = lambda v: list(int(x) for x in int_reg.findall(v))
+StringList = lambda v: list(x for x in str_reg.findall(v))
+Type = lambda v: TYPE_MAP[int(v)]
+
+LEGACY_SPECS = {
+    'abstract': Boolean,
+    'clusterIds': IntegerList,
+    'clusterSelection': String,
+    'customFields': String,
+    'defaultClusterId': Integer,
+    'description': String,
+    'name': String,
+    'overSize': Float,
+    'shortName': String,
+    'strictMode': Boolean,
+    'superClass': String,
+    'superClasses': StringList,
+    'collate': String,
+    'globalId': Integer,
+    'mandatory': Boolean,
+    'notNull': Boolean,
+    'readonly': Boolean,
+    'type': Type
+}
+
+
+def get_key_value_pairs(data, matches, index, specs):
+    key = String(matches[index].group(0))
+    if index == -1:
+        value = data[matches[index].end():]
+    else:
+        value = data[matches[index].end():matches[index + 1].start()]
+    try:
+        value = specs[key](value)
+    except (KeyError, ValueError, AttributeError):
+        pass
+    return (key, value)
+
+
+def legacy_serialize(data: str, specs: dict)->dict:
+    matches = list(key_reg.finditer(data))
+    key_count = len(matches)
+    if key_count:
+        pairs = []
+        for i in range(key_count - 1):
+            pairs.append(get_key_value_pairs(data, matches, i, specs))
+        pairs.append(get_key_value_pairs(data, matches, -1, specs))
+        return dict(pairs)
+    return dict()
+
+
+def schema_record(class_count: int, prop_count: int=8)->str:
+    def prop(c, p):
+        return (
+            f'(name:"prop{p}",type:{p % 23},globalId:{c * prop_count + p},'
+            f'mandatory:false,readonly:false,notNull:{"true" if p % 2 else "false"},'
+            f'min:,max:,regexp:,customFields:,collate:"default",description:)'
+        )
+    classes = ','.join(
+        f'(name:"Class{c}",shortName:,defaultClusterId:{c + 9},'
+        f'clusterIds:[{c + 9},{c + 100}],clusterSelection:"round-robin",'
+        f'overSize:0.0f,strictMode:false,abstract:false,'
+        f'properties:[{",".join(prop(c, p) for p in range(prop_count))}],'
+        f'superClass:"V",superClasses:["V"],description:,customFields:)'
+        for c in range(class_count)
+    )
+    global_properties = ','.join(
+        f'(name:"prop{p}",type:"{TYPE_MAP[p % 23].__name__.upper()}",id:{p})'
+        for p in range(class_count * prop_count)
+    )
+    return (
+        f'schemaVersion:4,classes:[{classes}],'
+        f'globalProperties:[{global_properties}],blobClusters:<>'
+    )
+
+
+def main(number: int=20):
+    for class_count in (10, 100, 500):
+        record = schema_record(class_count)
+        parsed = serialize(record)
+        assert len(parsed['classes']) == class_count
+        t_legacy = min(timeit.repeat(
+            lambda: legacy_serialize(record, LEGACY_SPECS), number=number, repeat=5
+        ))
+        t_parser = min(timeit.repeat(lambda: serialize(record), number=number, repeat=5))
+        print(f"{class_count:4} classes {len(record) / 1024:7.1f}kB  "
+              f"regex {t_legacy / number * 1e3:7.2f}ms  "
+              f"parser {t_parser / number * 1e3:7.2f}ms  x{t_legacy / t_parser:.2f}")
+
+
+if __name__ == '__main__':
+    main()
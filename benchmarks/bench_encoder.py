@@ -0,0 +1,74 @@
+"""
+
+ bench_encoder
+ Compares the compiled requests with the encoder lambdas.
+
+    python -m benchmarks.bench_encoder
+"""
+import timeit
+
+from aio_pyorient.message.constants import DB_COMMAND, OPEN_DB, QUERY_CMD
+from aio_pyorient.message.encoder import (
+    Boolean, Bytes, Char, Integer, Introduction, Nested, Request, RequestHeader, String
+)
+
+
+TOKEN = b'\x01' * 160
+QUERY = "select from V where name = 'aio_pyorient' order by @rid"
+COMMAND_REQUEST = Request(
+    DB_COMMAND, Char, Nested(String, String, Integer, String, Integer)
+)
+OPEN_DB_REQUEST = Request(
+    OPEN_DB, Introduction, String, String, Boolean, Boolean, Boolean,
+    String, String, String, token=False
+)
+
+
+def command_lambdas():
+    payload = b''.join([
+        String(QUERY_CMD), String(QUERY), Integer(25), String('*:0'), Integer(0)
+    ])
+    return b''.join([
+        RequestHeader((DB_COMMAND, 42, TOKEN)), Char('s'), Bytes(payload)
+    ])
+
+
+def command_compiled():
+    return COMMAND_REQUEST.encode(
+        42, TOKEN, 's', QUERY_CMD, QUERY, 25, '*:0', 0
+    )
+
+
+def open_db_lambdas():
+    return b''.join(
+        field_type(value) for field_type, value in (
+            (RequestHeader, (OPEN_DB, -1)), (Introduction, None),
+            (String, ''), (String, 'ORecordDocument2csv'),
+            (Boolean, True), (Boolean, True), (Boolean, True),
+            (String, 'db'), (String, 'user'), (String, 'password')
+        )
+    )
+
+
+def open_db_compiled():
+    return OPEN_DB_REQUEST.encode(
+        -1, b'', '', 'ORecordDocument2csv', True, True, True,
+        'db', 'user', 'password'
+    )
+
+
+def main(number: int=100000):
+    assert b''.join(command_compiled()) == command_lambdas()
+    assert b''.join(open_db_compiled()) == open_db_lambdas()
+    for name, lambdas, compiled in (
+            ('command', command_lambdas, command_compiled),
+            ('open_db', open_db_lambdas, open_db_compiled)):
+        t_lambdas = min(timeit.repeat(lambdas, number=number, repeat=5))
+        t_compiled = min(timeit.repeat(compiled, number=number, repeat=5))
+        print(f"{name:8} lambdas {t_lambdas / number * 1e6:6.2f}us  "
+              f"compiled {t_compiled / number * 1e6:6.2f}us  "
+              f"x{t_lambdas / t_compiled:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+
+ bench_varint
+ Compares the memoryview varint decoders with the BytesIO ones before
+ them: baseline_var_int is var_int as the package shipped it, copied
+ verbatim, bytesio_var_int the BytesIO decoder the memoryview one
+ replaced. The shipped decoder neither masks the continuation bits nor
+ decodes large values exactly, its results are only checked for the
+ single byte values it gets right.
+
+    python -m benchmarks.bench_varint
+"""
+import random
+import timeit
+from io import BytesIO
+
+from aio_pyorient.schema.prop_types import read_varint, read_varints
+
+
+def baseline_var_int(stream: BytesIO)->int:
+    result = 0
+    shift = 0
+    while True:
+        raw = ord(stream.read(1))
+        result |= raw << shift
+        if (raw & 0x80) is 0:
+            break
+        shift += 7
+    if result % 2 is 1:
+        result = -(result+1)
+    return int(result/2)
+
+
+def bytesio_var_int(stream: BytesIO)->int:
+    result = 0
+    shift = 0
+    while True:
+        raw = ord(stream.read(1))
+        result |= (raw & 0x7f) << shift
+        if (raw & 0x80) == 0:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1)
+
+
+def zigzag(n: int)->bytes:
+    n = (n << 1) ^ (n >> 63)
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def main(count: int=10000, number: int=20):
+    rand = random.Random(37)
+    for name, bits in (('small', 6), ('int', 31), ('long', 63)):
+        values = [rand.randrange(-2 ** bits, 2 ** bits) for _ in range(count)]
+        data = b''.join(zigzag(v) for v in values)
+        view = memoryview(data)
+
+        def baseline():
+            stream = BytesIO(data)
+            return [baseline_var_int(stream) for _ in range(count)]
+
+        def bytesio():
+            stream = BytesIO(data)
+            return [bytesio_var_int(stream) for _ in range(count)]
+
+        def single():
+            result, pos = [], 0
+            for _ in range(count):
+                value, pos = read_varint(view, pos)
+                result.append(value)
+            return result
+
+        def batch():
+            return read_varints(view, 0, count)[0]
+
+        assert bytesio() == single() == batch() == values
+        if name == 'small':
+            assert baseline() == values
+        timings = [
+            min(timeit.repeat(func, number=number, repeat=5)) / number / count * 1e9
+            for func in (baseline, bytesio, single, batch)
+        ]
+        print(f"{name:6} baseline {timings[0]:6.1f}ns  bytesio {timings[1]:6.1f}ns  "
+              f"read_varint {timings[2]:6.1f}ns  read_varints {timings[3]:6.1f}ns  "
+              f"x{timings[0] / timings[3]:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+test_cache
+"""
+from types import SimpleNamespace
+
+from aio_pyorient.client import ODBLiveQuery, ODBTransaction, invalidate_writes
+from aio_pyorient.message.constants import CSV_SERIALIZER
+from aio_pyorient.odb_types import (
+    ODBCluster, ODBClusters, ODBRecord, ODBRecordCache, ODBSchema, ODBTxResult
+)
+
+
+def record(rid, version, content=b'V@n:1'):
+    return ODBRecord('d', rid, version, memoryview(bytearray(content)))
+
+
+def test_record_cache_versions():
+    cache = ODBRecordCache()
+    first = cache.put(record('#9:1', 2))
+    assert first.data.detached
+    assert cache.put(record('#9:1', 1)) is first
+    assert cache.put(record('#9:1', 2)) is first
+    newer = cache.put(record('#9:1', 3))
+    assert cache.get('#9:1') is newer
+    assert cache.refresh(record('#9:2', 1)) is not cache.get('#9:2')
+    cache.invalidate('#9:1')
+    assert cache.get('#9:1') is None
+    assert cache.stats() == {
+        'hits': 1, 'misses': 2, 'evictions': 0, 'records': 0, 'bytes': 0
+    }
+
+
+def test_record_cache_bounds():
+    now = [0.0]
+    cache = ODBRecordCache(max_records=2, max_bytes=12, ttl=10, clock=lambda: now[0])
+    cache.put(record('#9:1', 1))
+    cache.put(record('#9:2', 1))
+    cache.get('#9:1')
+    cache.put(record('#9:3', 1))
+    assert '#9:2' not in cache and '#9:1' in cache
+    cache.put(record('#9:4', 1, b'V@name:"long"'))
+    assert '#9:4' not in cache
+    now[0] = 11
+    assert cache.get('#9:1') is None
+    assert len(cache) == 1
+    assert cache.evictions == 1
+
+
+def test_writes_update_cache():
+    cache = ODBRecordCache()
+    schema = ODBSchema()
+    schema.load(ODBRecord('d', '#0:1', 1, (
+        b'schemaVersion:1,classes:[(name:"V",clusterIds:[9],properties:[]),'
+        b'(name:"Person",superClass:"V",clusterIds:[10],properties:[]),'
+        b'(name:"Tag",clusterIds:[11],properties:[])],'
+        b'globalProperties:[],blobClusters:<>'
+    )))
+    client = SimpleNamespace(
+        cache=cache, schema=schema, _serialization_type=CSV_SERIALIZER,
+        clusters=ODBClusters([ODBCluster('tag', 11)])
+    )
+
+    def fill():
+        for rid in ('#9:1', '#10:1', '#11:1', '#11:2'):
+            cache.put(record(rid, 1))
+
+    fill()
+    invalidate_writes(client, 'select from V')
+    invalidate_writes(client, 'INSERT INTO Tag SET n = 2')
+    invalidate_writes(client, 'LIVE SELECT FROM V')
+    assert len(cache) == 4
+    invalidate_writes(client, 'update V set n = 2')
+    assert sorted(cache._records) == ['#11:1', '#11:2']
+    invalidate_writes(client, 'DELETE FROM [#11:1, #9:3]')
+    assert sorted(cache._records) == ['#11:2']
+    fill()
+    invalidate_writes(client, 'update cluster:tag set n = 1')
+    assert sorted(cache._records) == ['#10:1', '#9:1']
+    invalidate_writes(client, 'create edge from #9:1 to #10:1')
+    assert len(cache) == 0
+
+    fill()
+    tx = ODBTransaction(client, 1)
+    tx.update('#9:1', b'V@n:2', version=1)
+    tx.delete('#10:1', version=1)
+    tx._update_cache(cache, ODBTxResult({}, {'#9:1': 2}))
+    assert cache.get('#9:1').version == 2
+    assert cache.get('#9:1')['n'] == 2
+    assert '#10:1' not in cache
+
+
+async def test_unsubscribe_keeps_cache(loop):
+    cache = ODBRecordCache()
+    cache.put(record('#9:1', 1))
+    sent = []
+
+    async def execute(query, **kwargs):
+        sent.append(query)
+        invalidate_writes(client, query)
+
+    client = SimpleNamespace(cache=cache, _live={}, _loop=loop, execute=execute)
+    live = client._live[7] = ODBLiveQuery(client, 'LIVE SELECT FROM V', 7)
+    await live.unsubscribe()
+    assert sent == ['LIVE UNSUBSCRIBE 7']
+    assert live.closed and not client._live
+    assert '#9:1' in cache
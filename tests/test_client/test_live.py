@@ -0,0 +1,41 @@
+"""
+test_live
+"""
+import asyncio
+
+from aio_pyorient.client import parse_live_event
+from aio_pyorient.message.decoder import int_packer, long_packer, short_packer
+from aio_pyorient.odb_types import ODBLiveEvent
+
+
+async def test_live_query(db_client):
+    live = await db_client.live_query('LIVE SELECT FROM V')
+    other = await db_client.live_query('LIVE SELECT FROM E')
+    assert live.token != other.token
+    await db_client.execute('CREATE VERTEX V SET name = "live"')
+    event = await asyncio.wait_for(live.__anext__(), 5)
+    assert event.operation == 'create'
+    assert event.token == live.token
+    assert event.record['name'] == 'live'
+    await live.unsubscribe()
+    await other.unsubscribe()
+    assert live.closed and other.closed
+    assert [event async for event in live] == []
+
+
+def test_parse_live_event():
+    # push content of an update event: 'r', operation, token,
+    # record type, version, rid and content
+    content = (
+        b'r\x01' + int_packer.pack(7) + b'd' + int_packer.pack(3) +
+        short_packer.pack(9) + long_packer.pack(12) +
+        int_packer.pack(10) + b'V@name:"a"'
+    )
+    event = parse_live_event(content)
+    assert event.operation == 'update'
+    assert event.token == 7
+    assert (event.record.id, event.record.version) == ('#9:12', 3)
+    assert event.record['name'] == 'a'
+    assert parse_live_event(b'u' + int_packer.pack(7)) == (
+        ODBLiveEvent('unsubscribe', 7, None)
+    )
@@ -0,0 +1,38 @@
+"""
+test_records
+"""
+
+
+async def test_create_records(db_client):
+    cluster_id = db_client.clusters.of_class('V')[0]
+    contents = (f'V@name:"bulk{i}"'.encode() for i in range(100))
+    created = [
+        result async for result in await db_client.create_records(
+            cluster_id, contents, window=16
+        )
+    ]
+    assert len(created) == 100
+    assert all(rid.startswith(f'#{cluster_id}:') for rid, _ in created)
+    assert len({rid for rid, _ in created}) == 100
+    assert db_client._sock.in_flight == 0
+
+
+async def test_transaction(db_client):
+    cluster_id = db_client.clusters.of_class('V')[0]
+    async with db_client.transaction() as tx:
+        first = tx.create(cluster_id, b'V@name:"tx1"')
+        second = tx.create(cluster_id, b'V@name:"tx2"')
+    assert first.startswith(f'#{cluster_id}:-')
+    created = tx.result.created
+    assert set(created) == {first, second}
+    assert all(rid in tx.result.versions for rid in created.values())
+    assert db_client._sock.in_transaction is False
+
+
+async def test_load(db_client):
+    schema = await db_client.load('#0:1')
+    assert schema.id == '#0:1'
+    assert 'classes' in schema
+    assert await db_client.load('#0:999999') is None
+    records = await db_client.load_many(['#0:1', '#0:999999', '#0:1'], window=2)
+    assert [record and record.id for record in records] == ['#0:1', None, '#0:1']
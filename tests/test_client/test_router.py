@@ -0,0 +1,105 @@
+"""
+test_router
+"""
+import pytest
+
+from aio_pyorient.router import ODBRouter, parse_members, parse_server
+
+
+CLUSTER_CONF = (
+    b'members:[(name:"node1",status:"ONLINE",listeners:['
+    b'(protocol:"ONetworkProtocolBinary",listen:"10.0.0.1:2424"),'
+    b'(protocol:"ONetworkProtocolHttpDb",listen:"10.0.0.1:2480")]),'
+    b'(name:"node2",status:"OFFLINE",listeners:['
+    b'(protocol:"ONetworkProtocolBinary",listen:"10.0.0.2:2424")]),'
+    b'(name:"node3",listeners:['
+    b'(protocol:"ONetworkProtocolBinary",listen:"10.0.0.3:2425")])]'
+)
+
+
+def test_parse_servers():
+    assert parse_server('db1') == ('db1', 2424)
+    assert parse_server('db1:2425') == ('db1', 2425)
+    assert parse_server(('db1', '2425')) == ('db1', 2425)
+    assert parse_members(CLUSTER_CONF) == [('10.0.0.1', 2424), ('10.0.0.3', 2425)]
+    assert parse_members(b'\xff') == []
+
+
+def test_router_balance():
+    router = ODBRouter(['a', 'b:2425'])
+    a, b = router.nodes
+    a.begin()
+    assert router.pick() is b
+    b.begin()
+    b.begin()
+    assert router.pick() is a
+    a.end(0.01)
+    b.end(0.02)
+    b.end(0.02)
+    a.attach()
+    assert router.pick() is b
+    with pytest.raises(ValueError):
+        ODBRouter(['a'], balance='random')
+
+
+def test_router_eject_and_probe():
+    now = [0.0]
+    router = ODBRouter(['a', 'b'], max_failures=2, eject_time=5, clock=lambda: now[0])
+    a, b = router.nodes
+    a.fail()
+    assert a.healthy and router.pick() is b
+    a.fail()
+    assert not a.healthy
+    assert router.pick([a, b]) is b
+    now[0] = 5
+    assert router.due() == [a]
+    # a single connection gets through to probe a
+    assert router.pick() is a
+    assert router.pick() is b
+    a.connected(0.01)
+    assert a.healthy and a.failures == 0
+
+
+def test_router_update():
+    router = ODBRouter(['10.0.0.1', '10.0.0.2'])
+    first = router.get(('10.0.0.1', 2424))
+    assert router.update(CLUSTER_CONF)
+    assert [node.address for node in router.nodes] == [
+        ('10.0.0.1', 2424), ('10.0.0.3', 2425)
+    ]
+    assert router.nodes[0] is first and first.member
+    assert not router.update(b'members:[]')
+    assert len(router.nodes) == 2
+
+
+async def test_router_update_host_names(loop):
+    hosts = {'db1.local': {'10.0.0.1'}, 'db2.local': {'10.0.0.9'}}
+    lookups = []
+
+    async def resolve(host, loop):
+        lookups.append(host)
+        return hosts.get(host, set())
+
+    router = ODBRouter(['db1.local', 'db2.local'], resolve=resolve)
+    db1 = router.get(('db1.local', 2424))
+    # update does no lookups, unresolved hosts only match as they are
+    assert not router.update(CLUSTER_CONF)
+    await router.resolve(loop=loop)
+    assert sorted(lookups) == ['db1.local', 'db2.local']
+    assert router.update(CLUSTER_CONF)
+    # db1 is member 10.0.0.1, db2 left the cluster, 10.0.0.3 joined
+    assert [node.address for node in router.nodes] == [
+        ('db1.local', 2424), ('10.0.0.3', 2425)
+    ]
+    assert router.nodes[0] is db1 and db1.member
+    await router.resolve(loop=loop)
+    assert sorted(lookups) == ['10.0.0.3', 'db1.local', 'db2.local']
+
+    async def resolve_outside(host, loop):
+        return {'203.0.113.7'}
+
+    # addresses only reachable inside the cluster match no node
+    router = ODBRouter(['db.example.com'], resolve=resolve_outside)
+    await router.resolve(loop=loop)
+    assert not router.update(CLUSTER_CONF)
+    assert [node.address for node in router.nodes] == [('db.example.com', 2424)]
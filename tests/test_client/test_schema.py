@@ -3,7 +3,10 @@ test_global_props
 """
 from pprint import pprint
 
-from aio_pyorient.odb_types import ODBSchema
+import pytest
+
+from aio_pyorient.odb_types import ODBRecord, ODBSchema
+from aio_pyorient.schema.prop_types import String
 
 
 async def test_create_db(client):
@@ -25,3 +28,47 @@ async def test_execute(db_client):
     print('\nSCHEMA:')
     pprint(schema)
     assert schema is not None
+
+def test_schema_load():
+    schema = ODBSchema()
+    global_properties = schema.global_properties
+    schema.load(ODBRecord('d', '#0:1', 3, (
+        b'schemaVersion:4,classes:[(name:"V",clusterIds:[9,10],'
+        b'properties:[(name:"name",type:7,globalId:0)])],'
+        b'globalProperties:[(name:"name",type:"STRING",id:0)],blobClusters:<>'
+    )))
+    assert schema.schema_version == 4
+    assert schema.classes['V']['properties']['name']['type'] is String
+    assert schema.class_clusters == {'V': [9, 10]}
+    assert schema.global_properties is global_properties
+    assert global_properties == {0: ('name', String)}
+
+def test_clusters_of():
+    schema = ODBSchema()
+    schema.load(ODBRecord('d', '#0:1', 3, (
+        b'schemaVersion:4,classes:[(name:"V",clusterIds:[9,10],properties:[]),'
+        b'(name:"Person",superClass:"V",clusterIds:[12,10],properties:[]),'
+        b'(name:"Employee",superClasses:["Person"],clusterIds:[13],properties:[])],'
+        b'globalProperties:[],blobClusters:<>'
+    )))
+    assert schema.subclasses('V') == ['Person', 'Employee']
+    assert schema.clusters_of('V') == [9, 10, 12, 13]
+    assert schema.clusters_of('V', polymorphic=False) == [9, 10]
+    assert schema.clusters_of('Employee') == [13]
+    with pytest.raises(KeyError):
+        schema.clusters_of('E')
+
+async def test_schema_version_unknown(loop):
+    schema, reloads = ODBSchema(loop=loop), []
+    schema.load(ODBRecord('d', '#0:1', 3, b'schemaVersion:4,classes:[]'))
+
+    async def reload(client=None):
+        reloads.append(client)
+    async def fetch_version(client):
+        return None
+    schema.reload, schema.fetch_version = reload, fetch_version
+    # a version that can't be fetched keeps the loaded schema
+    assert await schema.get('client') is schema
+    assert reloads == [] and schema.schema_version == 4
+    schema.load(ODBRecord('d', '#0:1', 4, b'classes:[]'))
+    assert schema.loaded and schema.schema_version == 4
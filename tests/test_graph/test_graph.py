@@ -17,3 +17,16 @@ async def test_graph(loop):
         assert graph.classes == graph.schema.classes
         assert 'V' in graph.schema.classes.keys()
         assert 'E' in graph.schema.classes.keys()
+
+
+async def test_scan(loop):
+    async with ODBGraph(TEST_USER, TEST_PASSWORD, TEST_DB, loop=loop) as graph:
+        clusters = graph.schema.clusters_of('OUser')
+        records = [record async for record in graph.scan('OUser', concurrency=2)]
+        assert {record.id.split(':')[0] for record in records} <= {
+            f'#{cluster_id}' for cluster_id in clusters
+        }
+        ordered = [
+            record.id async for record in graph.scan('OUser', ordered=True)
+        ]
+        assert sorted(ordered) == sorted(record.id for record in records)
@@ -42,3 +42,42 @@ async def test_update_command(db_client):
     for item in response:
         print(item)
     assert handler.done
+
+async def test_stream_command(db_client):
+    records = await db_client.execute("select from OUser", stream=True)
+    count = 0
+    async for record in records:
+        assert record.id.startswith('#')
+        count += 1
+    assert records.closed
+    assert count > 0
+
+async def test_async_command_batches(db_client):
+    batches = []
+
+    async def on_batch(records):
+        batches.append(records)
+
+    handler = Query(
+        db_client, "select from OUser", mode='a',
+        callback=on_batch, batch_size=2, queue_size=4
+    )
+    await handler.send()
+    await handler.read()
+    assert handler.done
+    assert batches
+    assert all(0 < len(batch) <= 2 for batch in batches)
+
+async def test_params_command(db_client):
+    response = await db_client.execute(
+        "select from OUser where name = :name", params={'name': 'admin'}
+    )
+    assert [item['name'] for item in response] == ['admin']
+
+async def test_cursor(db_client):
+    pages = []
+    async with db_client.cursor("select from OUser", page_size=1) as cursor:
+        async for page in cursor:
+            pages.append(page)
+    assert pages and all(len(page) == 1 for page in pages)
+    assert cursor.closed
@@ -1,6 +1,7 @@
 from pprint import pprint
 
 from aio_pyorient.message import db
+from aio_pyorient.odb_types import ODBCluster, ODBClusters
 from tests.conftest import TEST_DB, TEST_PASSWORD, TEST_USER
 
 
@@ -42,3 +43,26 @@ async def test_db_record_count(db_client):
     print(f'client: {vars(db_client)}')
     print(f'rec_count: {rec_count}')
     assert rec_count > 0
+
+def test_clusters_index():
+    class_clusters = {'Person': [9, 10]}
+    clusters = ODBClusters([
+        ODBCluster('internal', 0), ODBCluster('person', 9), ODBCluster('person_1', 10)
+    ], class_clusters)
+    assert clusters.get(0) == ['internal']
+    assert clusters.get('internal') == [0]
+    assert clusters.by_name('Person_1').id == 10
+    assert 'Person_1' in clusters
+    assert clusters.of_class('Person') == [9, 10]
+    clusters.update([
+        ODBCluster('internal', 0), ODBCluster('person', 9), ODBCluster('staff', 11),
+        ODBCluster('item_2', 12)
+    ], replace=True)
+    # the schema's clusterIds, not the cluster names, tell a class's clusters
+    class_clusters.update(Person=[11, 9], Item_2=[12])
+    assert 10 not in clusters and 'person_1' not in clusters
+    assert clusters.get('person') == [9]
+    assert clusters.of_class('person') == [9, 11]
+    assert clusters.of_class('Item_2') == [12]
+    assert clusters.get('Item_2') == [12]
+    assert len(clusters) == 4
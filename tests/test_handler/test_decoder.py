@@ -0,0 +1,64 @@
+"""
+
+ test_decoder
+"""
+import pytest
+
+from aio_pyorient.message.decoder import (
+    ODBDecoder, ODBIncompleteFrame, int_packer, long_packer, short_packer
+)
+from aio_pyorient.sock import parse_push
+
+
+def test_read_fields():
+    decoder = ODBDecoder()
+    decoder.feed(b'\x00' + int_packer.pack(7) + int_packer.pack(3) + b'tok')
+    decoder.feed(short_packer.pack(9) + long_packer.pack(12) + b'l')
+    assert decoder.read_byte() == 0
+    assert decoder.read_int() == 7
+    assert decoder.read_bytes() == b'tok'
+    assert decoder.read_rid() == '#9:12'
+    assert decoder.read_char() == 'l'
+    assert decoder.available == 0
+
+
+def test_incomplete_field_keeps_cursor():
+    decoder = ODBDecoder()
+    decoder.feed(int_packer.pack(5) + b'ab')
+    with pytest.raises(ODBIncompleteFrame):
+        decoder.read_string()
+    assert decoder.tell() == 0
+    decoder.feed(b'cde')
+    assert decoder.read_string() == 'abcde'
+
+
+def test_read_many_stops_when_dry():
+    decoder = ODBDecoder()
+    decoder.feed(int_packer.pack(1) + int_packer.pack(2) + b'\x00\x00')
+    assert decoder.read_many(ODBDecoder.read_int) == [1, 2]
+    assert decoder.tell() == 8
+    decoder.feed(b'\x00\x03' + int_packer.pack(4))
+    assert decoder.read_many(ODBDecoder.read_int, 1) == [3]
+    assert decoder.read_many(
+        ODBDecoder.read_int, is_last=lambda value: value == 4
+    ) == [4]
+
+
+def test_views_survive_more_data():
+    decoder = ODBDecoder()
+    decoder.feed(int_packer.pack(3) + b'abc' + int_packer.pack(3) + b'd')
+    view = decoder.read_view()
+    decoder.feed(b'ef')
+    assert decoder.read_view().tobytes() == b'def'
+    assert view.tobytes() == b'abc'
+
+
+def test_push_frame():
+    decoder = ODBDecoder()
+    decoder.feed(b'\x03' + int_packer.pack(7) + b'\x53' + int_packer.pack(2) + b'ok')
+    assert decoder.peek_byte() == 3
+    assert decoder.tell() == 0
+    push = parse_push(decoder)
+    assert push.type == 83
+    assert push.content == b'ok'
+    assert decoder.available == 0
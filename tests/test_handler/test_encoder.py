@@ -0,0 +1,81 @@
+"""
+
+ test_encoder
+"""
+from aio_pyorient.message.command import command_payload, serialize_params
+from aio_pyorient.message.constants import (
+    DB_COMMAND, OPEN_DB, QUERY_CMD, QUERY_SYNC, RECORD_CREATED, RECORD_DELETED,
+    RECORD_UPDATED
+)
+from aio_pyorient.message.encoder import (
+    Boolean, Bytes, Char, Integer, Introduction, Long, Nested, Request,
+    RequestHeader, SCATTER_AT, Short, String
+)
+from aio_pyorient.message.record import encode_tx_entries
+
+
+def test_compiled_matches_lambdas():
+    request = Request(
+        DB_COMMAND, Char, Nested(String, String, Integer, String, Integer)
+    )
+    payload = b''.join([
+        String(QUERY_CMD), String('select from V'), Integer(25),
+        String('*:0'), Integer(0)
+    ])
+    expected = b''.join([
+        RequestHeader((DB_COMMAND, 12, b'token')), Char('s'), Bytes(payload)
+    ])
+    buffers = request.encode(12, b'token', 's', QUERY_CMD, 'select from V', 25, '*:0', 0)
+    assert len(buffers) == 1
+    assert bytes(buffers[0]) == expected
+
+
+def test_compiled_without_token():
+    request = Request(OPEN_DB, Introduction, String, Boolean, token=False)
+    expected = b''.join([
+        RequestHeader((OPEN_DB, -1)), Introduction(None), String('db'), Boolean(True)
+    ])
+    assert b''.join(request.encode(-1, b'', 'db', True)) == expected
+
+
+def test_big_values_are_scattered():
+    request = Request(31, Short, Bytes, Boolean)
+    content = b'x' * SCATTER_AT
+    buffers = request.encode(3, b'token', 9, content, False)
+    assert len(buffers) == 3
+    assert buffers[1] is content
+    assert b''.join(buffers) == b''.join([
+        RequestHeader((31, 3, b'token')), Short(9), Bytes(content), Boolean(False)
+    ])
+
+
+def test_tx_entries():
+    encoded = encode_tx_entries([
+        (RECORD_CREATED, 9, -2, 'd', b'V@', 0),
+        (RECORD_UPDATED, 9, 5, 'd', b'V@a:1', 3),
+        (RECORD_DELETED, 9, 6, 'd', b'', 2),
+    ])
+    assert bytes(encoded) == b''.join([
+        b'\x01\x03', Short(9), Long(-2), Char('d'), Bytes(b'V@'),
+        b'\x01\x01', Short(9), Long(5), Char('d'), Integer(3), Bytes(b'V@a:1'), b'\x01',
+        b'\x01\x02', Short(9), Long(6), Char('d'), Integer(2),
+        b'\x00', Integer(0)
+    ])
+
+
+def test_params_payload():
+    params = {'name': '123', 'link': '#1:2', 'age': 7}
+    head, tail = command_payload(QUERY_SYNC, 'select from V where name = :name', 25, '*:0')
+    serialized = serialize_params(params, QUERY_SYNC)
+    assert head + Bytes(serialized) + tail == b''.join([
+        String(QUERY_SYNC), String('select from V where name = :name'),
+        Integer(25), String('*:0'),
+        Bytes(b'params:{"name":"123","link":"#1:2","age":7}')
+    ])
+    head, tail = command_payload(QUERY_CMD, 'update V set name = ?', 25, '*:0')
+    serialized = serialize_params(['123', '#1:2', 7], QUERY_CMD)
+    assert head + Bytes(serialized) + tail == b''.join([
+        String(QUERY_CMD), String('update V set name = ?'), Boolean(True),
+        Bytes(b'parameters:{"0":"\\"123\\"","1":"\\"#1:2\\"","2":7}'),
+        Boolean(False)
+    ])
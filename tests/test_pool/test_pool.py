@@ -6,25 +6,48 @@ import asyncio
 import random
 from pprint import pprint
 
-from aio_pyorient.pool import ODBPool
+import pytest
+
+from aio_pyorient.pool import ODBPool, ODBPoolTimeout
 from tests.conftest import TEST_USER, TEST_PASSWORD, TEST_DB
 
 async def test_pool():
-    cl_count = random.randint(50, 1500)
-    print(f'test will acquire {cl_count} clients')
+    cl_count = random.randint(50, 150)
+    print(f'test will lease {cl_count} clients')
     async with ODBPool(TEST_USER, TEST_PASSWORD, db_name=TEST_DB) as pool:
         assert pool.min is 5
-        assert pool.max == 30000
+        assert pool.max == 20
         assert pool.available_clients is pool.min
         assert pool.is_ready
-        all_clients = [await pool.acquire() for _ in range(cl_count)]
+        all_clients = []
+        for _ in range(cl_count):
+            async with pool.lease() as client:
+                all_clients.append(client)
         assert all([cl.session_id >= 0 for cl in all_clients])
         assert all([cl._auth_token not in (b'', '', None) for cl in all_clients])
         assert all([cl._sock.connected is True for cl in all_clients])
-        assert len(set(all_clients)) == cl_count
+        # released clients are reused last in, first out
+        assert len(set(all_clients)) == 1
+        assert pool.size == pool.min
     assert pool.done
     assert pool.available_clients is 0
 
+async def test_pool_bounds():
+    with pytest.raises(ValueError):
+        ODBPool(TEST_USER, TEST_PASSWORD, min=5, max=4)
+    async with ODBPool(TEST_USER, TEST_PASSWORD, db_name=TEST_DB,
+                       min=1, max=2, acquire_timeout=0.1) as pool:
+        cl_1, cl_2 = [await pool.acquire() for _ in range(2)]
+        assert pool.in_use == 2
+        with pytest.raises(ODBPoolTimeout):
+            await pool.acquire()
+        await pool.release(cl_2)
+        assert await pool.acquire() is cl_2
+        await pool.release(cl_2)
+        with pytest.raises(ValueError):
+            await pool.release(cl_2)
+        assert pool.available_clients == 1
+
 async def test_pool_parallel(loop):
     async with ODBPool(TEST_USER, TEST_PASSWORD, db_name=TEST_DB, loop=loop) as pool:
         cl_1, cl_2, cl_3 , cl_4 = [await pool.acquire() for _ in range(4)]
@@ -52,3 +75,32 @@ async def test_client_ctx(loop):
     print('results: ')
     pprint(list(res))
     assert res is not None
+
+async def test_pool_stats():
+    async with ODBPool(TEST_USER, TEST_PASSWORD, db_name=TEST_DB, min=2, max=3) as pool:
+        acquired = []
+        async def on_acquire(payload):
+            acquired.append(payload.extra)
+        pool.on_acquire(on_acquire)
+        for _ in range(4):
+            async with pool.lease() as client:
+                await client.db_size()
+        await asyncio.sleep(0)
+        stats = pool.stats()
+    assert stats['created'] == 2
+    assert stats['checkouts'] == 4
+    assert stats['high_water'] == 1
+    assert stats['acquire_wait']['count'] == 4
+    assert stats['lease_time']['count'] == 4
+    assert stats['lease_time']['max'] > 0
+    assert len(acquired) == 4
+
+async def test_pool_live_client():
+    async with ODBPool(TEST_USER, TEST_PASSWORD, db_name=TEST_DB,
+                       min=1, max=1, acquire_timeout=1) as pool:
+        live = await pool.live_query('LIVE SELECT FROM V')
+        # the live client is not taken from the pool's slots
+        assert (pool.size, pool.in_use, pool.available_clients) == (1, 0, 1)
+        async with pool.lease() as client:
+            assert client is not live.client
+        await live.unsubscribe()
@@ -1,15 +1,185 @@
 """
 test_binary
 """
+import datetime
+import decimal
+import struct
+
+import pytest
+
+from aio_pyorient.odb_types import ODBRecord
+from aio_pyorient.schema.prop_types import (
+    ODBRecordStream, deserialize, read_result, read_varint, read_varints
+)
+from aio_pyorient.serializer import dump_network, dump_varint
+
+
+def zigzag(n: int)->bytes:
+    n = (n << 1) ^ (n >> 63)
+    out = bytearray()
+    while True:
+        if n < 0x80:
+            out.append(n)
+            return bytes(out)
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+
+def string(value: str)->bytes:
+    return zigzag(len(value.encode())) + value.encode()
+
+def document(class_name: str, fields: list, base: int)->bytes:
+    """
+    fields are (name or global property id, type id, value) tuples,
+    value is the serialized value, a callable getting its position or None
+    """
+    head_size = len(string(class_name)) + 1
+    for name, type_id, _ in fields:
+        if isinstance(name, int):
+            head_size += len(zigzag(-name - 1)) + 4
+        else:
+            head_size += len(zigzag(len(name))) + len(name) + 5
+    header, values = string(class_name), b''
+    for name, type_id, value in fields:
+        pos = base + head_size + len(values)
+        if callable(value):
+            value = value(pos)
+        if isinstance(name, int):
+            header += zigzag(-name - 1) + struct.pack('>i', 0 if value is None else pos)
+        else:
+            header += string(name) + struct.pack('>ib', 0 if value is None else pos, type_id)
+        values += value or b''
+    return header + b'\x00' + values
+
+
+def test_varint_64_bit():
+    values = [0, -1, 1, 63, -64, 64, 2 ** 31, -2 ** 31, 2 ** 53 + 1, 2 ** 63 - 1, -2 ** 63]
+    data = memoryview(b''.join(zigzag(v) for v in values))
+    pos = 0
+    for value in values:
+        decoded, pos = read_varint(data, pos)
+        assert decoded == value
+    assert pos == len(data)
+    assert read_varints(data, 0, len(values)) == (values, len(data))
+    assert read_varints(data, 0, 0) == ([], 0)
+
+
+def test_binary_record():
+    global_properties = {0: ('name', 'STRING'), 1: ('age', 'INTEGER')}
+    record = b'\x00' + document('Person', [
+        (0, 7, string('ada')),
+        (1, 1, zigzag(-36)),
+        ('big', 3, zigzag(2 ** 62)),
+        ('ok', 0, b'\x01'),
+        ('ratio', 5, struct.pack('>d', 0.25)),
+        ('size', 4, struct.pack('>f', 1.5)),
+        ('born', 6, zigzag(86400000 + 1)),
+        ('day', 19, zigzag(2)),
+        ('price', 21, struct.pack('>ii', 2, 2) + (-1234).to_bytes(2, 'big', signed=True)),
+        ('raw', 8, zigzag(3) + b'abc'),
+        ('friend', 13, zigzag(9) + zigzag(12)),
+        ('friends', 14, zigzag(2) + zigzag(9) + zigzag(1) + zigzag(9) + zigzag(2)),
+        ('tags', 10, zigzag(3) + bytes([23]) + bytes([7]) + string('x')
+                     + b'\xff' + bytes([1]) + zigzag(5)),
+        ('scores', 10, zigzag(3) + bytes([3]) + zigzag(1) + zigzag(-300) + zigzag(2 ** 40)),
+        ('in_E', 22, b'\x01' + struct.pack('>ihq', 1, 11, 3)),
+        ('links', 16, zigzag(1) + bytes([7]) + string('home') + zigzag(10) + zigzag(0)),
+        ('nothing', 7, None),
+        ('address', 9, lambda pos: document('Address', [('city', 7, string('Rome'))], pos)),
+        ('meta', 12, lambda pos: (
+            zigzag(2) + bytes([7]) + string('a') + struct.pack('>ib', pos + 17, 1)
+            + bytes([7]) + string('b') + struct.pack('>ib', 0, 7) + zigzag(7)
+        )),
+        ('after', 7, string('end')),
+    ], 1)
+    result = deserialize(record, global_properties)
+    assert result == {
+        '@class': 'Person',
+        'name': 'ada',
+        'age': -36,
+        'big': 2 ** 62,
+        'ok': True,
+        'ratio': 0.25,
+        'size': 1.5,
+        'born': datetime.datetime(1970, 1, 2, 0, 0, 0, 1000, tzinfo=datetime.timezone.utc),
+        'day': datetime.date(1970, 1, 3),
+        'price': decimal.Decimal('-12.34'),
+        'raw': b'abc',
+        'friend': '#9:12',
+        'friends': ['#9:1', '#9:2'],
+        'tags': ['x', None, 5],
+        'scores': [1, -300, 2 ** 40],
+        'in_E': ['#11:3'],
+        'links': {'home': '#10:0'},
+        'nothing': None,
+        'address': {'@class': 'Address', 'city': 'Rome'},
+        'meta': {'a': 7, 'b': None},
+        'after': 'end',
+    }
+
+
+def test_lazy_binary_record():
+    data = b'\x00' + document('V', [
+        (0, 7, string('ada')), ('n', 1, zigzag(4)), ('none', 7, None)
+    ], 1)
+    record = ODBRecord(
+        'd', '#9:1', 1, memoryview(data),
+        binary=True, global_properties={0: ('name', 'STRING')}
+    )
+    assert record.class_name == 'V'
+    assert record['n'] == 4
+    assert record.get('none', 1) is None
+    assert record.to_dict() == {'@class': 'V', 'name': 'ada', 'n': 4, 'none': None}
+    # a global property missing from the schema is not a missing field
+    stale = ODBRecord('d', '#9:1', 1, memoryview(data), binary=True, global_properties={})
+    with pytest.raises(ValueError):
+        stale.get('n', 0)
+
+
+def test_projection_result():
+    data = b''.join([
+        zigzag(3),
+        string('count'), zigzag(3), zigzag(2 ** 40),
+        string('names'), zigzag(10), zigzag(2), zigzag(7), string('a'), zigzag(-1),
+        string('inner'), zigzag(9), zigzag(1), string('ok'), zigzag(0), b'\x01',
+    ])
+    assert read_result(ODBRecordStream(data)) == {
+        'count': 2 ** 40, 'names': ['a', None], 'inner': {'ok': True}
+    }
+
+
 async def test_binary(binary_db_client):
     response = await binary_db_client.execute("select globalProperties from #0:1")
     for record in response:
-        print("record:")
-        print(record)
-        i = 0
-        while True:
-            next_b = record.data.read(1)
-            if next_b == b'':
-                break
-            print(f'{i}: {next_b} -> ord: {ord(next_b)}' )
-            i += 1
+        result = deserialize(record.data.view)
+        print(result)
+        assert 'globalProperties' in result
+
+
+def test_dump_network():
+    values = [0, -1, 1, 63, -64, 64, 2 ** 31, -2 ** 31, 2 ** 53 + 1, 2 ** 63 - 1, -2 ** 63]
+    assert [dump_varint(v) for v in values] == [zigzag(v) for v in values]
+    record = ODBRecord('d', '#9:12', 1, b'V@')
+    params = {
+        'name': '123', 'age': 7, 'big': 2 ** 40, 'ratio': 0.25, 'ok': True,
+        'none': None, 'tags': ['x', 1], 'nested': {'k': [1.5]},
+        'at': datetime.datetime(1970, 1, 2, tzinfo=datetime.timezone.utc),
+        'day': datetime.date(1970, 1, 3), 'blob': b'abc',
+        'price': decimal.Decimal('-12.34'), 'friend': record,
+    }
+    assert dump_network({'params': params}) == b''.join([
+        string(''), zigzag(1), string('params'), bytes([12]), zigzag(len(params)),
+        string('name'), bytes([7]), string('123'),
+        string('age'), bytes([1]), zigzag(7),
+        string('big'), bytes([3]), zigzag(2 ** 40),
+        string('ratio'), bytes([5]), struct.pack('>d', 0.25),
+        string('ok'), bytes([0, 1]),
+        string('none'), b'\xff',
+        string('tags'), bytes([10]), zigzag(2), bytes([7]), string('x'), bytes([1]), zigzag(1),
+        string('nested'), bytes([12]), zigzag(1), string('k'),
+        bytes([10]), zigzag(1), bytes([5]), struct.pack('>d', 1.5),
+        string('at'), bytes([6]), zigzag(86400000),
+        string('day'), bytes([19]), zigzag(2),
+        string('blob'), bytes([8]), zigzag(3), b'abc',
+        string('price'), bytes([21]), struct.pack('>ii', 2, 2) + (-1234).to_bytes(2, 'big', signed=True),
+        string('friend'), bytes([13]), zigzag(9), zigzag(12),
+    ])
@@ -0,0 +1,96 @@
+"""
+test_csv
+"""
+import datetime
+import decimal
+
+from aio_pyorient.odb_types import ODBRecord, PROPS_SPECS
+from aio_pyorient.schema.prop_types import String
+from aio_pyorient.serializer import dump_value, serialize
+
+
+def test_csv_record():
+    record = (
+        'Person@name:"Ada \\"the\\" Countess, key:",age:36,big:9007199254740993l,'
+        'height:1.75f,ratio:0.5d,price:12.34c,small:7b,short:300s,ok:true,no:false,'
+        'empty:,born:86400001t,day:172800000a,friend:#9:12,'
+        'friends:[#9:1,#9:2],tags:<"a","b">,scores:[1,2,3],'
+        'address:(Address@city:"Rome",zip:"00100"),'
+        'meta:{"a":1,"b":[(n:1),(n:2)],"c":{"d":"x"}},'
+        'raw:_YWJj_,in_E:%AQAAAAEACwAAAAAAAAAD;,nested:[[1,2],[]],path:"C:\\\\temp"'
+    )
+    assert serialize(record) == {
+        '@class': 'Person',
+        'name': 'Ada "the" Countess, key:',
+        'age': 36,
+        'big': 9007199254740993,
+        'height': 1.75,
+        'ratio': 0.5,
+        'price': decimal.Decimal('12.34'),
+        'small': 7,
+        'short': 300,
+        'ok': True,
+        'no': False,
+        'empty': None,
+        'born': datetime.datetime(1970, 1, 2, 0, 0, 0, 1000, tzinfo=datetime.timezone.utc),
+        'day': datetime.date(1970, 1, 3),
+        'friend': '#9:12',
+        'friends': ['#9:1', '#9:2'],
+        'tags': {'a', 'b'},
+        'scores': [1, 2, 3],
+        'address': {'@class': 'Address', 'city': 'Rome', 'zip': '00100'},
+        'meta': {'a': 1, 'b': [{'n': 1}, {'n': 2}], 'c': {'d': 'x'}},
+        'raw': b'abc',
+        'in_E': b'\x01\x00\x00\x00\x01\x00\x0b\x00\x00\x00\x00\x00\x00\x00\x03',
+        'nested': [[1, 2], []],
+        'path': 'C:\\temp',
+    }
+
+
+def test_csv_specs():
+    record = 'name:"name",type:7,globalId:0,mandatory:true,min:,customFields:'
+    assert serialize(record, PROPS_SPECS) == {
+        'name': 'name', 'type': String, 'globalId': 0,
+        'mandatory': True, 'min': None, 'customFields': None
+    }
+
+
+def test_lazy_record():
+    record = ODBRecord('d', '#9:1', 1, memoryview(b'V@name:"x,y:",tags:["a"],e:(a:1),n:'))
+    assert record.class_name == 'V'
+    assert record['name'] == 'x,y:'
+    assert record['name'] is record['name']
+    assert record.get('tags') == ['a']
+    assert record.get('missing', 0) == 0
+    assert list(record.keys()) == ['name', 'tags', 'e', 'n']
+    assert record.to_dict() == {
+        '@class': 'V', 'name': 'x,y:', 'tags': ['a'], 'e': {'a': 1}, 'n': None
+    }
+    assert not hasattr(record, '__dict__')
+
+
+def test_dump_value():
+    params = {
+        'name': 'a"b\\c', 'age': 7, 'big': 2 ** 40, 'ratio': 0.5, 'ok': True,
+        'none': None, 'tags': ['x', 1], 'nested': {'k': [1.5]},
+        'at': datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+        'day': datetime.date(2020, 1, 2), 'blob': b'\x00\x01'
+    }
+    assert serialize(f'params:{dump_value(params)}') == {'params': params}
+    assert dump_value(2 ** 40) == '1099511627776l'
+
+
+def test_linked_records():
+    prefetched = {}
+    record = ODBRecord(
+        'd', '#9:1', 1, b'V@name:"a",best:#9:2,out_:[#10:1,#10:7],age:3',
+        prefetched=prefetched
+    )
+    prefetched['#9:2'] = ODBRecord('d', '#9:2', 1, b'V@name:"b"', prefetched=prefetched)
+    prefetched['#10:1'] = ODBRecord('d', '#10:1', 1, b'E@in:#9:2', prefetched=prefetched)
+    assert record.linked('best')['name'] == 'b'
+    edge, missing = record.linked('out_')
+    assert edge.linked('in') is prefetched['#9:2']
+    assert missing == '#10:7'
+    assert record.linked('age') == 3
+    assert record['best'] == '#9:2'
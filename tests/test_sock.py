@@ -2,7 +2,9 @@
 import asyncio
 from pprint import pprint
 
+from aio_pyorient.client import ODBClient
 from aio_pyorient.sock import ODBSocket
+from tests.conftest import TEST_DB, TEST_PASSWORD, TEST_USER
 
 
 async def test_connect(loop):
@@ -11,3 +13,14 @@ async def test_connect(loop):
     await asyncio.sleep(1)
     pprint(vars(sock))
     assert sock.connected is True
+
+async def test_multiplexed_requests(loop):
+    async with ODBClient(multiplex=True, loop=loop) as client:
+        await client.open_db(TEST_DB, TEST_USER, TEST_PASSWORD)
+        sizes = await asyncio.gather(
+            *(client.db_size() for _ in range(20)),
+            loop=loop
+        )
+        assert client._sock.multiplex is True
+        assert client._sock.in_flight == 0
+        assert len(set(sizes)) == 1